@@ -0,0 +1,260 @@
+"""
+End to end benchmark of the fact-check pipeline against local fixtures.
+
+    python -m benchmarks --repeat 3 --save-baseline benchmarks/baseline.json
+    python -m benchmarks --repeat 3 --baseline benchmarks/baseline.json
+
+Search results, article pages and OpenAI responses are served by a local stub server,
+so runs need no API keys or network access and are comparable between changes.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from rich.console import Console
+from rich.table import Table
+from benchmarks.stub_server import StubServer, load_scenario
+from factuality.runner.events import ClaimFinished, ClaimsExtracted, ConclusionReady, SearchDone
+from factuality.runner.factuality import Factuality
+from factuality.search import extraction
+from factuality.utils import logging
+from factuality.utils.defaults import Defaults
+from factuality.utils.options import Options
+
+# imported by the pipeline on first use, loaded before the clock starts so the first
+# statement doesn't pay for them (startup is measured by benchmarks.startup)
+PIPELINE_MODULES = ("openai", "httpx", "lxml.etree", "tiktoken", "pytablewriter")
+COUNTERS = ("llm_calls", "prompt_tokens", "completion_tokens", "search_calls", "downloads", "bytes_fetched")
+
+
+def percentile(values: list[float], share: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+async def run_statements(factuality: Factuality, statements: list[str], stages: dict[str, list[float]]) -> dict:
+    """
+    Check the statements one after another and record the duration of every stage from
+    the events of the run.
+    """
+    scores = {}
+    for statement in statements:
+        started = time.perf_counter()
+        extracted = started
+        last_finished = started
+        async for event in factuality.check_stream(statement):
+            now = time.perf_counter()
+            if isinstance(event, ClaimsExtracted):
+                extracted = last_finished = now
+                stages["extract"].append(now - started)
+            elif isinstance(event, SearchDone):
+                stages["search"].append(now - extracted)
+            elif isinstance(event, ClaimFinished):
+                last_finished = now
+                stages["claim"].append(now - extracted)
+            elif isinstance(event, ConclusionReady):
+                stages["conclusion"].append(now - last_finished)
+                stages["statement"].append(now - started)
+                scores[statement] = event.conclusion.score
+    return scores
+
+
+def run(args, overrides: dict) -> dict:
+    scenario = load_scenario(args.scenario)
+    for module in PIPELINE_MODULES:
+        importlib.import_module(module)
+    statements = [statement["statement"] for statement in scenario["statements"]]
+    # pages are parsed like in the CLI, the runner only picks the engine
+    extraction.configure(
+        overrides.get("search_extraction_engine", Defaults.SEARCH_EXTRACTION_ENGINE.value), args.extraction_workers
+    )
+    server = StubServer(scenario, args.llm_latency, args.search_latency, args.download_latency).start()
+    os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+    try:
+        wall_times = []
+        counters = []
+        stages: dict[str, list[float]] = defaultdict(list)
+        scores = {}
+        for _ in range(args.repeat):
+            options = Options(
+                None,
+                "benchmark",
+                bing_search_v7_subscription_key="benchmark",
+                bing_search_v7_endpoint=server.url,
+                search_engine="bing",
+                **{"cache_dir": "", **overrides},
+            )
+            server.reset()
+            # a new runner per repeat so in-memory caches don't carry over
+            factuality = Factuality(options)
+            started = time.perf_counter()
+            scores = asyncio.run(run_statements(factuality, statements, stages))
+            wall_times.append(time.perf_counter() - started)
+            counters.append(server.snapshot())
+    finally:
+        server.stop()
+
+    return {
+        "scenario": os.path.basename(args.scenario) if args.scenario else "scenario.json",
+        "repeat": args.repeat,
+        "settings": {
+            "llm_latency": args.llm_latency,
+            "search_latency": args.search_latency,
+            "download_latency": args.download_latency,
+            "extraction_workers": args.extraction_workers,
+            **overrides,
+        },
+        "wall_time": {
+            "median": statistics.median(wall_times),
+            "min": min(wall_times),
+            "max": max(wall_times),
+        },
+        "counters": {
+            name: statistics.mean(counter.get(name, 0) for counter in counters) for name in COUNTERS
+        },
+        "stages": {
+            stage: {
+                "count": len(durations),
+                "p50": percentile(durations, 0.5),
+                "p90": percentile(durations, 0.9),
+                "p99": percentile(durations, 0.99),
+                "max": max(durations),
+            }
+            for stage, durations in stages.items()
+        },
+        "scores": scores,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Regressions of the report against the baseline: slower wall time or stage p50 beyond
+    the tolerance, more LLM calls, tokens, downloads or bytes, or different scores.
+    """
+    regressions = []
+    if report["wall_time"]["median"] > baseline["wall_time"]["median"] * (1 + tolerance):
+        regressions.append(
+            f"wall time {baseline['wall_time']['median']:.3f}s -> {report['wall_time']['median']:.3f}s"
+        )
+    for stage, values in report["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before is not None and values["p50"] > before["p50"] * (1 + tolerance):
+            regressions.append(f"{stage} p50 {before['p50']:.3f}s -> {values['p50']:.3f}s")
+    for name, value in report["counters"].items():
+        before = baseline["counters"].get(name)
+        if before is not None and value > before:
+            regressions.append(f"{name} {before:g} -> {value:g}")
+    if report["scores"] != baseline["scores"]:
+        regressions.append("conclusion scores changed")
+    return regressions
+
+
+def render(console: Console, report: dict, baseline: dict | None) -> None:
+    def change(value: float, before: float | None) -> str:
+        if before is None:
+            return ""
+        if before == 0:
+            return "" if value == 0 else "new"
+        return f"{(value - before) / before:+.1%}"
+
+    summary = Table(title=f"Benchmark {report['scenario']} ({report['repeat']} runs)")
+    summary.add_column("Metric")
+    summary.add_column("Value", justify="right")
+    summary.add_column("vs baseline", justify="right")
+    summary.add_row(
+        "wall time (median)",
+        f"{report['wall_time']['median']:.3f}s",
+        change(report["wall_time"]["median"], baseline["wall_time"]["median"] if baseline else None),
+    )
+    for name, value in report["counters"].items():
+        summary.add_row(name, f"{value:g}", change(value, baseline["counters"].get(name) if baseline else None))
+    console.print(summary)
+
+    stages = Table(title="Stage latency")
+    for column in ("Stage", "Count", "p50", "p90", "p99", "max", "p50 vs baseline"):
+        stages.add_column(column, justify="left" if column == "Stage" else "right")
+    for stage, values in report["stages"].items():
+        before = baseline["stages"].get(stage) if baseline else None
+        stages.add_row(
+            stage,
+            str(values["count"]),
+            *[f"{values[key]:.3f}s" for key in ("p50", "p90", "p99", "max")],
+            change(values["p50"], before["p50"] if before else None),
+        )
+    console.print(stages)
+
+
+def parse_override(value: str) -> tuple[str, str]:
+    name, separator, setting = value.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE, got {value}")
+    return name.strip().lower().replace("-", "_"), setting
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fact-check pipeline against local fixtures.")
+    parser.add_argument("--scenario", help="Scenario file with statements, claims and search results. Default is the bundled scenario.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs over all statements. Default is 3.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds every stub OpenAI response takes. Default is 0.05.")
+    parser.add_argument("--search-latency", type=float, default=0.02, help="Seconds every stub search response takes. Default is 0.02.")
+    parser.add_argument("--download-latency", type=float, default=0.02, help="Seconds every stub article download takes. Default is 0.02.")
+    parser.add_argument(
+        "--extraction-workers",
+        type=int,
+        default=Defaults.SEARCH_EXTRACTION_WORKERS.value,
+        help="Processes parsing downloaded pages, 0 parses them in the downloading threads. Default is 2.",
+    )
+    parser.add_argument(
+        "--set",
+        type=parse_override,
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Override an option of the run, e.g. --set search_extract_chunk_tokens=0. Can be repeated.",
+    )
+    parser.add_argument("--output", help="Write the report as json to this path.")
+    parser.add_argument("--baseline", help="Compare against this saved report and exit with 1 on regressions.")
+    parser.add_argument("--save-baseline", help="Save the report as baseline to this path.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative slowdown of wall time or stage p50 that counts as regression. Default is 0.1.",
+    )
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the pipeline. Default is WARNING.")
+    args = parser.parse_args()
+
+    logging.setup_structlog()
+    logging.change_log_level(args.log_level)
+    report = run(args, dict(args.set))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+    console = Console()
+    render(console, report, baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=2)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            console.print(f"[red]Regression: {regression}[/red]")
+        if len(regressions) > 0:
+            sys.exit(1)
+        console.print("[green]No regressions against the baseline.[/green]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Startup time of the CLI, from the `python -X importtime` output of `import factuality.__main__`.
+
+    python -m benchmarks.startup --repeat 5 --save-baseline benchmarks/startup.json
+    python -m benchmarks.startup --repeat 5 --baseline benchmarks/startup.json
+
+Every run is a fresh interpreter, so nothing is served from modules imported before. Besides
+the import time it checks that the heavy optional modules (search engine clients, renderers,
+the gist integration, the OpenAI client) are not imported before a run selects them.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from rich.console import Console
+from rich.table import Table
+
+MODULE = "factuality.__main__"
+# loaded only when a run needs them, importing one of them at startup is a regression
+LAZY_MODULES = (
+    "openai",
+    "httpx",
+    "requests",
+    "newspaper",
+    "nltk",
+    "lxml",
+    "tiktoken",
+    "pytablewriter",
+    "rich.markdown",
+    "factuality.api.gist",
+    "factuality.runner.statements",
+    "factuality.search.bing.bing_search",
+    "factuality.search.google.google_search",
+    "factuality.search.tavily.tavily_search",
+)
+
+
+def import_times(module: str) -> dict[str, int]:
+    """
+    Cumulative import time in microseconds of every module imported by `import module`
+    in a new interpreter.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+    times = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def run(args) -> dict:
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    totals = [run[args.module] / 1e6 for run in runs]
+    modules = {name for run in runs for name in run}
+    slowest = sorted(
+        ((name, statistics.median(run.get(name, 0) for run in runs) / 1e6) for name in modules if name != args.module),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    # top level packages only, their cumulative time includes the submodules
+    packages = [(name, seconds) for name, seconds in slowest if "." not in name or name.startswith("factuality.")]
+    return {
+        "module": args.module,
+        "repeat": args.repeat,
+        "import_time": {
+            "median": statistics.median(totals),
+            "min": min(totals),
+            "max": max(totals),
+        },
+        "modules": len(modules),
+        "slowest": dict(packages[: args.top]),
+        "eager": sorted(name for name in LAZY_MODULES if name in modules),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Regressions of the report against the baseline: slower import beyond the tolerance,
+    or optional modules that are imported at startup again.
+    """
+    regressions = []
+    if report["import_time"]["median"] > baseline["import_time"]["median"] * (1 + tolerance):
+        regressions.append(
+            f"import time {baseline['import_time']['median']:.3f}s -> {report['import_time']['median']:.3f}s"
+        )
+    return regressions
+
+
+def render(console: Console, report: dict, baseline: dict | None) -> None:
+    table = Table(title=f"Startup of {report['module']} ({report['repeat']} runs)")
+    table.add_column("Module")
+    table.add_column("Cumulative", justify="right")
+    table.add_row("total (median)", f"{report['import_time']['median']:.3f}s")
+    if baseline is not None:
+        before = baseline["import_time"]["median"]
+        table.add_row("total vs baseline", f"{(report['import_time']['median'] - before) / before:+.1%}")
+    for name, seconds in report["slowest"].items():
+        table.add_row(name, f"{seconds:.3f}s")
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the CLI.")
+    parser.add_argument("--module", default=MODULE, help=f"Module to import. Default is {MODULE}.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters to measure. Default is 5.")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest packages to report. Default is 15.")
+    parser.add_argument("--output", help="Write the report as json to this path.")
+    parser.add_argument("--baseline", help="Compare against this saved report and exit with 1 on regressions.")
+    parser.add_argument("--save-baseline", help="Save the report as baseline to this path.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative slowdown of the import time that counts as regression. Default is 0.2.",
+    )
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+    console = Console()
+    render(console, report, baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=2)
+
+    regressions = [f"{name} is imported at startup" for name in report["eager"]]
+    if baseline is not None:
+        regressions.extend(compare(report, baseline, args.tolerance))
+    for regression in regressions:
+        console.print(f"[red]Regression: {regression}[/red]")
+    if len(regressions) > 0:
+        sys.exit(1)
+    if baseline is not None:
+        console.print("[green]No regressions against the baseline.[/green]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from factuality.fact_check.ranking import tokenize
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+CLAIM_PATTERN = re.compile(r"<claim>(.*?)</claim>", re.DOTALL)
+SOURCE_PATTERN = re.compile(r"<source(?: index=\"(\d+)\")?>(.*?)</source>", re.DOTALL)
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]?")
+PARAGRAPH_PATTERN = re.compile(r"<p>(.*?)</p>", re.DOTALL)
+
+# share of the claim terms a source needs to contain to verify it
+VERIFY_OVERLAP = 0.6
+
+
+class StubServer:
+    """
+    Local stand-in for the OpenAI chat completions API, the Bing search API and the article
+    sites, answering from the fixtures after a configurable latency. Every request is counted
+    so a run can be measured without any network access or API keys.
+    """
+
+    def __init__(
+        self,
+        scenario: dict,
+        llm_latency: float = 0.0,
+        search_latency: float = 0.0,
+        download_latency: float = 0.0,
+    ):
+        self.scenario = scenario
+        self.latency = {"llm": llm_latency, "search": search_latency, "download": download_latency}
+        self.claims = {statement["statement"]: statement["claims"] for statement in scenario["statements"]}
+        self.articles = {}
+        articles_dir = os.path.join(FIXTURES, "articles")
+        for name in sorted(os.listdir(articles_dir)):
+            with open(os.path.join(articles_dir, name), "rb") as file:
+                self.articles[os.path.splitext(name)[0]] = file.read()
+        self._lock = threading.Lock()
+        self.reset()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = defaultdict(int)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+    def count(self, **values: int) -> None:
+        with self._lock:
+            for name, value in values.items():
+                self.counters[name] += value
+
+    def search(self, query: str) -> dict:
+        names = self.scenario["search"].get(query)
+        if names is None:
+            # unknown queries get the articles sharing the most terms with them
+            terms = set(tokenize(query))
+            names = sorted(
+                self.articles,
+                key=lambda name: -len(terms & set(tokenize(self.articles[name].decode("utf-8")))),
+            )[:3]
+        return {
+            "webPages": {
+                "value": [
+                    {
+                        "url": f"{self.url}/articles/{name}",
+                        "name": name.replace("-", " ").title(),
+                        "snippet": self.snippet(name),
+                    }
+                    for name in names
+                ]
+            }
+        }
+
+    def snippet(self, name: str) -> str:
+        """
+        Start of the first paragraph of the article, like the snippets of the search engines.
+        """
+        paragraph = PARAGRAPH_PATTERN.search(self.articles[name].decode("utf-8"))
+        text = paragraph.group(1) if paragraph else ""
+        return text if len(text) <= 160 else text[:160].rsplit(" ", 1)[0] + " ..."
+
+    def complete(self, request: dict) -> dict:
+        schema = request["response_format"]["json_schema"]["name"]
+        user_content = request["messages"][-1]["content"]
+        if schema == "ClaimsArray":
+            payload = {"claims": self.extract(user_content)}
+        elif schema == "Result":
+            claim = CLAIM_PATTERN.search(user_content).group(1)
+            payload = verdict(claim, SOURCE_PATTERN.search(user_content).group(2))
+        elif schema == "BatchResult":
+            claim = CLAIM_PATTERN.search(user_content).group(1)
+            payload = {
+                "results": [
+                    {"index": int(index), **verdict(claim, source)}
+                    for index, source in SOURCE_PATTERN.findall(user_content)
+                ]
+            }
+        elif schema == "Conclusion":
+            verified = user_content.lower().count("verified")
+            checked = verified + user_content.lower().count("rejected") + user_content.lower().count("inconclusive")
+            payload = {
+                "score": round(100 * verified / checked) if checked > 0 else 50,
+                "description": f"{verified} of {checked} checks verified the statement.",
+            }
+        else:
+            raise ValueError(f"No stub response for schema {schema}")
+
+        content = json.dumps(payload)
+        prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+        completion_tokens = len(content) // 4
+        self.count(
+            llm_calls=1,
+            **{f"llm_calls_{schema}": 1},
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content, "refusal": None},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def extract(self, statement: str) -> list[dict]:
+        claims = self.claims.get(statement)
+        if claims is not None:
+            return claims
+        return [
+            {"claim": sentence.strip(), "reference": None, "verification_query": sentence.strip()}
+            for sentence in SENTENCE_PATTERN.findall(statement)
+            if sentence.strip()
+        ]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are separate writes, with Nagle every response on a kept
+            # alive connection would wait for the delayed ACK of the client
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                path = urlsplit(self.path)
+                if path.path.endswith("/v7.0/search"):
+                    time.sleep(stub.latency["search"])
+                    query = parse_qs(path.query).get("q", [""])[0]
+                    stub.count(search_calls=1)
+                    self.reply(200, "application/json", json.dumps(stub.search(query)).encode("utf-8"))
+                elif path.path.startswith("/articles/"):
+                    time.sleep(stub.latency["download"])
+                    body = stub.articles.get(path.path.rsplit("/", 1)[-1])
+                    if body is None:
+                        self.reply(404, "text/plain", b"not found")
+                        return
+                    stub.count(downloads=1, bytes_fetched=len(body))
+                    self.reply(200, "text/html; charset=utf-8", body)
+                else:
+                    self.reply(404, "text/plain", b"not found")
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if not self.path.endswith("/chat/completions"):
+                    self.reply(404, "application/json", b'{"error": {"message": "not found"}}')
+                    return
+                time.sleep(stub.latency["llm"])
+                self.reply(200, "application/json", json.dumps(stub.complete(request)).encode("utf-8"))
+
+            def reply(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def verdict(claim: str, source: str) -> dict:
+    """
+    Verified with the best matching sentence as quote when the source contains most of the
+    claim terms, inconclusive otherwise.
+    """
+    terms = set(tokenize(claim))
+    if len(terms) == 0:
+        return {"result": "inconclusive", "source_quote": None}
+    if len(terms & set(tokenize(source))) / len(terms) < VERIFY_OVERLAP:
+        return {"result": "inconclusive", "source_quote": None}
+    quote = max(SENTENCE_PATTERN.findall(source), key=lambda sentence: len(terms & set(tokenize(sentence))))
+    return {"result": "verified", "source_quote": quote.strip()}
+
+
+def load_scenario(path: str | None = None) -> dict:
+    with open(path or os.path.join(FIXTURES, "scenario.json"), "r") as file:
+        return json.load(file)
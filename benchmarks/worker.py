@@ -0,0 +1,154 @@
+"""
+Run tweet queue workers against a local Postgres, with the stub server standing in for OpenAI,
+search and the article sites.
+
+    python -m benchmarks.worker --database-url postgresql://localhost/factuality_test --workers 3
+    python -m benchmarks.worker --database-url postgresql://localhost/factuality_test --kill-one
+
+The `twitter_tweets` table is created if missing and filled with the statements of the scenario,
+a table that already has rows is only used with `--reset`, which empties it. Every worker is a
+process of its own, as on separate nodes. The run fails unless every row ends up `done` and,
+without `--kill-one`, every statement was checked exactly once. `--kill-one` kills a worker in
+the middle of its first batch to show its rows are claimed again once their lease expires.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from psycopg2.extras import execute_batch
+from rich.console import Console
+from rich.table import Table
+from benchmarks.stub_server import StubServer, load_scenario
+from factuality.api import db
+
+
+def seed(statements: list[str], copies: int) -> int:
+    rows = [
+        (f"{copy}-{index}", "benchmark", statement, index, "fact")
+        for copy in range(copies)
+        for index, statement in enumerate(statements)
+    ]
+    with db.connection() as conn, conn.cursor() as cur:
+        execute_batch(
+            cur,
+            "INSERT INTO twitter_tweets (id, user_screen_name, full_text, created_at_unix, status) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+    return len(rows)
+
+
+def statuses() -> dict[str, int]:
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT status, count(*) FROM twitter_tweets GROUP BY status")
+        return dict(cur.fetchall())
+
+
+def start_worker(server: StubServer, args) -> subprocess.Popen:
+    environment = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{server.url}/v1",
+        "BING_SEARCH_V7_SUBSCRIPTION_KEY": "benchmark",
+        "BING_SEARCH_V7_ENDPOINT": server.url,
+        "SEARCH_ENGINE": "bing",
+        "CACHE_DIR": "",
+        "LOG_LEVEL": args.log_level,
+    }
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "factuality.api.worker",
+            "--batch-size",
+            str(args.batch_size),
+            "--concurrency",
+            str(args.concurrency),
+            "--poll-interval",
+            "0.2",
+            "--lease-timeout",
+            str(args.lease_timeout),
+        ],
+        env=environment,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tweet queue workers against a local Postgres.")
+    parser.add_argument("--database-url", required=True, help="Connection string of the local test database.")
+    parser.add_argument("--scenario", help="Scenario file with statements, claims and search results. Default is the bundled scenario.")
+    parser.add_argument("--workers", type=int, default=3, help="Number of worker processes. Default is 3.")
+    parser.add_argument("--copies", type=int, default=4, help="Rows queued per statement of the scenario. Default is 4.")
+    parser.add_argument("--batch-size", type=int, default=2, help="Tweets claimed at once by a worker. Default is 2.")
+    parser.add_argument("--concurrency", type=int, default=2, help="Tweets checked at the same time by a worker. Default is 2.")
+    parser.add_argument("--lease-timeout", type=float, default=5, help="Lease of claimed rows in seconds. Default is 5.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds every stub OpenAI response takes. Default is 0.2.")
+    parser.add_argument("--kill-one", action="store_true", help="Kill a worker during its first batch.")
+    parser.add_argument("--reset", action="store_true", help="Empty the twitter_tweets table of the database first.")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the queue to drain. Default is 120.")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the workers. Default is WARNING.")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    console = Console()
+    db.create_table()
+    db.ensure_lease_column()
+    existing = sum(statuses().values())
+    if existing > 0 and not args.reset:
+        console.print(f"[red]twitter_tweets already has {existing} rows, pass --reset to empty it.[/red]")
+        sys.exit(1)
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("TRUNCATE twitter_tweets")
+
+    scenario = load_scenario(args.scenario)
+    statements = [statement["statement"] for statement in scenario["statements"]]
+    queued = seed(statements, args.copies)
+    server = StubServer(scenario, args.llm_latency).start()
+    workers = [start_worker(server, args) for _ in range(args.workers)]
+    started = time.perf_counter()
+    killed = False
+    try:
+        while time.perf_counter() - started < args.timeout:
+            counts = statuses()
+            if args.kill_one and not killed and counts.get("processing", 0) > 0:
+                workers[0].kill()
+                killed = True
+                console.print("Killed a worker in the middle of its batch")
+            if counts.get("fact", 0) == 0 and counts.get("processing", 0) == 0:
+                break
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - started
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        server.stop()
+
+    counts = statuses()
+    checks = server.snapshot().get("llm_calls_ClaimsArray", 0)
+    table = Table(title=f"{args.workers} workers, {queued} queued tweets")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    table.add_row("wall time", f"{elapsed:.3f}s")
+    for status, count in sorted(counts.items()):
+        table.add_row(f"rows {status}", str(count))
+    table.add_row("statements checked", str(checks))
+    console.print(table)
+
+    failures = []
+    if counts.get("done", 0) != queued:
+        failures.append(f"{queued - counts.get('done', 0)} rows are not done")
+    if not args.kill_one and checks != queued:
+        failures.append(f"{checks} checks for {queued} rows")
+    for failure in failures:
+        console.print(f"[red]Failure: {failure}[/red]")
+    if len(failures) > 0:
+        sys.exit(1)
+    console.print("[green]Every row was checked and written back.[/green]")
+
+
+if __name__ == "__main__":
+    main()
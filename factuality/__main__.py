@@ -1,22 +1,31 @@
+import asyncio
 import datetime
 import json
 import os
 import re
+import sys
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from factuality.api.gist import GistManager
 from factuality.utils import logging
 from factuality.utils.defaults import Defaults
+from factuality.utils.metrics import metrics
 from factuality.utils.options import Options
+from factuality.runner.events import ClaimFinished, ClaimsExtracted, ConclusionReady, Event
 from factuality.runner.factuality import Factuality
-from rich.console import Console
-from rich.markdown import Markdown
-from collections import defaultdict
+from factuality.search import extraction
+
+# renderers, the batch mode and the gist integration are imported where they are used,
+# every invocation would pay for them otherwise
+if TYPE_CHECKING:
+    from rich.console import Console
 
 
 load_dotenv()
 import argparse
 
-def strtobool(val: str | bool) -> bool:
+def strtobool(val: str | bool | None) -> bool:
+    if val is None:
+        return False
     if isinstance(val, bool):
         return val
     return val.lower() in ("true", "1", "t")
@@ -26,12 +35,53 @@ def main():
     parser = argparse.ArgumentParser(
         description="Factuality CLI: Fact-check any statement using ChatGPT with integrated search options (Bing or Google). Generates a markdown table summarizing the claim, verification result, source references, and direct quotes from these sources. Designed for quick verification and summarization to assist in distinguishing factual information from misinformation."
     )
-    parser.add_argument(
+    statement_source = parser.add_mutually_exclusive_group(required=True)
+    statement_source.add_argument(
         "--statement",
         "-s",
         type=str,
         help="Statement to fact-check can be text or path to a text file",
-        required=True,
+    )
+    statement_source.add_argument(
+        "--input",
+        "-i",
+        type=str,
+        help="Fact-check many statements from a JSONL or CSV file with id and statement per line, - reads stdin. Results are written as JSON lines to --results.",
+    )
+    parser.add_argument(
+        "--input-format",
+        type=str,
+        default="auto",
+        help="Format of --input. Default is auto (csv for .csv files, jsonl otherwise, detected from the first line on stdin). Supported formats: auto, jsonl, csv.",
+    )
+    parser.add_argument(
+        "--results",
+        type=str,
+        default="-",
+        help="JSONL file the results of --input are appended to as each statement finishes, ids already in it are skipped so an interrupted run can be resumed. Default is - (stdout).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.getenv("BATCH_WORKERS", Defaults.BATCH_WORKERS.value),
+        help="How many statements of --input are fact-checked at the same time. Default is 4.",
+    )
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="Check --input through the OpenAI Batch API, cheaper but finished within 24 hours. Results are written once every statement is done.",
+    )
+    parser.add_argument(
+        "--batch-dir",
+        type=str,
+        default=os.getenv("BATCH_DIR", Defaults.BATCH_DIR.value),
+        help="Directory requests, batch ids and outputs of --batch-api are kept in to resume an interrupted run. Default is .factuality_batch.",
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=os.getenv("BATCH_POLL_INTERVAL", Defaults.BATCH_POLL_INTERVAL.value),
+        help="Seconds between status checks of a submitted batch. Default is 60.",
     )
     parser.add_argument(
         "--id",
@@ -43,7 +93,7 @@ def main():
         "--output",
         "-o",
         type=str,
-        help="The output format for the fact-check results. Default is console. Supported formats: console, markdown, json.",
+        help="The output format for the fact-check results. Default is console. Supported formats: console, markdown, json, jsonl (events of the run as they happen).",
         default=os.getenv("OUTPUT_FORMAT", Defaults.OUTPUT_FORMAT.value),
     )
     parser.add_argument(
@@ -55,7 +105,7 @@ def main():
     parser.add_argument(
         "--search-engine",
         type=str,
-        help="The search engine to use for extracting articles. Default is Bing. Supported search engines: Bing, Google.",
+        help="The search engine to use for extracting articles. Default is Bing. Supported search engines: Bing, Google, Tavily. Several comma separated engines (e.g. bing,google) are combined according to --search-strategy.",
         default=os.getenv("SEARCH_ENGINE", Defaults.SEARCH_ENGINE.value),
     )
     parser.add_argument(
@@ -64,6 +114,18 @@ def main():
         help="Log level for the logger. Default is INFO. Supported log levels: DEBUG, INFO, WARNING, ERROR, CRITICAL.",
         default=os.getenv("LOG_LEVEL", Defaults.LOG_LEVEL.value),
     )
+    parser.add_argument(
+        "--log-format",
+        type=str,
+        help="Format of the log lines. Default is console. Supported formats: console, json (one JSON object per line).",
+        default=os.getenv("LOG_FORMAT", Defaults.LOG_FORMAT.value),
+    )
+    parser.add_argument(
+        "--metrics-path",
+        type=str,
+        help="Write stage durations, LLM calls and tokens of the run in the Prometheus text format to this file. Default is empty (disabled).",
+        default=os.getenv("METRICS_PATH", Defaults.METRICS_PATH.value),
+    )
     parser.add_argument(
         "--oai-api-key",
         required=False,
@@ -183,6 +245,310 @@ def main():
         ),
         help="Maximum Search Results",
     )
+    parser.add_argument(
+        "--claims-concurrency",
+        type=int,
+        default=os.getenv(
+            "CLAIMS_CONCURRENCY", Defaults.CLAIMS_CONCURRENCY.value
+        ),
+        help="How many claims are searched and fact-checked at the same time. Default is 4.",
+    )
+    parser.add_argument(
+        "--search-download-workers",
+        type=int,
+        default=os.getenv(
+            "SEARCH_DOWNLOAD_WORKERS", Defaults.SEARCH_DOWNLOAD_WORKERS.value
+        ),
+        help="How many articles are downloaded in parallel per claim. Default is 4.",
+    )
+    parser.add_argument(
+        "--search-download-timeout",
+        type=float,
+        default=os.getenv(
+            "SEARCH_DOWNLOAD_TIMEOUT", Defaults.SEARCH_DOWNLOAD_TIMEOUT.value
+        ),
+        help="Timeout in seconds for downloading a single article. Default is 7.",
+    )
+    parser.add_argument(
+        "--search-download-deadline",
+        type=float,
+        default=os.getenv(
+            "SEARCH_DOWNLOAD_DEADLINE", Defaults.SEARCH_DOWNLOAD_DEADLINE.value
+        ),
+        help="Total time in seconds for downloading all articles of a claim. Default is 20.",
+    )
+    parser.add_argument(
+        "--search-prefetch",
+        type=int,
+        default=os.getenv(
+            "SEARCH_PREFETCH", Defaults.SEARCH_PREFETCH.value
+        ),
+        help="How many articles are downloaded ahead of the one being fact-checked. Default is 1.",
+    )
+    parser.add_argument(
+        "--openai-max-in-flight",
+        type=int,
+        default=os.getenv(
+            "OPENAI_MAX_IN_FLIGHT", Defaults.OPENAI_MAX_IN_FLIGHT.value
+        ),
+        help="Maximum number of OpenAI requests running at the same time. Default is 8.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=os.getenv(
+            "CACHE_DIR", Defaults.CACHE_DIR.value
+        ),
+        help="Directory for the persistent LLM, search and article caches, empty disables them. Default is .factuality_cache.",
+    )
+    parser.add_argument(
+        "--llm-cache-ttl",
+        type=float,
+        default=os.getenv(
+            "LLM_CACHE_TTL", Defaults.LLM_CACHE_TTL.value
+        ),
+        help="Time to live in seconds of cached LLM responses. Default is 604800 (7 days).",
+    )
+    parser.add_argument(
+        "--llm-cache-max-entries",
+        type=int,
+        default=os.getenv(
+            "LLM_CACHE_MAX_ENTRIES", Defaults.LLM_CACHE_MAX_ENTRIES.value
+        ),
+        help="Maximum number of cached LLM responses. Default is 10000.",
+    )
+    parser.add_argument(
+        "--search-cache-ttl",
+        type=float,
+        default=os.getenv(
+            "SEARCH_CACHE_TTL", Defaults.SEARCH_CACHE_TTL.value
+        ),
+        help="Time to live in seconds of cached search engine responses. Default is 86400 (1 day).",
+    )
+    parser.add_argument(
+        "--search-cache-max-entries",
+        type=int,
+        default=os.getenv(
+            "SEARCH_CACHE_MAX_ENTRIES", Defaults.SEARCH_CACHE_MAX_ENTRIES.value
+        ),
+        help="Maximum number of search engine responses cached on disk. Default is 10000.",
+    )
+    parser.add_argument(
+        "--search-cache-memory-entries",
+        type=int,
+        default=os.getenv(
+            "SEARCH_CACHE_MEMORY_ENTRIES", Defaults.SEARCH_CACHE_MEMORY_ENTRIES.value
+        ),
+        help="Maximum number of search engine responses cached in memory. Default is 256.",
+    )
+    parser.add_argument(
+        "--article-store-ttl",
+        type=float,
+        default=os.getenv(
+            "ARTICLE_STORE_TTL", Defaults.ARTICLE_STORE_TTL.value
+        ),
+        help="Time in seconds a stored article is used without revalidating it. Default is 86400 (1 day).",
+    )
+    parser.add_argument(
+        "--article-store-max-bytes",
+        type=int,
+        default=os.getenv(
+            "ARTICLE_STORE_MAX_BYTES", Defaults.ARTICLE_STORE_MAX_BYTES.value
+        ),
+        help="Maximum compressed size in bytes of the article store. Default is 209715200 (200 MB).",
+    )
+    parser.add_argument(
+        "--max-chunks-per-source",
+        type=int,
+        default=os.getenv(
+            "MAX_CHUNKS_PER_SOURCE", Defaults.MAX_CHUNKS_PER_SOURCE.value
+        ),
+        help="Maximum number of the most relevant article chunks fact-checked per source, 0 checks all. Default is 3.",
+    )
+    parser.add_argument(
+        "--search-extract-chunk-tokens",
+        type=int,
+        default=os.getenv(
+            "SEARCH_EXTRACT_CHUNK_TOKENS", Defaults.SEARCH_EXTRACT_CHUNK_TOKENS.value
+        ),
+        help="Article chunk size in tokens, split at sentence and paragraph boundaries. 0 splits by characters using the article length and overlap options. Default is 1200.",
+    )
+    parser.add_argument(
+        "--search-extract-chunk-overlap-tokens",
+        type=int,
+        default=os.getenv(
+            "SEARCH_EXTRACT_CHUNK_OVERLAP_TOKENS", Defaults.SEARCH_EXTRACT_CHUNK_OVERLAP_TOKENS.value
+        ),
+        help="Article chunk overlap in tokens. Default is 120.",
+    )
+    parser.add_argument(
+        "--factcheck-batch-tokens",
+        type=int,
+        default=os.getenv(
+            "FACTCHECK_BATCH_TOKENS", Defaults.FACTCHECK_BATCH_TOKENS.value
+        ),
+        help="Token budget for fact-checking several chunks of a source in one request, 0 sends one request per chunk. Chunks of a request that verify and reject the claim make the source inconclusive. Default is 0.",
+    )
+    parser.add_argument(
+        "--claim-index-ttl",
+        type=float,
+        default=os.getenv(
+            "CLAIM_INDEX_TTL", Defaults.CLAIM_INDEX_TTL.value
+        ),
+        help="Seconds a checked claim is reused for restated claims of later statements, 0 disables reuse. Default is 604800.",
+    )
+    parser.add_argument(
+        "--claim-index-similarity",
+        type=float,
+        default=os.getenv(
+            "CLAIM_INDEX_SIMILARITY", Defaults.CLAIM_INDEX_SIMILARITY.value
+        ),
+        help="Minimum Jaccard similarity of the claim terms for a near duplicate claim to reuse the checks, 1 only reuses checks of the identical claim. Near duplicates must have the same negations, numbers, pronouns, comparisons and names. Default is 1.",
+    )
+    parser.add_argument(
+        "--openai-requests-per-minute",
+        type=float,
+        default=os.getenv(
+            "OPENAI_REQUESTS_PER_MINUTE", Defaults.OPENAI_REQUESTS_PER_MINUTE.value
+        ),
+        help="Maximum OpenAI requests per minute, calls wait for their turn instead of running into 429s. 0 is unlimited. Default is 0.",
+    )
+    parser.add_argument(
+        "--openai-tokens-per-minute",
+        type=float,
+        default=os.getenv(
+            "OPENAI_TOKENS_PER_MINUTE", Defaults.OPENAI_TOKENS_PER_MINUTE.value
+        ),
+        help="Maximum OpenAI tokens per minute, estimated from the prompt length before each call. 0 is unlimited. Default is 0.",
+    )
+    parser.add_argument(
+        "--search-requests-per-minute",
+        type=float,
+        default=os.getenv(
+            "SEARCH_REQUESTS_PER_MINUTE", Defaults.SEARCH_REQUESTS_PER_MINUTE.value
+        ),
+        help="Maximum requests per minute to each search engine. 0 is unlimited. Default is 0.",
+    )
+    parser.add_argument(
+        "--retry-max-attempts",
+        type=int,
+        default=os.getenv(
+            "RETRY_MAX_ATTEMPTS", Defaults.RETRY_MAX_ATTEMPTS.value
+        ),
+        help="Attempts of OpenAI and search calls failing with a rate limit, a server error or a timeout, with jittered exponential backoff honoring Retry-After. Default is 4.",
+    )
+    parser.add_argument(
+        "--circuit-breaker-threshold",
+        type=int,
+        default=os.getenv(
+            "CIRCUIT_BREAKER_THRESHOLD", Defaults.CIRCUIT_BREAKER_THRESHOLD.value
+        ),
+        help="Consecutive failures after which calls to a provider are refused for --circuit-breaker-reset seconds. 0 disables the breaker. Default is 5.",
+    )
+    parser.add_argument(
+        "--circuit-breaker-reset",
+        type=float,
+        default=os.getenv(
+            "CIRCUIT_BREAKER_RESET", Defaults.CIRCUIT_BREAKER_RESET.value
+        ),
+        help="Seconds an open circuit refuses calls before trying the provider again. Default is 30.",
+    )
+    parser.add_argument(
+        "--search-strategy",
+        type=str,
+        default=os.getenv(
+            "SEARCH_STRATEGY", Defaults.SEARCH_STRATEGY.value
+        ),
+        help="How several comma separated search engines are combined. Supported: fanout (query all at once and fuse the rankings with reciprocal rank fusion), fallback (query them in order until one answers). Default is fanout.",
+    )
+    parser.add_argument(
+        "--search-engine-deadline",
+        type=float,
+        default=os.getenv(
+            "SEARCH_ENGINE_DEADLINE", Defaults.SEARCH_ENGINE_DEADLINE.value
+        ),
+        help="Seconds to wait for a search engine when several are configured, slower engines are skipped (fanout) or fallen back from (fallback). Default is 5.",
+    )
+    parser.add_argument(
+        "--search-min-snippet-relevance",
+        type=float,
+        default=os.getenv(
+            "SEARCH_MIN_SNIPPET_RELEVANCE", Defaults.SEARCH_MIN_SNIPPET_RELEVANCE.value
+        ),
+        help="Minimum share of the claim terms the title and snippet of a search hit need to contain for the page to be downloaded, 0 downloads all hits. Default is 0.2.",
+    )
+    parser.add_argument(
+        "--search-skip-domains",
+        type=str,
+        default=os.getenv(
+            "SEARCH_SKIP_DOMAINS", Defaults.SEARCH_SKIP_DOMAINS.value
+        ),
+        help="Domains whose search hits are never downloaded, paywalled sites and social media pages that rarely lead to a verdict. Format ['domain1.com', 'domain2.com']. Default is a list of paywalled and social media sites.",
+    )
+    parser.add_argument(
+        "--search-use-engine-content",
+        type=str,
+        default=os.getenv(
+            "SEARCH_USE_ENGINE_CONTENT", Defaults.SEARCH_USE_ENGINE_CONTENT.value
+        ),
+        help="Use the page content returned by the search engine (Tavily) instead of downloading the page. Default is true.",
+    )
+    parser.add_argument(
+        "--search-extraction-engine",
+        type=str,
+        default=os.getenv(
+            "SEARCH_EXTRACTION_ENGINE", Defaults.SEARCH_EXTRACTION_ENGINE.value
+        ),
+        help="Engine extracting the main text of downloaded pages. Supported: lxml (lightweight streaming scorer, falls back to newspaper for pages it finds almost no text in), newspaper. Default is lxml.",
+    )
+    parser.add_argument(
+        "--search-extraction-workers",
+        type=int,
+        default=os.getenv(
+            "SEARCH_EXTRACTION_WORKERS", Defaults.SEARCH_EXTRACTION_WORKERS.value
+        ),
+        help="Processes parsing downloaded pages in parallel, 0 parses them in the downloading threads. Default is 2.",
+    )
+    parser.add_argument(
+        "--http-max-connections",
+        type=int,
+        default=os.getenv(
+            "HTTP_MAX_CONNECTIONS", Defaults.HTTP_MAX_CONNECTIONS.value
+        ),
+        help="Maximum number of connections of the HTTP client shared by the search engines and page downloads. Default is 100.",
+    )
+    parser.add_argument(
+        "--http-max-connections-per-host",
+        type=int,
+        default=os.getenv(
+            "HTTP_MAX_CONNECTIONS_PER_HOST", Defaults.HTTP_MAX_CONNECTIONS_PER_HOST.value
+        ),
+        help="Maximum number of requests to the same host at the same time. Default is 6.",
+    )
+    parser.add_argument(
+        "--http-timeout",
+        type=float,
+        default=os.getenv(
+            "HTTP_TIMEOUT", Defaults.HTTP_TIMEOUT.value
+        ),
+        help="Timeout in seconds for reading, writing and waiting for a connection of search engine requests, page downloads use --search-download-timeout. Default is 10.",
+    )
+    parser.add_argument(
+        "--http-connect-timeout",
+        type=float,
+        default=os.getenv(
+            "HTTP_CONNECT_TIMEOUT", Defaults.HTTP_CONNECT_TIMEOUT.value
+        ),
+        help="Timeout in seconds for opening a connection. Default is 5.",
+    )
+    parser.add_argument(
+        "--http-dns-cache-ttl",
+        type=float,
+        default=os.getenv(
+            "HTTP_DNS_CACHE_TTL", Defaults.HTTP_DNS_CACHE_TTL.value
+        ),
+        help="Seconds resolved host addresses are reused for new connections, 0 disables the DNS cache. Default is 300.",
+    )
 
     args = parser.parse_args()
 
@@ -210,23 +576,94 @@ def main():
         google_search_api_key=args.google_search_api_key,
         tavily_api_key=args.tavily_api_key,
         google_search_cx=args.google_search_cx,
+        claims_concurrency=args.claims_concurrency,
+        search_download_workers=args.search_download_workers,
+        search_download_timeout=args.search_download_timeout,
+        search_download_deadline=args.search_download_deadline,
+        search_prefetch=args.search_prefetch,
+        openai_max_in_flight=args.openai_max_in_flight,
+        cache_dir=args.cache_dir,
+        llm_cache_ttl=args.llm_cache_ttl,
+        llm_cache_max_entries=args.llm_cache_max_entries,
+        search_cache_ttl=args.search_cache_ttl,
+        search_cache_max_entries=args.search_cache_max_entries,
+        search_cache_memory_entries=args.search_cache_memory_entries,
+        article_store_ttl=args.article_store_ttl,
+        article_store_max_bytes=args.article_store_max_bytes,
+        max_chunks_per_source=args.max_chunks_per_source,
+        search_extract_chunk_tokens=args.search_extract_chunk_tokens,
+        search_extract_chunk_overlap_tokens=args.search_extract_chunk_overlap_tokens,
+        factcheck_batch_tokens=args.factcheck_batch_tokens,
+        claim_index_ttl=args.claim_index_ttl,
+        claim_index_similarity=args.claim_index_similarity,
+        openai_requests_per_minute=args.openai_requests_per_minute,
+        openai_tokens_per_minute=args.openai_tokens_per_minute,
+        search_requests_per_minute=args.search_requests_per_minute,
+        retry_max_attempts=args.retry_max_attempts,
+        circuit_breaker_threshold=args.circuit_breaker_threshold,
+        circuit_breaker_reset=args.circuit_breaker_reset,
+        search_strategy=args.search_strategy,
+        search_engine_deadline=args.search_engine_deadline,
+        search_min_snippet_relevance=args.search_min_snippet_relevance,
+        search_skip_domains=args.search_skip_domains,
+        search_use_engine_content=args.search_use_engine_content,
+        search_extraction_engine=args.search_extraction_engine,
+        http_max_connections=args.http_max_connections,
+        http_max_connections_per_host=args.http_max_connections_per_host,
+        http_timeout=args.http_timeout,
+        http_connect_timeout=args.http_connect_timeout,
+        http_dns_cache_ttl=args.http_dns_cache_ttl,
+        batch_dir=args.batch_dir,
+        batch_poll_interval=args.batch_poll_interval,
     )
-    if not options.tweet_id and options.output_format == "json":
+    if not options.tweet_id and options.output_format == "json" and not args.input:
         raise ValueError("Missing tweet ID parameter '--id'")
 
-    logging.setup_structlog()
+    logging.setup_structlog(args.log_format)
+    extraction.configure(options.search_extraction_engine, args.search_extraction_workers)
     if args.log_level:
         logging.change_log_level(args.log_level)
     else:
         logging.change_log_level(logging.INFO)
+    if args.input and args.batch_api:
+        check_input_batch(options, args)
+        if args.metrics_path:
+            metrics.write(args.metrics_path)
+        return
     factuality = Factuality(options)
-    conclusion, checked_claims, statement = factuality.check(args.statement)
+    if args.input:
+        check_input(factuality, args)
+        if args.metrics_path:
+            metrics.write(args.metrics_path)
+        return
+    statement = factuality.read_statement(args.statement)
+    console = None
+    if options.output_format == "console":
+        from rich.console import Console
+
+        console = Console()
+
+    async def consume_events() -> ConclusionReady:
+        async for event in factuality.check_stream(statement):
+            if options.output_format == "jsonl":
+                print(event.model_dump_json(by_alias=True), flush=True)
+            elif options.output_format == "console":
+                render_event(console, event)
+            if isinstance(event, ConclusionReady):
+                return event
+
+    conclusion_ready = asyncio.run(consume_events())
+    if args.metrics_path:
+        metrics.write(args.metrics_path)
+    conclusion, checked_claims = conclusion_ready.conclusion, conclusion_ready.claim_checks
     statement_part = re.sub(r'[^\x00-\x7F]+', '', statement[:20].replace(' ', '_'))
     current_time = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
     filename = f"{statement_part}_{current_time}"
 
     def do_gist(markdown_text: str, filename: str) -> str | None:
         try:
+            from factuality.api.gist import GistManager
+
             gist_manager = GistManager()
 
             response = gist_manager.create_gist(
@@ -256,19 +693,9 @@ def main():
         # if strtobool(os.getenv('GITHUB_GIST_ENABLED')):
         #     gist_url = do_gist(markdown_text, filename)
 
-        output_json = {
-            'id': options.tweet_id,
-            'factuality': {
-                "statement": statement,
-                "claims": [claim.model_dump(by_alias=True) for claim in checked_claims],
-                "conclusion": conclusion.model_dump(by_alias=True),
-            },
-            # 'gist_url': gist_url,
-        }
+        from factuality.result_output.json_output import output_json
 
-        output_json = transform_claims(output_json)
-
-        print( json.dumps( output_json ) )
+        print( json.dumps( output_json(options.tweet_id, statement, checked_claims, conclusion) ) )
     elif options.output_format == "console":
         markdown_text = factuality.convert_conclusions_to_markdown(
             checked_claims, statement, conclusion
@@ -277,44 +704,82 @@ def main():
         if strtobool(os.getenv('GITHUB_GIST_ENABLED')):
             gist_url = do_gist(markdown_text, filename)
 
-        console = Console()
+        from rich.markdown import Markdown
+
         console.print(Markdown(markdown_text))
         if strtobool(os.getenv('GITHUB_GIST_ENABLED')):
             console.print(gist_url)
         pass
 
 
-def transform_claims(data):
-    # Process claims into grouped structure
-    claim_map = defaultdict(lambda: {
-        "claim": None,
-        "reference": None,
-        "verification_query": None,
-        "evidence": []
-    })
-
-    for claim in data["factuality"]["claims"]:
-        key = (claim["claim"], claim["verification_query"])
-        entry = claim_map[key]
-        entry["claim"] = claim["claim"]
-        entry["reference"] = claim.get("reference")
-        entry["verification_query"] = claim["verification_query"]
-        entry["evidence"].append({
-            "result": claim["result"],
-            "source_reference": claim["source_reference"],
-            "source_quote": claim["source_quote"]
-        })
-
-    # Rebuild the output structure
-    output = {
-        "id": data["id"],
-        "factuality": {
-            "statement": data["factuality"]["statement"],
-            "claims": list(claim_map.values()),
-            "conclusion": data["factuality"]["conclusion"]
-        },
-    }
-    return output
+def check_input(factuality: Factuality, args) -> None:
+    """
+    Batch mode, one process and one set of clients and caches for all statements of the input.
+    """
+    from factuality.runner.statements import check_statements, completed_ids, jsonl_writer, read_statements
+
+    skip = completed_ids(args.results) if args.results != "-" else set()
+    output = sys.stdout if args.results == "-" else open(args.results, "a")
+    try:
+        asyncio.run(
+            check_statements(
+                factuality,
+                read_statements(args.input, args.input_format),
+                args.workers,
+                jsonl_writer(output),
+                skip,
+            )
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def check_input_batch(options: Options, args) -> None:
+    """
+    Batch mode through the OpenAI Batch API, all statements of the input go through each stage
+    together so results are only written at the end.
+    """
+    from factuality.result_output.json_output import output_json
+    from factuality.runner.batch import BatchFactuality
+    from factuality.runner.statements import MalformedRow, completed_ids, jsonl_writer, read_statements
+
+    skip = completed_ids(args.results) if args.results != "-" else set()
+    output = sys.stdout if args.results == "-" else open(args.results, "a")
+    try:
+        write = jsonl_writer(output)
+        statements = []
+        for statement_id, statement in read_statements(args.input, args.input_format):
+            if statement_id in skip:
+                continue
+            if isinstance(statement, MalformedRow):
+                write({"id": statement_id, "error": str(statement)})
+                continue
+            statements.append((statement_id, statement))
+        batch = BatchFactuality(options)
+        results = batch.check(statements)
+        for statement_id, (conclusion, checked_claims, statement) in results.items():
+            write(output_json(statement_id, statement, checked_claims, conclusion))
+        for statement_id, error in batch.errors.items():
+            write({"id": statement_id, "error": error})
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def render_event(console: "Console", event: Event) -> None:
+    from rich.text import Text
+
+    if isinstance(event, ClaimsExtracted):
+        console.print(f"Extracted {len(event.claims)} claims")
+    elif isinstance(event, ClaimFinished):
+        for claim_check in event.claim_checks:
+            console.print(
+                Text.assemble(
+                    (str(claim_check.result), "bold"),
+                    f" {claim_check.claim} {claim_check.source_reference or ''}",
+                )
+            )
 
 
 if __name__ == "__main__":
@@ -1,9 +1,40 @@
 import os
+from contextlib import contextmanager
 import psycopg2
+from psycopg2.extras import execute_batch
+from psycopg2.pool import ThreadedConnectionPool
 import json
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 
+_pool: ThreadedConnectionPool | None = None
+
+
+def get_pool(maxconn: int = 10) -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        # read at first use so a .env loaded after import is honored
+        _pool = ThreadedConnectionPool(1, maxconn, os.getenv('DATABASE_URL', DATABASE_URL))
+    return _pool
+
+
+@contextmanager
+def connection():
+    """
+    Pooled connection, committed when the block succeeds and rolled back otherwise.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
 def format_tweet(row):
     return {
         'id': row[0],
@@ -15,69 +46,131 @@ def format_tweet(row):
 def fetch():
     results = []
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-
-        cur.execute(f"""select id, user_screen_name, full_text, created_at_unix
-        from twitter_tweets 
-        where status = 'fact'
-        order by created_at_unix desc 
-        limit 10""")
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""select id, user_screen_name, full_text, created_at_unix
+            from twitter_tweets
+            where status = 'fact'
+            order by created_at_unix desc
+            limit 10""")
 
-        rows = cur.fetchall()
-        for row in rows:
-            results.append(format_tweet(row))
-
-        # conn.commit()
-        return results
+            for row in cur.fetchall():
+                results.append(format_tweet(row))
     except Exception as e:
         print(f"Error with fetch: {e}")
-        return results
-    finally:
-        try:
-            if cur:
-                cur.close()
-        except Exception as e:
-            pass
-        try:
-            if conn:
-                conn.close()
-        except Exception as e:
-            pass
-        return results
+    return results
 
 
-def update_db(tweet) -> None:
-    connection = None
-    cursor = None
-    try:
-        connection = psycopg2.connect(DATABASE_URL)
-        cursor = connection.cursor()
+def create_table() -> None:
+    """
+    The columns of `twitter_tweets` the worker uses, for a local database to run it against.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS twitter_tweets (
+                id TEXT PRIMARY KEY,
+                user_screen_name TEXT,
+                full_text TEXT,
+                created_at_unix BIGINT,
+                status TEXT,
+                response_fact JSONB,
+                tweet JSONB,
+                gist_url TEXT,
+                claimed_at TIMESTAMPTZ
+            )
+        """)
+
 
-        cursor.execute("""
+def ensure_lease_column() -> None:
+    """
+    Add the `claimed_at` lease of claimed rows to tables created before it existed.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("ALTER TABLE twitter_tweets ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ")
+
+
+def claim(limit: int, lease_timeout: float) -> list[dict]:
+    """
+    Atomically take up to `limit` queued tweets for this worker by moving them to 'processing'.
+    Rows locked by other workers are skipped, so any number of workers can claim in parallel.
+    Rows whose lease wasn't renewed for `lease_timeout` seconds belonged to a worker that died
+    and are taken again.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE twitter_tweets
+            SET status = 'processing', claimed_at = now()
+            WHERE id IN (
+                SELECT id
+                FROM twitter_tweets
+                WHERE status = 'fact'
+                    OR (
+                        status = 'processing'
+                        AND (claimed_at IS NULL OR claimed_at < now() - %s * interval '1 second')
+                    )
+                ORDER BY created_at_unix DESC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_screen_name, full_text, created_at_unix
+        """, (lease_timeout, limit))
+        return [format_tweet(row) for row in cur.fetchall()]
+
+
+def renew(ids: list) -> None:
+    """
+    Extend the lease of tweets this worker is still checking.
+    """
+    if len(ids) == 0:
+        return
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE twitter_tweets SET claimed_at = now() WHERE id = ANY(%s) AND status = 'processing'",
+            (list(ids),),
+        )
+
+
+def release(ids: list, status: str = 'fact') -> None:
+    """
+    Hand claimed tweets back to the queue, or park them with another status.
+    """
+    if len(ids) == 0:
+        return
+    with connection() as conn, conn.cursor() as cur:
+        execute_batch(
+            cur,
+            "UPDATE twitter_tweets SET status = %s, claimed_at = NULL WHERE id = %s AND status = 'processing'",
+            [(status, tweet_id) for tweet_id in ids],
+        )
+
+
+def update_many(tweets: list[dict]) -> None:
+    """
+    Write the results of claimed tweets, rows that were handed back or finished meanwhile are
+    left alone.
+    """
+    if len(tweets) == 0:
+        return
+    with connection() as conn, conn.cursor() as cur:
+        execute_batch(cur, """
             UPDATE twitter_tweets
-            SET 
-                response_fact = %s, 
-                tweet = %s,
-                gist_url = %s, 
-                status = 'done' 
-            WHERE id = %s
-        """, (
-            json.dumps(tweet['factuality']),
-            tweet['gist_url'],
-            tweet['id'],
-        ))
-        connection.commit()
+            SET
+                response_fact = %s,
+                gist_url = %s,
+                status = 'done',
+                claimed_at = NULL
+            WHERE id = %s AND status = 'processing'
+        """, [
+            (
+                json.dumps(tweet['factuality']),
+                tweet.get('gist_url'),
+                tweet['id'],
+            )
+            for tweet in tweets
+        ])
+
+
+def update_db(tweet) -> None:
+    try:
+        update_many([tweet])
     except Exception as e:
         print(f"Error saving tweet to database: {e}")
-    finally:
-        try:
-            if cursor:
-                cursor.close()
-        except Exception as e:
-            pass
-        try:
-            if connection:
-                connection.close()
-        except Exception as e:
-            pass
@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but belongs to another user
+        return True
+    return True
+
+
+class JobStore:
+    """
+    Status, events and results of fact-check jobs.
+
+    Backed by SQLite so every uvicorn worker on a host sees the jobs of the others, use
+    ":memory:" for a single process. Jobs run in the process that created them, its pid is
+    kept as `owner` so jobs left behind by a stopped worker can be failed.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    tweet_id TEXT,
+                    statement TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner INTEGER
+                )"""
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                # stores of an earlier version
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS job_events (
+                    job_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    PRIMARY KEY (job_id, seq)
+                )"""
+            )
+            self._connection.commit()
+
+    def create(self, statement: str, tweet_id: str | None = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                """INSERT INTO jobs (id, tweet_id, statement, status, created_at, updated_at, owner)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?)""",
+                (job_id, tweet_id, statement, now, now, os.getpid()),
+            )
+            self._connection.commit()
+        return job_id
+
+    def set_status(self, job_id: str, status: str, result: dict | None = None, error: str | None = None) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+            self._connection.commit()
+
+    def fail_orphaned(self) -> int:
+        """
+        Fail the queued and running jobs of processes that no longer run, nothing would ever
+        finish them. Returns how many were failed.
+        """
+        with self._lock:
+            owners = [
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT DISTINCT owner FROM jobs WHERE status IN ('queued', 'running')"
+                )
+            ]
+            orphaned = [owner for owner in owners if owner is None or not process_alive(owner)]
+            failed = 0
+            for owner in orphaned:
+                failed += self._connection.execute(
+                    """UPDATE jobs SET status = 'failed', error = 'The worker running the job stopped', updated_at = ?
+                    WHERE status IN ('queued', 'running') AND owner IS ?""",
+                    (time.time(), owner),
+                ).rowcount
+            self._connection.commit()
+        return failed
+
+    def add_event(self, job_id: str, event: dict) -> None:
+        with self._lock:
+            self._connection.execute(
+                """INSERT INTO job_events (job_id, seq, event)
+                VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?), ?)""",
+                (job_id, job_id, json.dumps(event)),
+            )
+            self._connection.commit()
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, tweet_id, statement, status, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "tweet_id": row[1],
+            "statement": row[2],
+            "status": row[3],
+            "result": json.loads(row[4]) if row[4] is not None else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def events(self, job_id: str, after: int = 0) -> list[tuple[int, dict]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import os
+from dotenv import load_dotenv
+from factuality.api import db
+from factuality.result_output.json_output import output_json
+from factuality.runner.factuality import Factuality
+from factuality.search import extraction
+from factuality.utils import logging
+from factuality.utils.defaults import Defaults
+from factuality.utils.metrics import metrics
+from factuality.utils.options import Options, options_from_env
+from factuality.utils.scheduler import is_transient
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class TweetWorker:
+    """
+    Fact-checks queued `twitter_tweets` rows.
+
+    Tweets are claimed with `FOR UPDATE SKIP LOCKED`, so any number of workers on any number
+    of nodes can share the queue without checking a tweet twice. Every claimed tweet is checked
+    by a task of its own that writes its result as soon as it is done, new tweets are claimed
+    (up to `batch_size` at once) whenever fewer than `concurrency` are being checked, so one
+    slow tweet doesn't hold up the others.
+
+    Each task renews the lease of its tweet while it checks it, tweets of a worker that died
+    are claimed again once the lease is `lease_timeout` seconds old. Checks failing for
+    transient reasons (open circuit, provider outage) go back to the queue, others are
+    parked as `error`.
+    """
+
+    def __init__(
+        self,
+        options: Options,
+        batch_size: int,
+        concurrency: int,
+        poll_interval: float,
+        metrics_path: str = "",
+        lease_timeout: float = Defaults.WORKER_LEASE_TIMEOUT.value,
+    ):
+        self.factuality = Factuality(options)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.metrics_path = metrics_path
+        self.lease_timeout = lease_timeout
+        # set when a tweet went back to the queue, so the same rows aren't claimed right away
+        self.backoff = asyncio.Event()
+
+    async def run(self, once: bool = False) -> None:
+        await asyncio.to_thread(db.ensure_lease_column)
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        tasks: set[asyncio.Task] = set()
+        try:
+            if once:
+                tweets = await asyncio.to_thread(db.claim, self.batch_size, self.lease_timeout)
+                await asyncio.gather(*[self.process(tweet, semaphore) for tweet in tweets])
+                return
+            while True:
+                tasks = {task for task in tasks if not task.done()}
+                free = max(1, self.concurrency) - len(tasks)
+                tweets = []
+                if free > 0 and not self.backoff.is_set():
+                    tweets = await asyncio.to_thread(db.claim, min(self.batch_size, free), self.lease_timeout)
+                if len(tweets) > 0:
+                    logger.info(f"Claimed tweets", count=len(tweets))
+                    tasks.update(asyncio.create_task(self.process(tweet, semaphore)) for tweet in tweets)
+                if len(tasks) >= max(1, self.concurrency):
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                elif len(tweets) == 0:
+                    # the queue is empty, or the provider or the database is failing and the
+                    # same rows shouldn't be claimed again right away
+                    await asyncio.sleep(self.poll_interval)
+                    self.backoff.clear()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def process(self, tweet: dict, semaphore: asyncio.Semaphore) -> None:
+        """
+        Check one claimed tweet and write back its result, or hand it back.
+        """
+        lease = asyncio.create_task(self.keep_lease(tweet['id']))
+        try:
+            try:
+                async with semaphore:
+                    result = await self.check(tweet)
+            finally:
+                lease.cancel()
+        except Exception as e:
+            transient = is_transient(e)
+            if transient:
+                self.backoff.set()
+            await self.release(tweet['id'], 'fact' if transient else 'error')
+            logger.info(f"Processed tweet", id=tweet['id'], status='retried' if transient else 'failed')
+        else:
+            try:
+                await asyncio.to_thread(db.update_many, [result])
+                logger.info(f"Processed tweet", id=tweet['id'], status='done')
+            except Exception as e:
+                logger.warning(f"Error saving tweet {tweet['id']} to database: {e}")
+                self.backoff.set()
+                await self.release(tweet['id'], 'fact')
+        if self.metrics_path:
+            # picked up by the node exporter textfile collector
+            await asyncio.to_thread(metrics.write, self.metrics_path)
+
+    async def release(self, tweet_id, status: str) -> None:
+        try:
+            await asyncio.to_thread(db.release, [tweet_id], status)
+        except Exception as e:
+            # the lease runs out and the tweet is claimed again
+            logger.warning(f"Error releasing tweet {tweet_id}: {e}")
+
+    async def keep_lease(self, tweet_id) -> None:
+        while True:
+            await asyncio.sleep(self.lease_timeout / 3)
+            try:
+                await asyncio.to_thread(db.renew, [tweet_id])
+            except Exception as e:
+                logger.warning(f"Error renewing the lease of tweet {tweet_id}: {e}")
+
+    async def check(self, tweet: dict) -> dict:
+        try:
+            conclusion, checked_claims, statement = await self.factuality.check_statement(tweet['full_text'])
+        except Exception as e:
+            logger.warning(f"Error checking tweet {tweet['id']}: {e}", transient=is_transient(e))
+            raise
+        result = output_json(tweet['id'], statement, checked_claims, conclusion)
+        result['gist_url'] = None
+        return result
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Fact-check the queued tweets of the twitter_tweets table.")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=os.getenv("WORKER_BATCH_SIZE", Defaults.WORKER_BATCH_SIZE.value),
+        help="How many tweets are claimed at most at once. Default is 10.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=os.getenv("WORKER_CONCURRENCY", Defaults.WORKER_CONCURRENCY.value),
+        help="How many tweets are fact-checked at the same time. Default is 4.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=os.getenv("WORKER_POLL_INTERVAL", Defaults.WORKER_POLL_INTERVAL.value),
+        help="Seconds to wait when the queue is empty. Default is 10.",
+    )
+    parser.add_argument(
+        "--lease-timeout",
+        type=float,
+        default=os.getenv("WORKER_LEASE_TIMEOUT", Defaults.WORKER_LEASE_TIMEOUT.value),
+        help="Seconds after which tweets claimed by a worker that stopped renewing them are claimed again. Default is 600.",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Process a single batch of --batch-size tweets and exit.",
+    )
+    args = parser.parse_args()
+
+    logging.setup_structlog(os.getenv("LOG_FORMAT", Defaults.LOG_FORMAT.value))
+    logging.change_log_level(os.getenv("LOG_LEVEL", Defaults.LOG_LEVEL.value))
+    options = options_from_env()
+    extraction.configure(
+        options.search_extraction_engine,
+        int(os.getenv("SEARCH_EXTRACTION_WORKERS", Defaults.SEARCH_EXTRACTION_WORKERS.value)),
+    )
+    worker = TweetWorker(
+        options,
+        args.batch_size,
+        args.concurrency,
+        args.poll_interval,
+        os.getenv("METRICS_PATH", Defaults.METRICS_PATH.value),
+        args.lease_timeout,
+    )
+    asyncio.run(worker.run(args.once))
+
+
+if __name__ == "__main__":
+    main()
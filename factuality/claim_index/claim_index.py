@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from factuality.claim_splitter.claim_splitter import Claim
+from factuality.fact_check.fact_check import ClaimChecked
+from factuality.fact_check.ranking import tokenize
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+MINHASH_PERMUTATIONS = 16
+MINHASH_BAND_SIZE = 2
+# terms that flip or pin down a claim, near duplicates must agree on all of them
+NEGATION_TERMS = frozenset(
+    """not no never nor neither none nobody nothing nowhere without cannot false untrue""".split()
+)
+MONTH_TERMS = frozenset(
+    """january february march april may june july august september october november december""".split()
+)
+# who the claim is about, left out of the terms as stopwords
+PRONOUN_TERMS = frozenset(
+    """he him his himself she her hers herself they them their theirs it its we our you your i me my""".split()
+)
+# order and comparison, "before" and "after" share every other term of a claim
+COMPARISON_TERMS = frozenset(
+    """before after earlier later first last more less fewer most least above below over under higher lower
+    larger smaller bigger greater increase increased decrease decreased rise rose fall fell""".split()
+)
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+CONTRACTED_NEGATION_PATTERN = re.compile(r"\w+n't\b|\w+n’t\b")
+SUPERLATIVE_PATTERN = re.compile(r"\w+est\b")
+ENTITY_PATTERN = re.compile(r"\b[A-Z][\w'’-]*")
+
+
+def normalize_claim(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(text.split()).rstrip(".!?;: ")
+
+
+def claim_terms(text: str) -> set[str]:
+    return set(tokenize(normalize_claim(text)))
+
+
+def claim_qualifiers(text: str) -> list[list[str]]:
+    """
+    Negations, numbers (months included), pronouns, comparisons and superlatives, and the
+    capitalized names of a claim. Term similarity can't tell "was not the first" from "was the
+    first", 1969 from 1996, "he" from "she", "before" from "after" or Paris from Rome, so these
+    have to match exactly.
+    """
+    normalized = normalize_claim(text)
+    tokens = re.findall(r"\w+", normalized)
+    negations = [token for token in tokens if token in NEGATION_TERMS] + ["not"] * len(
+        CONTRACTED_NEGATION_PATTERN.findall(normalized)
+    )
+    numbers = NUMBER_PATTERN.findall(normalized) + [token for token in tokens if token in MONTH_TERMS]
+    pronouns = [token for token in tokens if token in PRONOUN_TERMS]
+    comparisons = [token for token in tokens if token in COMPARISON_TERMS] + SUPERLATIVE_PATTERN.findall(normalized)
+    entities = [
+        token
+        for token in tokenize(" ".join(ENTITY_PATTERN.findall(unicodedata.normalize("NFKC", text))))
+        if token not in PRONOUN_TERMS
+    ]
+    return [sorted(negations), sorted(numbers), sorted(pronouns), sorted(comparisons), sorted(set(entities))]
+
+
+def _hash(value: str, seed: int) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8, salt=seed.to_bytes(8, "little")).digest(),
+        "little",
+    )
+
+
+def minhash_bands(terms: set[str]) -> list[int]:
+    """
+    Locality sensitive hashes of the term set, claims with a high Jaccard similarity share
+    at least one band with high probability.
+    """
+    if len(terms) == 0:
+        return []
+    signature = [min(_hash(term, seed) for term in terms) for seed in range(MINHASH_PERMUTATIONS)]
+    bands = []
+    for start in range(0, MINHASH_PERMUTATIONS, MINHASH_BAND_SIZE):
+        band = ":".join(str(value) for value in signature[start:start + MINHASH_BAND_SIZE])
+        # sqlite integers are signed 64 bit
+        bands.append(_hash(band, start) - 2**63)
+    return bands
+
+
+def jaccard(left: set[str], right: set[str]) -> float:
+    if len(left) == 0 and len(right) == 0:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+class ClaimIndex:
+    """
+    Checked claims of earlier statements, so restated claims reuse their results instead of
+    being searched and checked again.
+
+    A claim matches when its normalized text is identical. With a `similarity` below 1 near
+    duplicates match too, when the Jaccard similarity of their terms reaches it and both have
+    the same qualifiers (see `claim_qualifiers`), candidates are found through MinHash bands.
+    Results older than `ttl` seconds are not reused.
+    """
+
+    def __init__(self, path: str, ttl: float, similarity: float):
+        self.ttl = ttl
+        self.similarity = similarity
+        self.reused = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS claims (
+                    normalized TEXT PRIMARY KEY,
+                    terms TEXT NOT NULL,
+                    claim_checks TEXT NOT NULL,
+                    checked_at REAL NOT NULL,
+                    qualifiers TEXT
+                )"""
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(claims)")]
+            if "qualifiers" not in columns:
+                # claims indexed before have none and are only reused for the identical claim
+                self._connection.execute("ALTER TABLE claims ADD COLUMN qualifiers TEXT")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS claim_bands (
+                    band INTEGER NOT NULL,
+                    normalized TEXT NOT NULL,
+                    PRIMARY KEY (band, normalized)
+                )"""
+            )
+            self._connection.commit()
+
+    def lookup(self, claim: Claim) -> list[ClaimChecked] | None:
+        """
+        Fresh checks of the same or a near duplicate claim, rewritten for this claim.
+        """
+        normalized = normalize_claim(claim.claim)
+        terms = claim_terms(claim.claim)
+        fresh_after = time.time() - self.ttl
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT claim_checks FROM claims WHERE normalized = ? AND checked_at >= ?",
+                (normalized, fresh_after),
+            ).fetchone()
+            if row is None and self.similarity < 1:
+                bands = minhash_bands(terms)
+                candidates = self._connection.execute(
+                    f"""SELECT DISTINCT claims.terms, claims.claim_checks, claims.qualifiers
+                    FROM claim_bands JOIN claims ON claims.normalized = claim_bands.normalized
+                    WHERE claim_bands.band IN ({",".join("?" * len(bands))}) AND claims.checked_at >= ?""",
+                    (*bands, fresh_after),
+                ).fetchall() if len(bands) > 0 else []
+                best = 0.0
+                qualifiers = claim_qualifiers(claim.claim)
+                for candidate_terms, claim_checks, candidate_qualifiers in candidates:
+                    similarity = jaccard(terms, set(candidate_terms.split()))
+                    if similarity < self.similarity or similarity <= best or candidate_qualifiers is None:
+                        continue
+                    if json.loads(candidate_qualifiers) == qualifiers:
+                        best = similarity
+                        row = (claim_checks,)
+
+        if row is None:
+            self.missed += 1
+            return None
+        self.reused += 1
+        logger.info(f"Reusing checks of a known claim", claim=claim.claim)
+        return [
+            ClaimChecked(
+                **{
+                    **claim_check,
+                    "claim": claim.claim,
+                    "reference": claim.reference,
+                    "verification_query": claim.verification_query,
+                }
+            )
+            for claim_check in json.loads(row[0])
+        ]
+
+    def add(self, claim: Claim, claim_checks: list[ClaimChecked]) -> None:
+        # a claim without any checked source most likely failed, check it again next time
+        if all(claim_check.source_reference is None for claim_check in claim_checks):
+            return
+        normalized = normalize_claim(claim.claim)
+        terms = claim_terms(claim.claim)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO claims (normalized, terms, claim_checks, checked_at, qualifiers) VALUES (?, ?, ?, ?, ?)",
+                (
+                    normalized,
+                    " ".join(sorted(terms)),
+                    json.dumps([claim_check.model_dump(mode="json") for claim_check in claim_checks]),
+                    time.time(),
+                    json.dumps(claim_qualifiers(claim.claim)),
+                ),
+            )
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO claim_bands (band, normalized) VALUES (?, ?)",
+                [(band, normalized) for band in minhash_bands(terms)],
+            )
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        lookups = self.reused + self.missed
+        return {
+            "reused": self.reused,
+            "missed": self.missed,
+            "reuse_rate": self.reused / lookups if lookups > 0 else 0.0,
+        }
@@ -1,5 +1,6 @@
 # from gpt_json import GPTJSON, GPTMessage, GPTMessageRole
-from openai import OpenAI
+from factuality.llm.llm import get_gateway
+from factuality.utils.metrics import span
 from pydantic import BaseModel
 import structlog
 
@@ -40,18 +41,11 @@ async def extract_claims(text: str, oai_key: str, oai_model: str) -> list[Claim]
     #         ),
     #     ]
     # )
-    client = OpenAI()
-
-    completion = client.beta.chat.completions.parse(
-        model=oai_model,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": text},
-        ],
-        response_format=ClaimsArray,
-    )
-
-    payload = completion.choices[0].message.parsed
+    with span("extract") as fields:
+        payload = await get_gateway(oai_key).parse(
+            oai_model, SYSTEM_PROMPT, text, ClaimsArray
+        )
+        fields["claims"] = len(payload.claims)
     logger.info(payload)
     logger.info(text)
 
@@ -1,12 +1,20 @@
 import asyncio
+from contextlib import aclosing
 from enum import Enum
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Iterator
 import os
+import re
 from urllib.parse import urlparse
 # from gpt_json import GPTJSON, GPTMessage, GPTMessageRole
-from openai import OpenAI
 from pydantic import BaseModel
 from factuality.claim_splitter.claim_splitter import Claim
+from factuality.fact_check.ranking import rank_chunks
+from factuality.llm.llm import get_gateway
 from factuality.search.search import SearchResults
+from factuality.search.source_registry import SourceRegistry
+from factuality.utils.metrics import span
+from factuality.utils.scheduler import is_transient
 import structlog
 
 logger = structlog.get_logger(__name__)
@@ -30,16 +38,114 @@ class ClaimChecked(Claim):
 
 
 def split_with_overlap(text, chunk_size, overlap):
-    chunks = []
     start = 0
     while start + chunk_size <= len(text):
         end = start + chunk_size
-        chunks.append(text[start:end])
+        yield text[start:end]
         start = start + chunk_size - overlap
 
     if start < len(text):
-        chunks.append(text[start:])
-    return chunks
+        yield text[start:]
+
+
+# a boundary is the whitespace after the end of a sentence or a line break
+SEGMENT_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """
+    tiktoken encoding of `model`, None when it can't be loaded. tiktoken downloads its
+    vocabulary on first use, a failed download is not retried for the life of the process.
+    """
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Token encoding for {model} unavailable, counting ~4 characters per token: {e}")
+        return None
+
+
+async def load_encoding(model: str) -> None:
+    """
+    Load the encoding of `model` in a worker thread, so its download doesn't block the event loop.
+    """
+    await asyncio.to_thread(get_encoding, model)
+
+
+def split_segments(text: str, encoding, max_tokens: int) -> Iterator[tuple[int, int, int]]:
+    """
+    (start, end, tokens) of every sentence or paragraph in text, segments longer than
+    max_tokens are cut at token boundaries.
+    """
+    start = 0
+    for boundary in SEGMENT_BOUNDARY.finditer(text):
+        end = boundary.end()
+        if end > start:
+            yield from split_segment(text, start, end, encoding, max_tokens)
+        start = end
+    if start < len(text):
+        yield from split_segment(text, start, len(text), encoding, max_tokens)
+
+
+def split_segment(text: str, start: int, end: int, encoding, max_tokens: int) -> Iterator[tuple[int, int, int]]:
+    tokens = encoding.encode(text[start:end])
+    if len(tokens) <= max_tokens:
+        yield (start, end, len(tokens))
+        return
+    _, offsets = encoding.decode_with_offsets(tokens)
+    for index in range(0, len(tokens), max_tokens):
+        piece_end = start + offsets[index + max_tokens] if index + max_tokens < len(tokens) else end
+        yield (start + offsets[index], piece_end, min(max_tokens, len(tokens) - index))
+
+
+def split_by_tokens(text: str, max_tokens: int, overlap_tokens: int, model: str) -> Iterator[str]:
+    """
+    Split text into chunks of at most max_tokens tokens of `model`, cutting only between
+    sentences or paragraphs when possible. Consecutive chunks share whole trailing segments
+    of up to overlap_tokens tokens. The whole text is tokenized on the first chunk, only
+    the segment offsets are kept and each chunk is sliced from text when it is requested.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        yield from split_with_overlap(text, max_tokens * 4, overlap_tokens * 4)
+        return
+
+    segments = list(split_segments(text, encoding, max_tokens))
+    first = 0
+    while first < len(segments):
+        last = first
+        tokens = segments[first][2]
+        while last + 1 < len(segments) and tokens + segments[last + 1][2] <= max_tokens:
+            last += 1
+            tokens += segments[last][2]
+        yield text[segments[first][0]:segments[last][1]]
+        if last + 1 >= len(segments):
+            return
+
+        next_first = last + 1
+        overlap = 0
+        while next_first - 1 > first and overlap + segments[next_first - 1][2] <= overlap_tokens:
+            next_first -= 1
+            overlap += segments[next_first][2]
+        first = next_first
+
+
+def split_source(
+    text: str,
+    search_extract_article_length: int,
+    search_extract_article_overlap: int,
+    chunk_tokens: int,
+    chunk_overlap_tokens: int,
+    model: str,
+) -> Iterator[str]:
+    if chunk_tokens > 0:
+        return split_by_tokens(text, chunk_tokens, chunk_overlap_tokens, model)
+    return split_with_overlap(text, search_extract_article_length, search_extract_article_overlap)
 
 
 SYSTEM_PROMPT = """
@@ -48,86 +154,214 @@ rejected. For inconclusive you will provide no source quote, for rejected and ve
 quote. Extract the quote directly from the text without modification.
 """
 
+BATCH_SYSTEM_PROMPT = """
+You are a source checker you will try to verify a claim by checking several numbered excerpts of a source. For every excerpt
+you MUST answer with its index and verified, inconclusive or rejected. For inconclusive you will provide no source quote, for
+rejected and verified you will provide a source quote. Extract the quote directly from the excerpt without modification.
+"""
+
+
+class IndexedResult(Result):
+    index: int
+
+
+class BatchResult(BaseModel):
+    results: list[IndexedResult]
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+
+def batch_chunks(chunks: list[str], batch_tokens: int, model: str) -> Iterator[list[str]]:
+    """
+    Group consecutive chunks into batches of at most batch_tokens tokens, 0 disables
+    batching. A chunk larger than the budget still gets a batch of its own.
+    """
+    if batch_tokens <= 0:
+        for chunk in chunks:
+            yield [chunk]
+        return
+    batch = []
+    tokens = 0
+    for chunk in chunks:
+        chunk_tokens = count_tokens(chunk, model)
+        if len(batch) > 0 and tokens + chunk_tokens > batch_tokens:
+            yield batch
+            batch = []
+            tokens = 0
+        batch.append(chunk)
+        tokens += chunk_tokens
+    if len(batch) > 0:
+        yield batch
+
+
+def batch_request(claim: Claim, chunks: list[str]) -> tuple[str, str, type[BaseModel]]:
+    """
+    System prompt, user content and response format to check the claim against the chunks.
+    """
+    if len(chunks) == 1:
+        return (
+            SYSTEM_PROMPT,
+            f"<claim>{claim.claim}</claim><source>{chunks[0]}</source>",
+            Result,
+        )
+    sources = "".join(
+        f'<source index="{index}">{chunk}</source>' for index, chunk in enumerate(chunks)
+    )
+    return (BATCH_SYSTEM_PROMPT, f"<claim>{claim.claim}</claim>{sources}", BatchResult)
+
+
+def batch_verdict(payload: Result | BatchResult) -> Result:
+    """
+    For several chunks the verified or rejected verdict they agree on, with the quote of the
+    first chunk in order. Chunks of one source that verify and reject the claim leave it
+    inconclusive, the source doesn't settle the claim on its own (it may quote the claim to
+    contradict it). Without any such verdict it is inconclusive.
+    """
+    if isinstance(payload, Result):
+        return payload
+    decisive = [
+        result
+        for result in sorted(payload.results, key=lambda result: result.index)
+        if result.result != ResultType.INCONCLUSIVE
+    ]
+    if len({result.result for result in decisive}) > 1:
+        logger.info(
+            f"Conflicting verdicts in one source",
+            verdicts=[(result.result, result.source_quote) for result in decisive],
+        )
+        return Result(result=ResultType.INCONCLUSIVE)
+    if len(decisive) > 0:
+        return Result(result=decisive[0].result, source_quote=decisive[0].source_quote)
+    return Result(result=ResultType.INCONCLUSIVE)
+
+
+async def check_batch(claim: Claim, chunks: list[str], oai_key: str, oai_model: str) -> Result:
+    """
+    Check the claim against one or more chunks in a single request.
+    """
+    system_prompt, user_content, response_format = batch_request(claim, chunks)
+    with span("check", chunks=len(chunks)) as fields:
+        payload = await get_gateway(oai_key).parse(
+            oai_model, system_prompt, user_content, response_format
+        )
+        verdict = batch_verdict(payload)
+        fields["result"] = verdict.result.value
+    return verdict
+
 
 async def check_claim(
     claim: Claim,
-    sources: list[SearchResults],
+    sources: AsyncIterator[SearchResults],
     validation_checks_per_claim: int,
     same_site_allowed: bool,
     search_extract_article_length: int,
     search_extract_article_overlap: int,
     oai_key: str,
     oai_model: str,
+    max_chunks_per_source: int = 0,
+    chunk_tokens: int = 0,
+    chunk_overlap_tokens: int = 0,
+    batch_tokens: int = 0,
+    on_source_checked: Callable[[ClaimChecked], Awaitable[None]] | None = None,
+    source_registry: SourceRegistry | None = None,
 ) -> list[ClaimChecked]:
     claim_checks = []
     sources_used = []
-    for source in sources:
-        if not same_site_allowed and urlparse(source.url)[1] in sources_used:
-            continue
-        if validation_checks_per_claim <= len(claim_checks):
-            break
-        for chunk in split_with_overlap(
-            source.text, search_extract_article_length, search_extract_article_overlap
-        ):
-            try:
-                logger.info(f"Checking claim", claim=claim.claim, source=source.url)
-                # gpt_json = GPTJSON[Result](oai_key, model=oai_model)
-                # payload = await gpt_json.run(
-                #     messages=[
-                #         GPTMessage(
-                #             role=GPTMessageRole.SYSTEM,
-                #             content=SYSTEM_PROMPT,
-                #         ),
-                #         GPTMessage(
-                #             role=GPTMessageRole.USER,
-                #             content=f"claim: {claim.claim} source: {chunk}",
-                #         ),
-                #     ]
-                # )
-                client = OpenAI()
-
-                completion = client.beta.chat.completions.parse(
-                    model=oai_model,
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": f"<claim>{claim.claim}</claim><source>{chunk}</source>"},
-                    ],
-                    response_format=Result,
+    # sources are downloaded lazily, stop pulling as soon as there are enough checks
+    async with aclosing(sources) as sources:
+        async for source in sources:
+            if not same_site_allowed and urlparse(source.url)[1] in sources_used:
+                continue
+            settings = (
+                search_extract_article_length,
+                search_extract_article_overlap,
+                chunk_tokens,
+                chunk_overlap_tokens,
+                oai_model,
+            )
+            if source_registry is None:
+                chunks = split_source(source.text, *settings)
+            else:
+                # other claims of the run may have split this source already
+                chunks = source_registry.chunks(
+                    source.url, settings, lambda: split_source(source.text, *settings)
                 )
+            # most relevant chunks first so boilerplate doesn't cost an LLM call each, the next
+            # chunk is only checked while the ones before were inconclusive
+            inconclusive = False
+            for batch in batch_chunks(
+                rank_chunks(
+                    f"{claim.claim} {claim.verification_query}",
+                    chunks,
+                    max_chunks_per_source,
+                ),
+                batch_tokens,
+                oai_model,
+            ):
+                try:
+                    logger.info(f"Checking claim", claim=claim.claim, source=source.url)
+                    # gpt_json = GPTJSON[Result](oai_key, model=oai_model)
+                    # payload = await gpt_json.run(
+                    #     messages=[
+                    #         GPTMessage(
+                    #             role=GPTMessageRole.SYSTEM,
+                    #             content=SYSTEM_PROMPT,
+                    #         ),
+                    #         GPTMessage(
+                    #             role=GPTMessageRole.USER,
+                    #             content=f"claim: {claim.claim} source: {chunk}",
+                    #         ),
+                    #     ]
+                    # )
+                    payload = await check_batch(claim, batch, oai_key, oai_model)
 
-                payload = completion.choices[0].message.parsed
-
-                if payload.result == ResultType.VERIFIED or payload.result == ResultType.REJECTED:
-                    claim_checks.append(
-                        ClaimChecked(
-                            claim=claim.claim,
-                            reference=claim.reference,
-                            verification_query=claim.verification_query,
-                            result=payload.result,
-                            source_reference=source.url,
-                            source_quote=payload.source_quote,
+                    if payload.result == ResultType.VERIFIED or payload.result == ResultType.REJECTED:
+                        claim_checks.append(
+                            ClaimChecked(
+                                claim=claim.claim,
+                                reference=claim.reference,
+                                verification_query=claim.verification_query,
+                                result=payload.result,
+                                source_reference=source.url,
+                                source_quote=payload.source_quote,
+                            )
                         )
+                        sources_used.append(urlparse(source.url)[1])
+                        if on_source_checked is not None:
+                            await on_source_checked(claim_checks[-1])
+                        inconclusive = False
+                        break
+                    elif payload.result == ResultType.INCONCLUSIVE:
+                        inconclusive = True
+                except Exception as e:
+                    # an outage would leave the claim inconclusive, the caller can try again later
+                    if is_transient(e):
+                        raise
+                    logger.warning(
+                        f"Error checking claim {claim.claim} with source {source.url}: {e}"
                     )
-                    sources_used.append(urlparse(source.url)[1])
-                    break
-                elif payload.result == ResultType.INCONCLUSIVE:
-                    claim_checks.append(
-                        ClaimChecked(
-                            claim=claim.claim,
-                            reference=claim.reference,
-                            verification_query=claim.verification_query,
-                            result=payload.result,
-                            source_reference=source.url,
-                            source_quote=None,
-                        )
+            if inconclusive:
+                # none of the checked chunks of the source settled the claim
+                claim_checks.append(
+                    ClaimChecked(
+                        claim=claim.claim,
+                        reference=claim.reference,
+                        verification_query=claim.verification_query,
+                        result=ResultType.INCONCLUSIVE,
+                        source_reference=source.url,
+                        source_quote=None,
                     )
-                    sources_used.append(urlparse(source.url)[1])
-                    break
-            except Exception as e:
-                logger.warning(
-                    f"Error checking claim {claim.claim} with source {source.url}: {e}"
                 )
-                pass
+                sources_used.append(urlparse(source.url)[1])
+                if on_source_checked is not None:
+                    await on_source_checked(claim_checks[-1])
+            if validation_checks_per_claim <= len(claim_checks):
+                break
     if len(claim_checks) > 0:
         return claim_checks
     logger.info(f"Claim checked", claim=claim.claim, result=ResultType.INCONCLUSIVE)
@@ -0,0 +1,71 @@
+import math
+import re
+from collections import Counter
+from typing import Iterable
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset(
+    """a an and are as at be been but by for from has have he her his in is it its of on or
+    she that the their they this to was were which who will with""".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        token
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+def bm25_scores(query: str, documents: list[str], k1: float = 1.5, b: float = 0.75) -> list[float]:
+    """
+    Okapi BM25 score of every document for the query, the documents are their own corpus.
+    """
+    tokenized = [tokenize(document) for document in documents]
+    if len(tokenized) == 0:
+        return []
+    average_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1
+    document_frequency = Counter(token for tokens in tokenized for token in set(tokens))
+    query_tokens = set(tokenize(query))
+
+    scores = []
+    for tokens in tokenized:
+        frequencies = Counter(tokens)
+        score = 0.0
+        for token in query_tokens:
+            frequency = frequencies.get(token, 0)
+            if frequency == 0:
+                continue
+            idf = math.log(
+                (len(tokenized) - document_frequency[token] + 0.5) / (document_frequency[token] + 0.5) + 1
+            )
+            score += idf * frequency * (k1 + 1) / (
+                frequency + k1 * (1 - b + b * len(tokens) / average_length)
+            )
+        scores.append(score)
+    return scores
+
+
+def rank_chunks(query: str, chunks: Iterable[str], max_chunks: int) -> list[str]:
+    """
+    Chunks most relevant to the query first, at most `max_chunks` of them (0 keeps all).
+
+    Chunks sharing no terms with the query are dropped. If none share any terms the first
+    chunk is kept so the source still gets one look.
+    """
+    chunks = list(chunks)
+    scores = bm25_scores(query, chunks)
+    ranked = [
+        chunk
+        for score, _, chunk in sorted(
+            zip(scores, range(len(chunks)), chunks), key=lambda item: (-item[0], item[1])
+        )
+        if score > 0
+    ]
+    if len(ranked) == 0:
+        ranked = chunks[:1]
+    if max_chunks > 0:
+        ranked = ranked[:max_chunks]
+    return ranked
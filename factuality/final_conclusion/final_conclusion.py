@@ -1,7 +1,8 @@
 import asyncio
 import os
 # from gpt_json import GPTJSON, GPTMessage, GPTMessageRole
-from openai import OpenAI
+from factuality.llm.llm import get_gateway
+from factuality.utils.metrics import span
 from pydantic import BaseModel, Field
 import structlog
 
@@ -22,18 +23,10 @@ async def final_conclusion(investigation_results: str, oai_key: str, oai_model:
     logger.info(f"Generating final conclusion")
     # gpt_json = GPTJSON[Conclusion](oai_key, model=oai_model)
 
-    client = OpenAI()
-
-    completion = client.beta.chat.completions.parse(
-        model=oai_model,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": investigation_results},
-        ],
-        response_format=Conclusion,
-    )
-
-    payload = completion.choices[0].message.parsed
+    with span("conclusion"):
+        payload = await get_gateway(oai_key).parse(
+            oai_model, SYSTEM_PROMPT, investigation_results, Conclusion
+        )
 
     # payload = await gpt_json.run(
     #     messages=[
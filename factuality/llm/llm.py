@@ -0,0 +1,131 @@
+import asyncio
+import weakref
+from typing import TYPE_CHECKING, TypeVar
+from pydantic import BaseModel
+from factuality.utils.cache import SqliteCache, cache_key
+from factuality.utils.defaults import Defaults
+from factuality.utils.metrics import record_llm_usage
+from factuality.utils.scheduler import get_scheduler
+import structlog
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+_max_in_flight: int = Defaults.OPENAI_MAX_IN_FLIGHT.value
+_cache: SqliteCache | None = None
+# httpx connection pools are bound to the event loop they were opened on, so there
+# is one gateway per running loop (and api key) instead of one per call
+_gateways: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str | None, LLMGateway]]" = (
+    weakref.WeakKeyDictionary()
+)
+# clients of replaced gateways being closed, the loop only keeps weak references to tasks
+_closing: "set[asyncio.Task]" = set()
+
+
+class LLMGateway:
+    def __init__(self, api_key: str | None, max_in_flight: int, cache: SqliteCache | None = None):
+        self.cache = cache
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self._client: "AsyncOpenAI | None" = None
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        # openai (and httpx) take a good part of the startup time, runs answered
+        # from the cache never need them
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                # retries go through the scheduler, which also knows about the other calls
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_in_flight,
+                        max_keepalive_connections=self.max_in_flight,
+                    )
+                ),
+            )
+        return self._client
+
+    def close(self) -> None:
+        """
+        Close the connections of the client in the background, on the loop it was created on.
+        """
+        if self._client is not None:
+            task = asyncio.get_running_loop().create_task(self._client.close())
+            _closing.add(task)
+            task.add_done_callback(_closing.discard)
+            self._client = None
+
+    async def parse(
+        self, model: str, system_prompt: str, user_content: str, response_format: type[T]
+    ) -> T:
+        """
+        Structured output chat completion, at most `max_in_flight` requests run at the same time
+        and every request goes through the rate limits and retries of the openai scheduler.
+        Responses are served from the cache when the same model, prompts and schema were seen before.
+        """
+        key = None
+        if self.cache is not None:
+            key = cache_key(
+                model, system_prompt, user_content, response_format.model_json_schema()
+            )
+            # sqlite reads and the recency update would block every other check on the loop
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                logger.debug(f"LLM cache hit", model=model, key=key)
+                record_llm_usage(model, 0, 0, cached=True)
+                return response_format.model_validate_json(cached)
+
+        async def attempt():
+            async with self.semaphore:
+                return await self.client.beta.chat.completions.parse(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_content},
+                    ],
+                    response_format=response_format,
+                )
+
+        scheduler = get_scheduler("openai")
+        # about 4 characters per token, corrected with the real usage afterwards
+        estimated_tokens = (len(system_prompt) + len(user_content)) // 4
+        completion = await scheduler.run(attempt, estimated_tokens)
+        payload = completion.choices[0].message.parsed
+        if completion.usage is not None:
+            scheduler.settle(estimated_tokens, completion.usage.total_tokens)
+            record_llm_usage(model, completion.usage.prompt_tokens, completion.usage.completion_tokens)
+        if key is not None and payload is not None:
+            await asyncio.to_thread(self.cache.set, key, payload.model_dump_json().encode("utf-8"))
+        return payload
+
+
+def configure(max_in_flight: int, cache: SqliteCache | None = None) -> None:
+    """
+    Set the maximum number of concurrent OpenAI requests and the response cache, gateways
+    configured before are replaced on their next use.
+    """
+    global _max_in_flight, _cache
+    _max_in_flight = max_in_flight
+    _cache = cache
+
+
+def get_gateway(api_key: str | None = None) -> LLMGateway:
+    loop = asyncio.get_running_loop()
+    gateways = _gateways.setdefault(loop, {})
+    gateway = gateways.get(api_key)
+    if gateway is None or gateway.cache is not _cache or gateway.max_in_flight != _max_in_flight:
+        # configured anew since, the old gateway's connections aren't used anymore
+        if gateway is not None:
+            gateway.close()
+        gateway = gateways[api_key] = LLMGateway(api_key, _max_in_flight, _cache)
+    return gateway
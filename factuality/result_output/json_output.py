@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+from factuality.fact_check.fact_check import ClaimChecked
+from factuality.final_conclusion.final_conclusion import Conclusion
+
+
+def output_json(tweet_id: str | None, statement: str, claimchecks: list[ClaimChecked], conclusion: Conclusion) -> dict:
+    return transform_claims({
+        'id': tweet_id,
+        'factuality': {
+            "statement": statement,
+            "claims": [claim.model_dump(by_alias=True) for claim in claimchecks],
+            "conclusion": conclusion.model_dump(by_alias=True),
+        },
+    })
+
+
+def transform_claims(data):
+    # Process claims into grouped structure
+    claim_map = defaultdict(lambda: {
+        "claim": None,
+        "reference": None,
+        "verification_query": None,
+        "evidence": []
+    })
+
+    for claim in data["factuality"]["claims"]:
+        key = (claim["claim"], claim["verification_query"])
+        entry = claim_map[key]
+        entry["claim"] = claim["claim"]
+        entry["reference"] = claim.get("reference")
+        entry["verification_query"] = claim["verification_query"]
+        entry["evidence"].append({
+            "result": claim["result"],
+            "source_reference": claim["source_reference"],
+            "source_quote": claim["source_quote"]
+        })
+
+    # Rebuild the output structure
+    output = {
+        "id": data["id"],
+        "factuality": {
+            "statement": data["factuality"]["statement"],
+            "claims": list(claim_map.values()),
+            "conclusion": data["factuality"]["conclusion"]
+        },
+    }
+    return output
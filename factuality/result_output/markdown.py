@@ -1,10 +1,11 @@
 import textwrap
-from pytablewriter import MarkdownTableWriter
 
 from factuality.fact_check.fact_check import ClaimChecked
 from factuality.final_conclusion.final_conclusion import Conclusion
 
 def convert_claims_markdown_table(claimchecks: list[ClaimChecked]) -> str:
+    from pytablewriter import MarkdownTableWriter
+
     value_matrix = []
     for claimcheck in claimchecks:
         value_matrix.append([claimcheck.claim, claimcheck.result, claimcheck.source_reference, claimcheck.source_quote])
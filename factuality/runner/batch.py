@@ -0,0 +1,531 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Callable, TypeVar
+from openai import OpenAI
+from pydantic import BaseModel
+from urllib.parse import urlparse
+from factuality.claim_splitter import claim_splitter
+from factuality.claim_splitter.claim_splitter import Claim, ClaimsArray
+from factuality.fact_check import fact_check
+from factuality.fact_check.fact_check import ClaimChecked, ResultType, batch_chunks, batch_request, batch_verdict, split_source
+from factuality.fact_check.ranking import rank_chunks
+from factuality.final_conclusion import final_conclusion
+from factuality.final_conclusion.final_conclusion import Conclusion
+from factuality.result_output.markdown import output_markdown
+from factuality.runner.factuality import Factuality
+from factuality.search.search import SearchClient, SearchResults
+from factuality.search.source_registry import SourceRegistry
+from factuality.utils.cache import cache_key
+from factuality.utils.metrics import record_llm_usage, span
+from factuality.utils.options import Options
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+
+def state_digest(value) -> str:
+    """
+    Digest of the inputs a stage's state in `batch_dir` was built from, state with another
+    digest belongs to other statements (or settings) and is not reused.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def strict_schema(schema: dict) -> dict:
+    """
+    JSON schema of a model in the form structured outputs accepts with `strict`: every object
+    closed and all of its properties required, no defaults.
+    """
+    if not isinstance(schema, dict):
+        return schema
+    schema = {key: value for key, value in schema.items() if key != "default"}
+    if schema.get("type") == "object" and "properties" in schema:
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema["properties"])
+    for key in ("properties", "$defs"):
+        if key in schema:
+            schema[key] = {name: strict_schema(value) for name, value in schema[key].items()}
+    for key in ("anyOf", "allOf"):
+        if key in schema:
+            schema[key] = [strict_schema(value) for value in schema[key]]
+    if "items" in schema:
+        schema["items"] = strict_schema(schema["items"])
+    return schema
+
+
+def response_format(model: type[BaseModel]) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "schema": strict_schema(model.model_json_schema()), "strict": True},
+    }
+
+
+class BatchFailedError(RuntimeError):
+    """
+    The batch ended without output (failed, expired or cancelled), it has to be submitted again.
+    """
+
+
+class BatchRequest(BaseModel):
+    custom_id: str
+    model: str
+    system_prompt: str
+    user_content: str
+
+    def body(self, model: type[BaseModel]) -> dict:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": self.user_content},
+            ],
+            "response_format": response_format(model),
+        }
+
+
+class OpenAIBatchBackend:
+    """
+    Submits JSONL request files to the OpenAI Batch API.
+    """
+
+    def __init__(self, api_key: str | None = None):
+        self.client = OpenAI(api_key=api_key)
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as file:
+            input_file = self.client.files.create(file=file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=COMPLETIONS_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str | None:
+        """
+        Output JSONL of a finished batch, None while it is still running.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "expired", "cancelled"):
+            raise BatchFailedError(f"Batch {batch_id} ended with status {batch.status}")
+        if batch.status != "completed":
+            return None
+        if batch.output_file_id is None:
+            return ""
+        return self.client.files.content(batch.output_file_id).text
+
+
+class LocalBatchBackend:
+    """
+    Stand-in for the Batch API for tests and local runs, every request body is answered by
+    `responder` which returns the assistant message content.
+    """
+
+    def __init__(self, responder: Callable[[dict], str]):
+        self.responder = responder
+        self.batches: dict[str, str] = {}
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        lines = []
+        with open(input_path, "r") as file:
+            for line in file:
+                request = json.loads(line)
+                try:
+                    content = self.responder(request["body"])
+                    lines.append(
+                        {
+                            "custom_id": request["custom_id"],
+                            "response": {
+                                "status_code": 200,
+                                "body": {"choices": [{"message": {"role": "assistant", "content": content}}]},
+                            },
+                            "error": None,
+                        }
+                    )
+                except Exception as e:
+                    lines.append({"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}})
+        self.batches[batch_id] = "".join(json.dumps(line) + "\n" for line in lines)
+        return batch_id
+
+    def poll(self, batch_id: str) -> str | None:
+        return self.batches[batch_id]
+
+
+class BatchFactuality:
+    """
+    Offline version of `Factuality.check` for many statements at once.
+
+    Every LLM stage (claim extraction, fact checks, conclusions) of all statements is written
+    to one JSONL file, submitted through the batch backend and polled until done. Inputs,
+    batch ids and outputs are kept in `options.batch_dir` with a digest of their inputs, so an
+    interrupted run picks up again at the stage it stopped while state of other inputs is
+    replaced. Responses already in the LLM cache are not submitted and
+    batch responses are added to it.
+
+    Statements whose claims, searches or conclusion couldn't be had are left out of the
+    results and kept with the reason in `errors` by id.
+
+    Batches can't stop at the first verdict like `check_claim` does, so every claim is
+    checked against its first `validation_checks_per_claim` sources with their most relevant
+    chunks (as many as fit into `factcheck_batch_tokens`, at least one) in one request each.
+    """
+
+    def __init__(self, options: Options, backend: OpenAIBatchBackend | LocalBatchBackend | None = None):
+        self.options = options
+        self.factuality = Factuality(options)
+        self.backend = backend or OpenAIBatchBackend(options.oai_api_key)
+        self.errors: dict[str, str] = {}
+        os.makedirs(options.batch_dir, exist_ok=True)
+
+    def check(self, statements: list[tuple[str, str]]) -> dict[str, tuple[Conclusion, list[ClaimChecked], str]]:
+        """
+        Fact-check (id, statement) pairs, returns the results by id.
+        """
+        texts = dict(statements)
+        self.errors = {}
+
+        extract_requests = [
+            BatchRequest(
+                custom_id=f"extract-{statement_id}",
+                model=self.options.openai_model_extract,
+                system_prompt=claim_splitter.SYSTEM_PROMPT,
+                user_content=text,
+            )
+            for statement_id, text in statements
+        ]
+        extracted = self.run_stage("extract", extract_requests, ClaimsArray)
+        claims = {
+            statement_id: extracted[f"extract-{statement_id}"].claims
+            for statement_id, _ in statements
+            if f"extract-{statement_id}" in extracted
+        }
+        self.fail(
+            [statement_id for statement_id, _ in statements if statement_id not in claims],
+            "claim extraction failed",
+        )
+
+        check_requests, checked_sources, search_errors = self.build_check_requests(claims)
+        for statement_id, error in search_errors.items():
+            self.fail([statement_id], f"search failed: {error}")
+        claims = {statement_id: claims[statement_id] for statement_id in claims if statement_id not in search_errors}
+        checked = self.run_stage("check", check_requests, fact_check.Result, fact_check.BatchResult)
+        results = self.collect_claim_checks(claims, checked_sources, checked)
+
+        conclusion_requests = [
+            BatchRequest(
+                custom_id=f"conclusion-{statement_id}",
+                model=self.options.openai_model_conclusion,
+                system_prompt=final_conclusion.SYSTEM_PROMPT,
+                user_content=output_markdown(claim_checks, texts[statement_id], None),
+            )
+            for statement_id, claim_checks in results.items()
+        ]
+        conclusions = self.run_stage("conclusion", conclusion_requests, Conclusion)
+        self.fail(
+            [statement_id for statement_id in results if f"conclusion-{statement_id}" not in conclusions],
+            "conclusion failed",
+        )
+
+        return {
+            statement_id: (conclusions[f"conclusion-{statement_id}"], claim_checks, texts[statement_id])
+            for statement_id, claim_checks in results.items()
+            if f"conclusion-{statement_id}" in conclusions
+        }
+
+    def fail(self, statement_ids: list[str], error: str) -> None:
+        for statement_id in statement_ids:
+            logger.warning("Batch statement failed", statement_id=statement_id, error=error)
+            self.errors[statement_id] = error
+
+    def build_check_requests(
+        self, claims: dict[str, list[Claim]]
+    ) -> tuple[list[BatchRequest], dict[str, dict], dict[str, str]]:
+        """
+        Fact-check requests of the claims with their sources by custom id, and the statements a
+        search failed for with the error. The statements that failed get no requests.
+        """
+        sources_path = os.path.join(self.options.batch_dir, "check.sources.json")
+        digest = state_digest(
+            {
+                "claims": {
+                    statement_id: [claim.model_dump() for claim in statement_claims]
+                    for statement_id, statement_claims in claims.items()
+                },
+                "settings": (
+                    self.options.search_engine,
+                    self.options.validation_checks_per_claim,
+                    self.options.same_site_allowed,
+                    self.options.search_extract_article_length,
+                    self.options.search_extract_article_overlap,
+                    self.options.search_extract_chunk_tokens,
+                    self.options.search_extract_chunk_overlap_tokens,
+                    self.options.max_chunks_per_source,
+                    self.options.factcheck_batch_tokens,
+                    self.options.openai_model_factcheck,
+                ),
+            }
+        )
+        if os.path.isfile(sources_path):
+            with open(sources_path, "r") as file:
+                stored = json.load(file)
+            if stored.get("digest") == digest:
+                return [BatchRequest(**request) for request in stored["requests"]], stored["sources"], {}
+            logger.warning(f"Ignoring batch sources of other claims", path=sources_path)
+
+        source_registry = SourceRegistry()
+
+        async def search_all() -> list[list[SearchResults]]:
+            semaphore = asyncio.Semaphore(self.options.claims_concurrency)
+
+            async def search(claim: Claim) -> list[SearchResults] | Exception:
+                async with semaphore:
+                    try:
+                        return await asyncio.to_thread(
+                            SearchClient(
+                                self.factuality.search_cache, self.factuality.article_store, source_registry
+                            ).search,
+                            self.options.search_engine,
+                            claim.claim,
+                            claim.reference,
+                            self.options,
+                        )
+                    except Exception as e:
+                        logger.warning(f"Error searching for claim {claim.claim}: {e}")
+                        return e
+
+            return await asyncio.gather(
+                *[search(claim) for statement_claims in claims.values() for claim in statement_claims]
+            )
+
+        found = {}
+        search_errors = {}
+        searched = iter(asyncio.run(search_all()))
+        for statement_id, statement_claims in claims.items():
+            for claim_index in range(len(statement_claims)):
+                found[statement_id, claim_index] = next(searched)
+                if isinstance(found[statement_id, claim_index], Exception):
+                    search_errors.setdefault(statement_id, str(found[statement_id, claim_index]))
+        requests = []
+        sources = {}
+        for statement_id, statement_claims in claims.items():
+            if statement_id in search_errors:
+                continue
+            for claim_index, claim in enumerate(statement_claims):
+                sources_used = []
+                for source in found[statement_id, claim_index]:
+                    if len(sources_used) >= self.options.validation_checks_per_claim:
+                        break
+                    domain = urlparse(source.url)[1]
+                    if not self.options.same_site_allowed and domain in sources_used:
+                        continue
+                    settings = (
+                        self.options.search_extract_article_length,
+                        self.options.search_extract_article_overlap,
+                        self.options.search_extract_chunk_tokens,
+                        self.options.search_extract_chunk_overlap_tokens,
+                        self.options.openai_model_factcheck,
+                    )
+                    chunks = rank_chunks(
+                        f"{claim.claim} {claim.verification_query}",
+                        source_registry.chunks(
+                            source.url, settings, lambda: split_source(source.text, *settings)
+                        ),
+                        self.options.max_chunks_per_source,
+                    )
+                    batch = next(
+                        batch_chunks(chunks, self.options.factcheck_batch_tokens, self.options.openai_model_factcheck),
+                        None,
+                    )
+                    if batch is None:
+                        continue
+                    system_prompt, user_content, _ = batch_request(claim, batch)
+                    custom_id = f"check-{statement_id}-{claim_index}-{len(sources_used)}"
+                    requests.append(
+                        BatchRequest(
+                            custom_id=custom_id,
+                            model=self.options.openai_model_factcheck,
+                            system_prompt=system_prompt,
+                            user_content=user_content,
+                        )
+                    )
+                    sources[custom_id] = {"statement_id": statement_id, "claim_index": claim_index, "url": source.url}
+                    sources_used.append(domain)
+
+        logger.info(f"Source registry stats", **source_registry.stats())
+        # with failed searches the next run searches again instead of reusing the state
+        if len(search_errors) == 0:
+            with open(sources_path, "w") as file:
+                json.dump(
+                    {"digest": digest, "requests": [request.model_dump() for request in requests], "sources": sources},
+                    file,
+                )
+        return requests, sources, search_errors
+
+    def collect_claim_checks(
+        self, claims: dict[str, list[Claim]], checked_sources: dict[str, dict], checked: dict[str, BaseModel]
+    ) -> dict[str, list[ClaimChecked]]:
+        results: dict[str, list[ClaimChecked]] = {}
+        for statement_id, statement_claims in claims.items():
+            results[statement_id] = []
+            for claim_index, claim in enumerate(statement_claims):
+                claim_checks = []
+                for custom_id, source in checked_sources.items():
+                    if source["statement_id"] != statement_id or source["claim_index"] != claim_index:
+                        continue
+                    if custom_id not in checked:
+                        continue
+                    payload = batch_verdict(checked[custom_id])
+                    claim_checks.append(
+                        ClaimChecked(
+                            claim=claim.claim,
+                            reference=claim.reference,
+                            verification_query=claim.verification_query,
+                            result=payload.result,
+                            source_reference=source["url"],
+                            source_quote=payload.source_quote if payload.result != ResultType.INCONCLUSIVE else None,
+                        )
+                    )
+                if len(claim_checks) == 0:
+                    claim_checks.append(
+                        ClaimChecked(
+                            claim=claim.claim,
+                            reference=claim.reference,
+                            verification_query=claim.verification_query,
+                            result=ResultType.INCONCLUSIVE,
+                            source_reference=None,
+                            source_quote=None,
+                        )
+                    )
+                results[statement_id] += claim_checks
+        return results
+
+    def run_stage(self, stage: str, requests: list[BatchRequest], *response_formats: type[T]) -> dict[str, T]:
+        """
+        Answer the requests of a stage through the cache and the batch backend, by custom id.
+        """
+        responses: dict[str, T] = {}
+        pending: list[tuple[BatchRequest, type[T], str]] = []
+        for request in requests:
+            response_format = self.response_format(request, response_formats)
+            key = cache_key(
+                request.model, request.system_prompt, request.user_content, response_format.model_json_schema()
+            )
+            cached = self.factuality.llm_cache.get(key) if self.factuality.llm_cache is not None else None
+            if cached is not None:
+                responses[request.custom_id] = response_format.model_validate_json(cached)
+            else:
+                pending.append((request, response_format, key))
+        logger.info(f"Batch stage", stage=stage, requests=len(requests), cached=len(responses))
+        if len(pending) == 0:
+            return responses
+
+        # the digest covers the cached requests too, so a resumed stage matches however many got cached
+        digest = state_digest([(request.custom_id, request.model_dump()) for request in requests])
+        with span(f"batch_{stage}", requests=len(pending)):
+            output = self.submit_and_wait(stage, pending, digest)
+        by_id = {request.custom_id: (response_format, key) for request, response_format, key in pending}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            answer = json.loads(line)
+            custom_id = answer["custom_id"]
+            if answer.get("error") or answer.get("response") is None or answer["response"]["status_code"] != 200:
+                logger.warning(f"Batch request failed", stage=stage, custom_id=custom_id, error=answer.get("error"))
+                continue
+            if custom_id not in by_id:
+                logger.warning(f"Unknown batch response", stage=stage, custom_id=custom_id)
+                continue
+            response_format, key = by_id[custom_id]
+            usage = answer["response"]["body"].get("usage")
+            if usage is not None:
+                record_llm_usage(
+                    answer["response"]["body"].get("model", ""),
+                    usage.get("prompt_tokens", 0),
+                    usage.get("completion_tokens", 0),
+                    stage=f"batch_{stage}",
+                )
+            try:
+                content = answer["response"]["body"]["choices"][0]["message"]["content"]
+                responses[custom_id] = response_format.model_validate_json(content)
+            except Exception as e:
+                logger.warning(f"Invalid batch response", stage=stage, custom_id=custom_id, error=str(e))
+                continue
+            if self.factuality.llm_cache is not None:
+                self.factuality.llm_cache.set(key, responses[custom_id].model_dump_json().encode("utf-8"))
+        return responses
+
+    def submit_and_wait(
+        self, stage: str, pending: list[tuple[BatchRequest, type[BaseModel], str]], digest: str
+    ) -> str:
+        input_path = os.path.join(self.options.batch_dir, f"{stage}.jsonl")
+        batch_id_path = os.path.join(self.options.batch_dir, f"{stage}.batch")
+        output_path = os.path.join(self.options.batch_dir, f"{stage}.output.jsonl")
+        digest_path = os.path.join(self.options.batch_dir, f"{stage}.digest")
+        stored_digest = None
+        if os.path.isfile(digest_path):
+            with open(digest_path, "r") as file:
+                stored_digest = file.read().strip()
+        if stored_digest != digest:
+            for path in (batch_id_path, output_path):
+                if os.path.isfile(path):
+                    logger.warning(f"Ignoring batch state of other requests", stage=stage, path=path)
+                    os.remove(path)
+            with open(digest_path, "w") as file:
+                file.write(digest)
+
+        if os.path.isfile(output_path):
+            with open(output_path, "r") as file:
+                return file.read()
+
+        if os.path.isfile(batch_id_path):
+            with open(batch_id_path, "r") as file:
+                batch_id = file.read().strip()
+        else:
+            with open(input_path, "w") as file:
+                for request, response_format, _ in pending:
+                    file.write(
+                        json.dumps(
+                            {
+                                "custom_id": request.custom_id,
+                                "method": "POST",
+                                "url": COMPLETIONS_ENDPOINT,
+                                "body": request.body(response_format),
+                            }
+                        )
+                        + "\n"
+                    )
+            batch_id = self.backend.submit(input_path)
+            with open(batch_id_path, "w") as file:
+                file.write(batch_id)
+            logger.info(f"Batch submitted", stage=stage, batch_id=batch_id, requests=len(pending))
+
+        while True:
+            try:
+                output = self.backend.poll(batch_id)
+            except BatchFailedError:
+                # the next run submits the stage again instead of polling the dead batch
+                os.remove(batch_id_path)
+                raise
+            if output is not None:
+                break
+            logger.info(f"Waiting for batch", stage=stage, batch_id=batch_id)
+            time.sleep(self.options.batch_poll_interval)
+        with open(output_path, "w") as file:
+            file.write(output)
+        return output
+
+    @staticmethod
+    def response_format(request: BatchRequest, response_formats: tuple[type[T], ...]) -> type[T]:
+        # a check request of several chunks uses the batch prompt and answers per chunk
+        if len(response_formats) > 1 and request.system_prompt == fact_check.BATCH_SYSTEM_PROMPT:
+            return response_formats[1]
+        return response_formats[0]
@@ -0,0 +1,38 @@
+from typing import Literal
+from pydantic import BaseModel
+from factuality.claim_splitter.claim_splitter import Claim
+from factuality.fact_check.fact_check import ClaimChecked
+from factuality.final_conclusion.final_conclusion import Conclusion
+
+
+class ClaimsExtracted(BaseModel):
+    type: Literal["claims_extracted"] = "claims_extracted"
+    statement: str
+    claims: list[Claim]
+
+
+class SearchDone(BaseModel):
+    type: Literal["search_done"] = "search_done"
+    claim: str
+    urls: list[str]
+
+
+class SourceChecked(BaseModel):
+    type: Literal["source_checked"] = "source_checked"
+    claim_check: ClaimChecked
+
+
+class ClaimFinished(BaseModel):
+    type: Literal["claim_finished"] = "claim_finished"
+    index: int
+    claim_checks: list[ClaimChecked]
+
+
+class ConclusionReady(BaseModel):
+    type: Literal["conclusion"] = "conclusion"
+    statement: str
+    claim_checks: list[ClaimChecked]
+    conclusion: Conclusion
+
+
+Event = ClaimsExtracted | SearchDone | SourceChecked | ClaimFinished | ConclusionReady
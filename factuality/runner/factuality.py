@@ -1,63 +1,225 @@
 import os
 from factuality.final_conclusion.final_conclusion import Conclusion
-from factuality.fact_check.fact_check import ClaimChecked, check_claim
+from factuality.fact_check.fact_check import ClaimChecked, check_claim, load_encoding
 from factuality.claim_splitter import claim_splitter
+from factuality.claim_splitter.claim_splitter import Claim
+from factuality.claim_index.claim_index import ClaimIndex
+from factuality.search import extraction
+from factuality.search.article_store import ArticleStore
 from factuality.search.search import SearchClient
+from factuality.search.source_registry import SourceRegistry
 from factuality.result_output.markdown import output_markdown
 from factuality.final_conclusion.final_conclusion import final_conclusion
+from factuality.llm import llm
+from factuality.utils.cache import MemoryCache, SqliteCache, TieredCache
+from factuality.runner.events import ClaimFinished, ClaimsExtracted, ConclusionReady, Event, SearchDone, SourceChecked
+from factuality.utils import http, scheduler
+from factuality.utils.metrics import span
 from factuality.utils.options import Options
 import asyncio
+from typing import AsyncIterator, Awaitable, Callable
+import structlog
+
+logger = structlog.get_logger(__name__)
 
 
 class Factuality:
     def __init__(self, options: Options):
         self.options = options
+        self.llm_cache = None
+        if options.cache_dir:
+            self.llm_cache = SqliteCache(
+                os.path.join(options.cache_dir, "llm.sqlite"),
+                "llm_responses",
+                options.llm_cache_ttl,
+                options.llm_cache_max_entries,
+            )
+        llm.configure(options.openai_max_in_flight, self.llm_cache)
+        retries = {
+            "max_attempts": options.retry_max_attempts,
+            "breaker_threshold": options.circuit_breaker_threshold,
+            "breaker_reset": options.circuit_breaker_reset,
+        }
+        scheduler.configure(
+            "openai",
+            requests_per_minute=options.openai_requests_per_minute,
+            tokens_per_minute=options.openai_tokens_per_minute,
+            **retries,
+        )
+        for search_engine in ("bing", "google", "tavily"):
+            scheduler.configure(search_engine, requests_per_minute=options.search_requests_per_minute, **retries)
+        extraction.configure(options.search_extraction_engine)
+        http.configure(
+            options.http_max_connections,
+            options.http_max_connections_per_host,
+            options.http_timeout,
+            options.http_connect_timeout,
+            options.http_dns_cache_ttl,
+        )
+        self.search_cache = TieredCache(
+            MemoryCache(options.search_cache_ttl, options.search_cache_memory_entries),
+            SqliteCache(
+                os.path.join(options.cache_dir, "search.sqlite"),
+                "search_responses",
+                options.search_cache_ttl,
+                options.search_cache_max_entries,
+            )
+            if options.cache_dir
+            else None,
+        )
+        self.article_store = None
+        if options.cache_dir:
+            self.article_store = ArticleStore(
+                os.path.join(options.cache_dir, "articles.sqlite"),
+                options.article_store_ttl,
+                options.article_store_max_bytes,
+            )
+        self.claim_index = None
+        if options.cache_dir and options.claim_index_ttl > 0:
+            self.claim_index = ClaimIndex(
+                os.path.join(options.cache_dir, "claims.sqlite"),
+                options.claim_index_ttl,
+                options.claim_index_similarity,
+            )
 
     def check(self, pathOrText: str) -> tuple[Conclusion, list[ClaimChecked], str]:
-        statement = ""
+        return asyncio.run(self.check_async(pathOrText))
+
+    @staticmethod
+    def read_statement(pathOrText: str) -> str:
         if os.path.isfile(pathOrText):
             with open(pathOrText, "r") as file:
-                statement = file.read()
-        else:
-            statement = pathOrText
+                return file.read()
+        return pathOrText
 
-        claims = asyncio.run(
-            claim_splitter.extract_claims(
+    async def check_async(self, pathOrText: str) -> tuple[Conclusion, list[ClaimChecked], str]:
+        return await self.check_statement(self.read_statement(pathOrText))
+
+    async def check_stream(self, statement: str) -> AsyncIterator[Event]:
+        """
+        Fact-check the statement text and yield its events as they happen, the last one is
+        `ConclusionReady` with the full result.
+        """
+        queue: asyncio.Queue[Event] = asyncio.Queue()
+        task = asyncio.create_task(self.check_statement(statement, queue.put))
+        try:
+            while not task.done() or not queue.empty():
+                if not queue.empty():
+                    yield queue.get_nowait()
+                    continue
+                get = asyncio.ensure_future(queue.get())
+                await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+                if get.done():
+                    yield get.result()
+                else:
+                    get.cancel()
+            # surface errors of the check
+            task.result()
+        finally:
+            task.cancel()
+
+    async def check_statement(
+        self,
+        statement: str,
+        emit: Callable[[Event], Awaitable[None]] | None = None,
+    ) -> tuple[Conclusion, list[ClaimChecked], str]:
+        """
+        Fact-check the statement text, `emit` is awaited with every event of the run.
+        """
+        with span("statement") as fields:
+            emit = emit or _ignore_event
+            claims = await claim_splitter.extract_claims(
                 statement, self.options.oai_api_key, self.options.openai_model_extract
             )
-        )
-        results: list[ClaimChecked] = []
-        for claim in claims:
-            search_client = SearchClient()
-            search_results = search_client.search(
-                self.options.search_engine,
-                claim.claim,
-                claim.reference,
-                self.options,
-            )
-            checked_claim = asyncio.run(
-                check_claim(
-                    claim,
-                    search_results,
-                    self.options.validation_checks_per_claim,
-                    self.options.same_site_allowed,
-                    self.options.search_extract_article_length,
-                    self.options.search_extract_article_overlap,
-                    self.options.oai_api_key,
-                    self.options.openai_model_factcheck,
-                )
+            await emit(ClaimsExtracted(statement=statement, claims=claims))
+            if self.options.search_extract_chunk_tokens > 0 or self.options.factcheck_batch_tokens > 0:
+                await load_encoding(self.options.openai_model_factcheck)
+
+            # every claim runs search -> download -> fact check at the same time,
+            # bounded by claims_concurrency; gather keeps the original claim order
+            semaphore = asyncio.Semaphore(self.options.claims_concurrency)
+            # claims of one statement often find the same pages, download and split them once
+            source_registry = SourceRegistry()
+            checked_claims = await asyncio.gather(
+                *[
+                    self._check_single_claim(index, claim, semaphore, emit, source_registry)
+                    for index, claim in enumerate(claims)
+                ]
             )
-            results += checked_claim
+            results: list[ClaimChecked] = []
+            for checked_claim in checked_claims:
+                results += checked_claim
+            fields["claims"] = len(claims)
 
-        final_conclusion_result = asyncio.run(
-            final_conclusion(
+            final_conclusion_result = await final_conclusion(
                 output_markdown(results, statement, None),
                 self.options.oai_api_key,
                 self.options.openai_model_conclusion,
             )
-        )
+            if self.llm_cache is not None:
+                logger.info(f"LLM cache stats", **self.llm_cache.stats())
+            logger.info(f"Search cache stats", **self.search_cache.stats())
+            if self.article_store is not None:
+                logger.info(f"Article store stats", **self.article_store.stats())
+            if self.claim_index is not None:
+                logger.info(f"Claim index stats", **self.claim_index.stats())
+            logger.info(f"Source registry stats", **source_registry.stats())
+            await emit(
+                ConclusionReady(statement=statement, claim_checks=results, conclusion=final_conclusion_result)
+            )
         return (final_conclusion_result, results, statement)
 
+    async def _check_single_claim(
+        self,
+        index: int,
+        claim: Claim,
+        semaphore: asyncio.Semaphore,
+        emit: Callable[[Event], Awaitable[None]],
+        source_registry: SourceRegistry | None = None,
+    ) -> list[ClaimChecked]:
+        async def on_search_done(urls: list[str]) -> None:
+            await emit(SearchDone(claim=claim.claim, urls=urls))
+
+        async def on_source_checked(claim_check: ClaimChecked) -> None:
+            await emit(SourceChecked(claim_check=claim_check))
+
+        if self.claim_index is not None:
+            claim_checks = await asyncio.to_thread(self.claim_index.lookup, claim)
+            if claim_checks is not None:
+                await emit(ClaimFinished(index=index, claim_checks=claim_checks))
+                return claim_checks
+
+        async with semaphore:
+            search_results = SearchClient(
+                self.search_cache, self.article_store, source_registry
+            ).search_stream(
+                self.options.search_engine,
+                claim.claim,
+                claim.reference,
+                self.options,
+                on_search_done,
+            )
+            claim_checks = await check_claim(
+                claim,
+                search_results,
+                self.options.validation_checks_per_claim,
+                self.options.same_site_allowed,
+                self.options.search_extract_article_length,
+                self.options.search_extract_article_overlap,
+                self.options.oai_api_key,
+                self.options.openai_model_factcheck,
+                self.options.max_chunks_per_source,
+                self.options.search_extract_chunk_tokens,
+                self.options.search_extract_chunk_overlap_tokens,
+                self.options.factcheck_batch_tokens,
+                on_source_checked,
+                source_registry,
+            )
+        if self.claim_index is not None:
+            await asyncio.to_thread(self.claim_index.add, claim, claim_checks)
+        await emit(ClaimFinished(index=index, claim_checks=claim_checks))
+        return claim_checks
+
     def convert_conclusions_to_markdown(
         self,
         results: list[ClaimChecked],
@@ -65,3 +227,7 @@ class Factuality:
         final_conclusion_result: Conclusion,
     ):
         return output_markdown(results, statement, final_conclusion_result)
+
+
+async def _ignore_event(event: Event) -> None:
+    pass
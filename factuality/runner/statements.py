@@ -0,0 +1,157 @@
+import asyncio
+import csv
+import json
+import os
+import sys
+from typing import Callable, Iterable, Iterator, TextIO
+from factuality.result_output.json_output import output_json
+from factuality.runner.factuality import Factuality
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class MalformedRow(ValueError):
+    """
+    A line of the input that isn't a row, read in place of its statement so the line is
+    reported as failed and the rest of the input is still checked.
+    """
+
+
+def read_statements(source: str, input_format: str = "auto") -> Iterator[tuple[str, str | MalformedRow]]:
+    """
+    (id, statement) pairs from a JSONL or CSV file with `id` and `statement` fields, `-` reads
+    stdin. `auto` picks CSV for .csv files and JSONL otherwise, on stdin it looks at the first
+    line. Lines are read lazily, so a pipe can keep feeding statements while others are checked.
+    Missing ids are replaced by the line number, JSONL lines that aren't an object come with
+    their line number and a `MalformedRow`.
+    """
+    file = sys.stdin if source == "-" else open(source, "r", newline="")
+    try:
+        lines = iter(file)
+        if input_format == "auto":
+            if source != "-":
+                input_format = "csv" if source.lower().endswith(".csv") else "jsonl"
+            else:
+                first = next(lines, "")
+                input_format = "jsonl" if first.lstrip().startswith("{") else "csv"
+                lines = _chain(first, lines)
+
+        if input_format == "csv":
+            rows = enumerate(csv.DictReader(lines), start=1)
+        elif input_format == "jsonl":
+            rows = _jsonl_rows(lines)
+        else:
+            raise ValueError(f"Unsupported input format: {input_format}")
+
+        for number, row in rows:
+            if isinstance(row, MalformedRow):
+                logger.warning(f"Skipping malformed row", row=number, error=str(row))
+                yield (str(number), row)
+                continue
+            statement = (row.get("statement") or "").strip()
+            if not statement:
+                logger.warning(f"Skipping row without statement", row=number)
+                continue
+            statement_id = row.get("id")
+            yield (str(statement_id) if statement_id not in (None, "") else str(number), statement)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def _jsonl_rows(lines: Iterator[str]) -> Iterator[tuple[int, dict | MalformedRow]]:
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield (number, MalformedRow(f"Invalid JSON on line {number}: {e}"))
+            continue
+        if not isinstance(row, dict):
+            yield (number, MalformedRow(f"Line {number} is not a JSON object"))
+            continue
+        yield (number, row)
+
+
+def _chain(first: str, lines: Iterator[str]) -> Iterator[str]:
+    if first:
+        yield first
+    yield from lines
+
+
+def completed_ids(path: str) -> set[str]:
+    """
+    Ids that already have a result in the JSONL output, failed ones are checked again.
+    """
+    if not path or not os.path.isfile(path):
+        return set()
+    ids = set()
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # a run killed in the middle of writing leaves a partial last line
+                continue
+            if "factuality" in result:
+                ids.add(str(result["id"]))
+    return ids
+
+
+async def check_statements(
+    factuality: Factuality,
+    statements: Iterable[tuple[str, str | MalformedRow]],
+    workers: int,
+    write: Callable[[dict], None],
+    skip: set[str] | None = None,
+) -> tuple[int, int]:
+    """
+    Fact-check the (id, statement) pairs with `workers` statements in flight, every result is
+    passed to `write` as soon as it is done (in the json output format, or `{"id", "error"}`).
+    Ids in `skip` are not checked and malformed rows fail without a check. Returns how many
+    were done and failed.
+    """
+    skip = skip or set()
+    statements = iter(statements)
+    read_lock = asyncio.Lock()
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+
+    async def next_statement() -> tuple[str, str | MalformedRow] | None:
+        # reading may block on a pipe, keep the loop free for the running checks
+        async with read_lock:
+            while True:
+                item = await asyncio.to_thread(next, statements, None)
+                if item is None or item[0] not in skip:
+                    return item
+                counts["skipped"] += 1
+
+    async def worker() -> None:
+        while (item := await next_statement()) is not None:
+            statement_id, statement = item
+            if isinstance(statement, MalformedRow):
+                counts["failed"] += 1
+                write({"id": statement_id, "error": str(statement)})
+                continue
+            try:
+                conclusion, checked_claims, _ = await factuality.check_statement(statement)
+            except Exception as e:
+                logger.warning(f"Error checking statement {statement_id}: {e}")
+                counts["failed"] += 1
+                write({"id": statement_id, "error": str(e)})
+                continue
+            counts["done"] += 1
+            write(output_json(statement_id, statement, checked_claims, conclusion))
+
+    await asyncio.gather(*[worker() for _ in range(max(1, workers))])
+    logger.info(f"Checked statements", **counts)
+    return counts["done"], counts["failed"]
+
+
+def jsonl_writer(output: TextIO) -> Callable[[dict], None]:
+    def write(result: dict) -> None:
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+
+    return write
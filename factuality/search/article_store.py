@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+TRACKING_PARAMETERS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ref_src")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalize an url so that the same page found through different links maps to one entry.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith(TRACKING_PARAMETERS)
+        )
+    )
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+@dataclass
+class StoredArticle:
+    url: str
+    text: str
+    fetched_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at <= ttl
+
+
+class ArticleStore:
+    """
+    Persistent store of parsed article text keyed by canonical url.
+
+    Text is stored zlib compressed, the total compressed size is capped at `max_bytes`
+    by evicting the least recently used articles. Articles older than `ttl` are kept
+    around so they can be revalidated with their ETag / Last-Modified headers.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS articles (
+                    url TEXT PRIMARY KEY,
+                    text BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS articles_accessed_at ON articles (accessed_at)"
+            )
+            self._connection.commit()
+
+    def get(self, url: str) -> StoredArticle | None:
+        key = canonical_url(url)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT text, etag, last_modified, fetched_at FROM articles WHERE url = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE articles SET accessed_at = ? WHERE url = ?", (time.time(), key)
+            )
+            self._connection.commit()
+        self.hits += 1
+        return StoredArticle(
+            url=key,
+            text=zlib.decompress(row[0]).decode("utf-8"),
+            etag=row[1],
+            last_modified=row[2],
+            fetched_at=row[3],
+        )
+
+    def set(self, url: str, text: str, etag: str | None = None, last_modified: str | None = None) -> None:
+        key = canonical_url(url)
+        compressed = zlib.compress(text.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                """INSERT OR REPLACE INTO articles (url, text, size, etag, last_modified, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (key, compressed, len(compressed), etag, last_modified, now, now),
+            )
+            self._evict()
+            self._connection.commit()
+
+    def touch(self, url: str) -> None:
+        """
+        Mark a stored article as fetched now, after the server confirmed it did not change.
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE articles SET fetched_at = ? WHERE url = ?", (time.time(), canonical_url(url))
+            )
+            self._connection.commit()
+        self.revalidated += 1
+
+    def _evict(self) -> None:
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM articles").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self._connection.execute(
+            "SELECT url, size FROM articles ORDER BY accessed_at ASC"
+        ).fetchall():
+            self._connection.execute("DELETE FROM articles WHERE url = ?", (url,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "hit_rate": self.hits / requests if requests > 0 else 0.0,
+        }
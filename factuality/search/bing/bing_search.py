@@ -1,5 +1,5 @@
 import os
-import requests
+from factuality.utils import http
 
 class BingSearchClient:
     def __init__(self, subscription_key, endpoint):
@@ -28,7 +28,7 @@ class BingSearchClient:
         params['q'] = q
 
         try:
-            response = requests.get(self.endpoint, headers=headers, params=params)
+            response = http.get(self.endpoint, headers=headers, params=params)
             response.raise_for_status()
 
             return response.json()
@@ -0,0 +1,235 @@
+"""
+Main text extraction of downloaded pages. This module is imported by every worker process of
+the extraction pool, its imports are kept to the standard library (the engines import their
+parsers) so the workers start fast, and failures are reported by the downloads in the parent.
+"""
+import io
+import re
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+# elements whose text is part of the article
+BLOCK_TAGS = frozenset(
+    {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "blockquote", "pre", "td", "dd", "dt", "figcaption"}
+)
+# elements whose text never is
+SKIP_TAGS = frozenset(
+    {
+        "script", "style", "noscript", "template", "svg", "iframe",
+        "nav", "header", "footer", "aside", "form", "button", "select",
+    }
+)
+# class and id names of page furniture, unless they also look like the content (readability's candidates)
+UNLIKELY_PATTERN = re.compile(
+    r"comment|footer|sidebar|menu|nav|share|social|promo|related|advert|sponsor"
+    r"|cookie|banner|breadcrumb|popup|modal|newsletter",
+    re.I,
+)
+LIKELY_PATTERN = re.compile(r"article|content|main|body|post|entry|story|text", re.I)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# blocks shorter than this are kept with the content but don't make a container look like one
+MIN_BLOCK_LENGTH = 25
+# the lightweight extractors fall back to newspaper when they find less text than this
+MIN_TEXT_LENGTH = 200
+
+
+class ExtractionEngine:
+    """
+    Main text of an HTML page. Engines run in the worker processes of the extraction pool,
+    so they must be importable and constructible without arguments.
+    """
+
+    name = ""
+
+    def extract(self, html: str, url: str) -> str:
+        raise NotImplementedError
+
+
+class LxmlEngine(ExtractionEngine):
+    """
+    Readability style scorer over a single streaming lxml pass. Text blocks are collected as
+    their elements end and the elements are cleared right away, so the page is never held as a
+    full DOM. Every block scores for its parent (and half for the grandparent) by its length and
+    commas, discounted by its share of link text, and the blocks below the best scoring container
+    are the article.
+    """
+
+    name = "lxml"
+
+    def extract(self, html: str, url: str) -> str:
+        from lxml import etree
+
+        blocks = []
+        skipped = 0
+        parser = etree.iterparse(
+            io.BytesIO(html.encode("utf-8")),
+            events=("start", "end"),
+            html=True,
+            encoding="utf-8",
+            recover=True,
+            remove_comments=True,
+            remove_pis=True,
+            no_network=True,
+            huge_tree=True,
+        )
+        for event, element in parser:
+            if not isinstance(element.tag, str):
+                continue
+            unlikely = is_unlikely(element)
+            if event == "start":
+                skipped += unlikely
+                continue
+            if unlikely:
+                skipped -= 1
+                element.clear(keep_tail=True)
+            elif skipped == 0 and element.tag.lower() in BLOCK_TAGS:
+                text = normalize_text(" ".join(element.itertext()))
+                if text:
+                    link_length = sum(len(normalize_text(" ".join(link.itertext()))) for link in element.iter("a"))
+                    blocks.append((element.getparent(), text, link_length / len(text)))
+                # nested blocks are already collected, only the tail belongs to the parent
+                element.clear(keep_tail=True)
+
+        scores: dict = {}
+        for parent, text, link_density in blocks:
+            if parent is None or len(text) < MIN_BLOCK_LENGTH:
+                continue
+            score = (1 + text.count(",") + min(len(text) // 100, 3)) * (1 - link_density)
+            scores[parent] = scores.get(parent, 0) + score
+            grandparent = parent.getparent()
+            if grandparent is not None:
+                scores[grandparent] = scores.get(grandparent, 0) + score / 2
+        if len(scores) == 0:
+            return ""
+        top = max(scores, key=scores.get)
+        return "\n\n".join(
+            text
+            for parent, text, link_density in blocks
+            if link_density < 0.5 and parent is not None and (parent is top or top in parent.iterancestors())
+        )
+
+
+class NewspaperEngine(ExtractionEngine):
+    """
+    newspaper3k's parser, slower (full DOM plus nltk) but tuned on many news sites.
+    """
+
+    name = "newspaper"
+
+    def extract(self, html: str, url: str) -> str:
+        from newspaper import Article
+
+        article = Article(url)
+        article.download(input_html=html)
+        article.parse()
+        return article.text
+
+
+ENGINES: dict[str, type[ExtractionEngine]] = {engine.name: engine for engine in (LxmlEngine, NewspaperEngine)}
+
+
+def is_unlikely(element) -> bool:
+    if element.tag.lower() in SKIP_TAGS:
+        return True
+    names = f"{element.get('class', '')} {element.get('id', '')}"
+    return bool(UNLIKELY_PATTERN.search(names)) and not LIKELY_PATTERN.search(names)
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def extract(engine: str, html: str, url: str) -> tuple[str, str]:
+    """
+    Main text of the page and the engine that found it, pages the engine finds (almost)
+    nothing in are parsed with newspaper as well and the longer text wins.
+    """
+    try:
+        text = ENGINES[engine]().extract(html, url)
+    except Exception:
+        if engine == NewspaperEngine.name:
+            raise
+        text = ""
+    if engine == NewspaperEngine.name or len(text) >= MIN_TEXT_LENGTH:
+        return text, engine
+    try:
+        fallback = NewspaperEngine().extract(html, url)
+    except Exception:
+        if text:
+            return text, engine
+        raise
+    if len(fallback) > len(text):
+        return fallback, NewspaperEngine.name
+    return text, engine
+
+
+_engine: str = "lxml"
+_workers: int = 0
+_executor: "ProcessPoolExecutor | None" = None
+_lock = threading.Lock()
+
+
+def configure(engine: str, workers: int | None = None) -> None:
+    """
+    Set the extraction engine and the size of the process pool (0 extracts in the calling
+    thread, None keeps the current size), the pool is started on the first extraction.
+    Only the entry points size the pool, library use extracts in the calling thread.
+    """
+    global _engine, _workers, _executor
+    if engine not in ENGINES:
+        raise ValueError(f"Unsupported extraction engine: {engine}. Supported: {', '.join(ENGINES)}")
+    with _lock:
+        if workers is None:
+            workers = _workers
+        if _executor is not None and workers != _workers:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        _engine = engine
+        _workers = workers
+
+
+def _get_executor() -> "ProcessPoolExecutor":
+    global _executor
+    with _lock:
+        if _executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # forking a process full of threads and open connections isn't safe
+            _executor = ProcessPoolExecutor(
+                max_workers=_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def warm_up() -> None:
+    """
+    Start the pool with one worker without waiting for it, called when a download starts so
+    the process is spawned while the first page is still being fetched.
+    """
+    if _workers > 0 and _executor is None:
+        _get_executor().submit(normalize_text, "")
+
+
+def extract_text(html: str, url: str) -> tuple[str, str]:
+    """
+    `extract` with the configured engine, in the process pool so a burst of downloads
+    is parsed in parallel instead of taking turns on the GIL.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    global _executor
+    if _workers <= 0:
+        return extract(_engine, html, url)
+    executor = _get_executor()
+    try:
+        return executor.submit(extract, _engine, html, url).result()
+    except BrokenProcessPool:
+        # a worker died (killed or out of memory), the next extraction starts a new pool
+        with _lock:
+            if _executor is executor:
+                _executor = None
+        raise
@@ -1,5 +1,5 @@
 import os
-import requests
+from factuality.utils import http
 
 
 class GoogleSearchClient:
@@ -30,7 +30,7 @@ class GoogleSearchClient:
 
         params["q"] = q
         try:
-            response = requests.get(
+            response = http.get(
                 "https://www.googleapis.com/customsearch/v1", params=params
             )
             response.raise_for_status()
@@ -1,18 +1,30 @@
+import asyncio
+import json
 import os
-from enum import Enum
-from typing import Literal
-from factuality.search.bing.bing_search import BingSearchClient
-from newspaper import Article
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from functools import lru_cache
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable
 from pydantic import BaseModel
-from factuality.search.google.google_search import GoogleSearchClient
+from factuality.search.article_store import ArticleStore, canonical_url
+from factuality.search import extraction
+from factuality.search.source_registry import SourceRegistry
+from factuality.search.triage import relevance_ranking, triage
 from urllib.parse import urlparse
 
-from factuality.search.tavily.tavily_search import TavilySearchClient
+from factuality.utils import http
+from factuality.utils.cache import TieredCache, cache_key
+from factuality.utils.metrics import metrics, span
+from factuality.utils.scheduler import CircuitOpenError, get_scheduler
 from factuality.utils.options import Options
 import structlog
 
 logger = structlog.get_logger(__name__)
 
+# the user agent newspaper downloaded the pages with
+USER_AGENT = "newspaper/0.2.8"
+
 
 class SearchResults(BaseModel):
     url: str
@@ -24,75 +36,502 @@ def log_search_results(search_results):
             f.write(search_result['url'] + '\n')
 
 
+def search_cache_key(
+    search_engine: str,
+    query: str,
+    maximum_search_results: int,
+    allowlist: list[str],
+    blocklist: list[str],
+    include_content: bool = False,
+) -> str:
+    # case and whitespace differences don't change the results of the engines
+    normalized_query = " ".join(query.lower().split())
+    parts = [search_engine, normalized_query, maximum_search_results, sorted(allowlist), sorted(blocklist)]
+    if include_content:
+        # responses without the page content are still valid for the other keys
+        parts.append("content")
+    return cache_key(*parts)
+
+
+def engine_content(search_engine: str, options: Options) -> bool:
+    """
+    Whether the engine is asked for the page content of its hits, only Tavily returns it.
+    """
+    return search_engine == "tavily" and options.search_use_engine_content
+
+
+def parse_search_engines(search_engine: str) -> list[str]:
+    search_engines = []
+    for name in search_engine.split(","):
+        name = name.strip().lower()
+        if name and name not in search_engines:
+            search_engines.append(name)
+    return search_engines
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = 60) -> list[dict]:
+    """
+    Fuse the result lists of several engines, every result scores 1 / (k + rank) in every
+    list it appears in. Results are deduplicated by canonical url, the first title seen wins
+    and ties keep the order of the rankings.
+    """
+    scores: dict[str, float] = {}
+    results: dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            url = canonical_url(result["url"])
+            if url not in results:
+                results[url] = result
+                scores[url] = 0.0
+            scores[url] += 1 / (k + rank)
+    # sorted is stable, equal scores stay in first seen order
+    return [results[url] for url in sorted(results, key=lambda url: -scores[url])]
+
+
 class SearchClient:
+    def __init__(
+        self,
+        cache: TieredCache | None = None,
+        article_store: ArticleStore | None = None,
+        source_registry: SourceRegistry | None = None,
+    ):
+        self.cache = cache
+        self.article_store = article_store
+        self.source_registry = source_registry
+
     def search(
-        self, search_engine: Literal["google", "bing", "tavily"], query: str, reference: str, options: Options
+        self, search_engine: str, query: str, reference: str, options: Options
     ) -> list[SearchResults]:
+        search_results = self.find(search_engine, query, reference, options)
+        return download_articles(
+            [search_result["url"] for search_result in search_results],
+            options.search_download_workers,
+            options.search_download_timeout,
+            options.search_download_deadline,
+            self.article_store,
+            self.source_registry,
+            engine_contents(search_results),
+        )
+
+    async def search_stream(
+        self,
+        search_engine: str,
+        query: str,
+        reference: str,
+        options: Options,
+        on_search_done: Callable[[list[str]], Awaitable[None]] | None = None,
+    ) -> AsyncIterator[SearchResults]:
+        """
+        Lazy version of `search`, articles are only downloaded while the consumer keeps iterating
+        (plus `options.search_prefetch` articles ahead of it). `on_search_done` is awaited with
+        the result urls before the first download. Search failures are raised, a claim without
+        search results because of an outage or a wrong key isn't inconclusive.
+        """
+        search_results = await asyncio.to_thread(
+            self.find, search_engine, query, reference, options
+        )
+        if on_search_done is not None:
+            await on_search_done([search_result["url"] for search_result in search_results])
+        async with aclosing(
+            stream_articles(
+                [search_result["url"] for search_result in search_results],
+                options.search_prefetch,
+                options.search_download_timeout,
+                options.search_download_deadline,
+                self.article_store,
+                self.source_registry,
+                engine_contents(search_results),
+            )
+        ) as articles:
+            async for article in articles:
+                yield article
+
+    def find(
+        self, search_engine: str, query: str, reference: str, options: Options
+    ) -> list[dict]:
+        """
+        Ranked `{"url", "title", "snippet"}` results for the query (with the page `content`
+        when the engine supplied it). `search_engine` may name several comma separated engines,
+        which are combined according to `options.search_strategy`. The hits are triaged by their
+        snippets before anything is downloaded, see `triage`.
+        """
         logger.info(f"Searching for query", query=query, search_engine=search_engine)
-        search_results = []
+        search_engines = parse_search_engines(search_engine)
+        if len(search_engines) == 1:
+            search_results = self.engine_results(search_engines[0], query, options)
+        elif options.search_strategy == "fallback":
+            search_results = self.fallback_search(search_engines, query, options)
+        else:
+            search_results = self.fanout_search(search_engines, query, options)
+
+        search_results = triage(
+            search_results, query, options.search_skip_domains, options.search_min_snippet_relevance
+        )
+        # the engine order still counts, snippets are too short to judge a page by alone
+        search_results = reciprocal_rank_fusion([search_results, relevance_ranking(search_results)])
+
+        # log_search_results(search_results)
+
+        if reference:
+            search_results.insert(0,{"url": reference, "title": "Reference from statement"})
+        search_results_log = [
+            {"domain": urlparse(result["url"])[1], "title": result["title"]}
+            for result in search_results
+        ]
+        logger.info(f"Search results found", search_results=search_results_log)
+        return search_results
+
+    def engine_results(self, search_engine: str, query: str, options: Options) -> list[dict]:
+        with span("search", search_engine=search_engine):
+            search_results_raw = self.cached_search(search_engine, query, options)
         if search_engine == "bing":
-            search_results_raw = BingSearchClient(
-                options.bing_search_v7_subscription_key, options.bing_search_v7_endpoint
-            ).search(
-                query,
-                options.maximum_search_results,
-                options.allowlist,
-                options.blocklist,
-            )
-            search_results = [
-                {"url": search_result["url"], "title": search_result["name"]}
+            return [
+                {"url": search_result["url"], "title": search_result["name"], "snippet": search_result.get("snippet")}
                 for search_result in search_results_raw["webPages"]["value"]
             ]
         elif search_engine == "google":
-            search_results_raw = GoogleSearchClient(
-                options.google_search_api_key, options.google_search_cx
-            ).search(
+            return [
+                {"url": search_result["link"], "title": search_result["title"], "snippet": search_result.get("snippet")}
+                for search_result in search_results_raw["items"]
+                if search_result.get("fileFormat") is None
+            ]
+        return [
+            {
+                "url": search_result["url"],
+                "title": search_result["title"],
+                "snippet": search_result.get("content"),
+                "content": search_result.get("raw_content") if engine_content(search_engine, options) else None,
+            }
+            for search_result in search_results_raw["results"]
+            if search_result.get("fileFormat") is None
+        ]
+
+    def fanout_search(self, search_engines: list[str], query: str, options: Options) -> list[dict]:
+        """
+        Query all engines at the same time and fuse the rankings of those that answered within
+        `options.search_engine_deadline`. Engines that fail or are too slow are left out, only
+        if none answered in time the first one to answer is waited for.
+        """
+        executor = ThreadPoolExecutor(max_workers=len(search_engines))
+        futures = {
+            executor.submit(self.engine_results, search_engine, query, options): search_engine
+            for search_engine in search_engines
+            if get_scheduler(search_engine).breaker.available
+        }
+        try:
+            done, pending = wait(futures, timeout=options.search_engine_deadline)
+            rankings = self._collect_rankings(done, futures)
+            while len(rankings) == 0 and len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                rankings = self._collect_rankings(done, futures)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for future in pending:
+            logger.warning(f"Search engine too slow, skipped", search_engine=futures[future], query=query)
+        if len(rankings) == 0:
+            errors = [future.exception() for future in futures if future.done() and not future.cancelled()]
+            # no engine tried means all circuits are open
+            error = next((error for error in errors if error is not None), None) or CircuitOpenError(
+                "Every search engine is unavailable"
+            )
+            raise RuntimeError(f"No search engine answered for query {query}") from error
+        # keep the configured engine order, so ties go to the preferred engine
+        ordered = [rankings[search_engine] for search_engine in search_engines if search_engine in rankings]
+        return reciprocal_rank_fusion(ordered)[: options.maximum_search_results]
+
+    def fallback_search(self, search_engines: list[str], query: str, options: Options) -> list[dict]:
+        """
+        Query the engines one after another until one answers within `options.search_engine_deadline`,
+        engines whose circuit is open (failing or out of quota) are skipped until it is due for a trial
+        call. If every engine failed or was too slow, the first slow one to answer after all is used.
+        """
+        executor = ThreadPoolExecutor(max_workers=len(search_engines))
+        slow = {}
+        # stays the cause when every circuit is open
+        error = CircuitOpenError("Every search engine is unavailable")
+        try:
+            for search_engine in search_engines:
+                if not get_scheduler(search_engine).breaker.available:
+                    logger.info(f"Search engine unavailable, falling back", search_engine=search_engine)
+                    continue
+                future = executor.submit(self.engine_results, search_engine, query, options)
+                try:
+                    return future.result(timeout=options.search_engine_deadline)
+                except FutureTimeoutError:
+                    logger.warning(f"Search engine too slow, falling back", search_engine=search_engine, query=query)
+                    slow[future] = search_engine
+                except Exception as e:
+                    logger.warning(f"Search engine failed, falling back", search_engine=search_engine, error=str(e))
+                    error = e
+            while len(slow) > 0:
+                done, _ = wait(slow, return_when=FIRST_COMPLETED)
+                rankings = self._collect_rankings(done, slow)
+                if len(rankings) > 0:
+                    return next(iter(rankings.values()))
+                for future in done:
+                    error = future.exception() or error
+                    del slow[future]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise RuntimeError(f"No search engine answered for query {query}") from error
+
+    @staticmethod
+    def _collect_rankings(done, futures: dict) -> dict[str, list[dict]]:
+        rankings = {}
+        for future in done:
+            try:
+                rankings[futures[future]] = future.result()
+            except Exception as e:
+                logger.warning(f"Search engine failed", search_engine=futures[future], error=str(e))
+        return rankings
+
+    def cached_search(
+        self, search_engine: str, query: str, options: Options
+    ) -> dict:
+        """
+        Raw response of the search engine, served from the search cache when possible.
+        """
+        key = None
+        if self.cache is not None:
+            key = search_cache_key(
+                search_engine,
                 query,
                 options.maximum_search_results,
                 options.allowlist,
                 options.blocklist,
+                engine_content(search_engine, options),
             )
-            search_results = [
-                {"url": search_result["link"], "title": search_result["title"]}
-                for search_result in search_results_raw["items"]
-                if search_result.get("fileFormat") is None
-            ]
-        elif search_engine == "tavily":
-            search_results_raw = TavilySearchClient(
-                options.tavily_api_key
-            ).search(
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Search cache hit", query=query, search_engine=search_engine)
+                return json.loads(cached)
+
+        client = search_engine_client(search_engine, options)
+        # rate limits, retries and the circuit breaker of the engine
+        search_results_raw = get_scheduler(search_engine).run_sync(
+            lambda: client.search(
                 query,
                 options.maximum_search_results,
                 options.allowlist,
                 options.blocklist,
+                **({"include_raw_content": True} if engine_content(search_engine, options) else {}),
             )
-            search_results = [
-                {"url": search_result["url"], "title": search_result["title"]}
-                for search_result in search_results_raw["results"]
-                if search_result.get("fileFormat") is None
-            ]
-        else:
-            raise ValueError(f"No loader found for search_engine type: {search_engine}")
+        )
 
-        # log_search_results(search_results)
+        if key is not None:
+            self.cache.set(key, json.dumps(search_results_raw).encode("utf-8"))
+        return search_results_raw
 
-        if reference:
-            search_results.insert(0,{"url": reference, "title": "Reference from statement"})
-        search_results_txt = []
-        search_results_log = [
-            {"domain": urlparse(result["url"])[1], "title": result["title"]}
-            for result in search_results
-        ]
-        logger.info(f"Search results found", search_results=search_results_log)
-        for search_result in search_results:
-            url = search_result["url"]
-            logger.info(f"Downloading article from url", url=url)
-            article = Article(url)
+
+def search_engine_client(search_engine: str, options: Options):
+    """
+    Client of the search engine, the client modules (and their dependencies) are only
+    imported for the engines that are selected.
+    """
+    if search_engine == "bing":
+        return _engine_client(
+            search_engine, options.bing_search_v7_subscription_key, options.bing_search_v7_endpoint
+        )
+    elif search_engine == "google":
+        return _engine_client(search_engine, options.google_search_api_key, options.google_search_cx)
+    elif search_engine == "tavily":
+        return _engine_client(search_engine, options.tavily_api_key)
+    raise ValueError(f"No loader found for search_engine type: {search_engine}")
+
+
+@lru_cache(maxsize=None)
+def _engine_client(search_engine: str, *credentials: str | None):
+    # one client per engine and credentials for the whole process, they share the
+    # pooled connections of the http client
+    if search_engine == "bing":
+        from factuality.search.bing.bing_search import BingSearchClient
+
+        return BingSearchClient(*credentials)
+    elif search_engine == "google":
+        from factuality.search.google.google_search import GoogleSearchClient
+
+        return GoogleSearchClient(*credentials)
+    from factuality.search.tavily.tavily_search import TavilySearchClient
+
+    return TavilySearchClient(*credentials)
+
+
+def download_article(url: str, timeout: float, store: ArticleStore | None = None) -> SearchResults:
+    with span("download", url=url) as fields:
+        return _download_article(url, timeout, store, fields)
+
+
+def _download_article(url: str, timeout: float, store: ArticleStore | None, fields: dict) -> SearchResults:
+    logger.info(f"Downloading article from url", url=url)
+    stored = store.get(url) if store is not None else None
+    if stored is not None and stored.is_fresh(store.ttl):
+        logger.info(f"Article served from store", url=url)
+        fields["origin"] = "store"
+        return SearchResults(text=stored.text, url=url)
+
+    headers = {"User-Agent": USER_AGENT}
+    if stored is not None:
+        # let the server answer 304 if the page didn't change since we stored it
+        if stored.etag:
+            headers["If-None-Match"] = stored.etag
+        if stored.last_modified:
+            headers["If-Modified-Since"] = stored.last_modified
+    extraction.warm_up()
+    response = http.get(url, headers=headers, timeout=timeout)
+    fields["bytes"] = len(response.content)
+    metrics.inc(
+        "factuality_download_bytes_total",
+        len(response.content),
+        help="Bytes of the downloaded article pages.",
+    )
+    if response.status_code == 304 and stored is not None:
+        store.touch(url)
+        logger.info(f"Article revalidated from store", url=url)
+        fields["origin"] = "revalidated"
+        return SearchResults(text=stored.text, url=url)
+    response.raise_for_status()
+
+    text, fields["engine"] = extraction.extract_text(response.text, url)
+    if store is not None:
+        store.set(
+            url,
+            text,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+    logger.info(f"Downloaded article successfully from url", url=url)
+    fields["origin"] = "web"
+    return SearchResults(text=text, url=url)
+
+def engine_contents(search_results: list[dict]) -> dict[str, str]:
+    return {
+        search_result["url"]: search_result["content"]
+        for search_result in search_results
+        if search_result.get("content")
+    }
+
+
+def fetch_article(
+    url: str,
+    timeout: float,
+    store: ArticleStore | None = None,
+    registry: SourceRegistry | None = None,
+    content: str | None = None,
+) -> SearchResults:
+    """
+    `download_article`, done once per run for urls found by several claims when a registry is given.
+    Pages whose `content` the search engine already returned are not downloaded at all.
+    """
+    if content:
+        logger.info(f"Article content supplied by search engine", url=url)
+        metrics.inc(
+            "factuality_downloads_skipped_total",
+            help="Pages not downloaded because the search engine returned their content.",
+        )
+        return SearchResults(text=content, url=url)
+    if registry is None:
+        return download_article(url, timeout, store)
+    article = registry.download(url, lambda: download_article(url, timeout, store))
+    # the shared download may have been found through another link to the same page
+    return article if article.url == url else article.model_copy(update={"url": url})
+
+
+def download_articles(
+    urls: list[str],
+    workers: int,
+    timeout: float,
+    deadline: float,
+    store: ArticleStore | None = None,
+    registry: SourceRegistry | None = None,
+    contents: dict[str, str] | None = None,
+) -> list[SearchResults]:
+    """
+    Download and parse the articles in parallel on a bounded worker pool.
+
+    Every request is limited by `timeout` seconds and the whole batch by
+    `deadline` seconds. Articles that fail or are still pending when the
+    deadline passes are skipped, the rest keep the ranking order of `urls`.
+    Urls in `contents` use the content returned by the search engine instead.
+    """
+    if len(urls) == 0:
+        return []
+    contents = contents or {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls))))
+    futures = [
+        executor.submit(fetch_article, url, timeout, store, registry, contents.get(url)) for url in urls
+    ]
+    try:
+        wait(futures, timeout=deadline)
+    finally:
+        # don't let a single slow site hold up the claim
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    search_results_txt = []
+    for url, future in zip(urls, futures):
+        if not future.done():
+            logger.warning(f"Timed out downloading article {url}")
+            continue
+        try:
+            search_results_txt.append(future.result())
+        except Exception as e:
+            logger.warning(f"Error downloading article {url}: {e}")
+    return search_results_txt
+
+
+async def stream_articles(
+    urls: list[str],
+    prefetch: int,
+    timeout: float,
+    deadline: float,
+    store: ArticleStore | None = None,
+    registry: SourceRegistry | None = None,
+    contents: dict[str, str] | None = None,
+) -> AsyncIterator[SearchResults]:
+    """
+    Yield the downloaded articles in ranking order of `urls`.
+
+    Only `prefetch` downloads are kept running ahead of the article currently being
+    awaited, so a consumer that stops early never pays for the rest of the list.
+    Urls in `contents` use the content returned by the search engine instead.
+    """
+    contents = contents or {}
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline
+    pending: deque[tuple[str, asyncio.Task]] = deque()
+    remaining = iter(urls)
+
+    def schedule(size: int):
+        while len(pending) < size and loop.time() < deadline_at:
+            url = next(remaining, None)
+            if url is None:
+                return
+            pending.append(
+                (
+                    url,
+                    asyncio.create_task(
+                        asyncio.to_thread(fetch_article, url, timeout, store, registry, contents.get(url))
+                    ),
+                )
+            )
+
+    try:
+        schedule(1)
+        while pending:
+            url, task = pending.popleft()
+            # keep `prefetch` downloads running while this one is awaited and consumed
+            schedule(prefetch)
             try:
-                article.download()
-                article.parse()
-                search_results_txt.append(SearchResults(text=article.text, url=url))
-                logger.info(f"Downloaded article successfully from url", url=url)
+                article = await asyncio.wait_for(task, max(0, deadline_at - loop.time()))
+            except asyncio.TimeoutError:
+                logger.warning(f"Timed out downloading article {url}")
+                schedule(1)
+                continue
             except Exception as e:
                 logger.warning(f"Error downloading article {url}: {e}")
-        return search_results_txt
+                schedule(1)
+                continue
+            yield article
+            schedule(1)
+    finally:
+        for _, task in pending:
+            task.cancel()
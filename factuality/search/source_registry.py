@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable, Iterable, TypeVar
+from factuality.search.article_store import canonical_url
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class SourceRegistry:
+    """
+    Sources of one run, shared by all of its claims.
+
+    Every unique url is downloaded and parsed once and every source is chunked once per
+    chunking setting, claims asking for the same url at the same time wait for the first
+    download instead of starting their own. Results are shared read-only, failures are
+    shared too so a broken site is not tried again by every claim.
+    """
+
+    def __init__(self):
+        self.downloaded = 0
+        self.downloads_saved = 0
+        self.chunked = 0
+        self.chunkings_saved = 0
+        self._lock = threading.Lock()
+        self._downloads: dict[str, Future] = {}
+        self._chunks: dict[Hashable, Future] = {}
+
+    def download(self, url: str, fetch: Callable[[], T]) -> T:
+        """
+        Result of `fetch` for the url, called only by the first claim that needs it.
+        """
+        future, owner = self._claim(self._downloads, canonical_url(url))
+        with self._lock:
+            if owner:
+                self.downloaded += 1
+            else:
+                self.downloads_saved += 1
+                logger.debug(f"Sharing downloaded source", url=url)
+        return self._resolve(future, owner, fetch)
+
+    def chunks(self, url: str, settings: tuple, split: Callable[[], Iterable[str]]) -> tuple[str, ...]:
+        """
+        Chunks of the source at url for the chunking `settings`, split only once.
+        """
+        future, owner = self._claim(self._chunks, (canonical_url(url), settings))
+        with self._lock:
+            if owner:
+                self.chunked += 1
+            else:
+                self.chunkings_saved += 1
+        return self._resolve(future, owner, lambda: tuple(split()))
+
+    def _claim(self, table: dict, key: Hashable) -> tuple[Future, bool]:
+        with self._lock:
+            future = table.get(key)
+            if future is not None:
+                return future, False
+            future = table[key] = Future()
+            return future, True
+
+    @staticmethod
+    def _resolve(future: Future, owner: bool, compute: Callable[[], T]) -> T:
+        if owner:
+            try:
+                future.set_result(compute())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "downloaded": self.downloaded,
+            "downloads_saved": self.downloads_saved,
+            "chunked": self.chunked,
+            "chunkings_saved": self.chunkings_saved,
+        }
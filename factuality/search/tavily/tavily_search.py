@@ -1,28 +1,44 @@
-from tavily import TavilyClient
+import os
+from factuality.utils import http
+
 
 class TavilySearchClient:
-    tavily_client = None
+    base_url = "https://api.tavily.com"
 
     def __init__(self, subscription_key):
-        if not self.tavily_client:
-            self.tavily_client = TavilyClient(api_key=subscription_key)
+        subscription_key = subscription_key or os.getenv("TAVILY_API_KEY")
+        if not subscription_key:
+            raise ValueError("Missing Tavily API key")
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {subscription_key}",
+        }
 
-    def search(self, query, maximum_search_results, allowlist, blocklist):
+    def search(self, query, maximum_search_results, allowlist, blocklist, include_raw_content=False):
         """
         Search for a query string using Tavily Search API.
 
         Parameters:
         query (str): The search query.
+        include_raw_content (bool): Return the parsed content of the pages as well.
 
         Returns:
         dict: The JSON response from the API.
         """
+        data = {
+            "query": query,
+            "search_depth": "basic",
+            "topic": "general",
+            "max_results": maximum_search_results,
+            "include_domains": allowlist,
+            "exclude_domains": blocklist,
+            "include_answer": False,
+            "include_raw_content": include_raw_content,
+            "include_images": False,
+        }
 
-        response = self.tavily_client.search(
-            query,
-            max_results=maximum_search_results,
-            include_domains=allowlist,
-            exclude_domains=blocklist,
-        )
+        # the same request tavily-python sends, through the shared connection pool
+        response = http.post(self.base_url + "/search", json=data, headers=self.headers)
+        response.raise_for_status()
 
-        return response
+        return response.json()
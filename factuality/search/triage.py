@@ -0,0 +1,99 @@
+from urllib.parse import urlparse
+from factuality.fact_check.ranking import tokenize
+from factuality.search.article_store import canonical_url
+from factuality.utils.metrics import metrics
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# snippets of pages that only show a teaser without a subscription
+PAYWALL_MARKERS = (
+    "subscribe to read",
+    "subscribe to continue",
+    "subscribers only",
+    "subscription required",
+    "for subscribers",
+    "sign in to read",
+    "log in to continue reading",
+)
+# titles this short are too generic ("Home", "News") to tell two pages apart
+MIN_TITLE_TERMS = 4
+
+
+def domain_matches(url: str, domains: list[str]) -> bool:
+    host = (urlparse(url).hostname or "").lower()
+    return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+
+def snippet_relevance(claim: str, title: str, snippet: str | None) -> float | None:
+    """
+    Share of the claim terms found in the title and snippet of a hit, None when the
+    engine returned no snippet to judge by.
+    """
+    if not snippet:
+        return None
+    claim_terms = set(tokenize(claim))
+    if len(claim_terms) == 0:
+        return None
+    return len(claim_terms & set(tokenize(f"{title} {snippet}"))) / len(claim_terms)
+
+
+def triage(results: list[dict], claim: str, skip_domains: list[str], min_relevance: float) -> list[dict]:
+    """
+    Drop the hits not worth downloading before any page is fetched: the same page found
+    twice (by url or a syndicated copy with the same title), pages on `skip_domains` or
+    behind a paywall, and hits whose snippet shares less than `min_relevance` of the claim
+    terms. Kept hits stay in engine order with their `relevance` set.
+    """
+    kept = []
+    urls = set()
+    titles = set()
+    dropped: dict[str, int] = {}
+
+    def drop(reason: str, result: dict) -> None:
+        dropped[reason] = dropped.get(reason, 0) + 1
+        logger.debug(f"Search hit dropped", reason=reason, url=result["url"])
+
+    for result in results:
+        url = canonical_url(result["url"])
+        title_terms = tuple(tokenize(result.get("title") or ""))
+        snippet = result.get("snippet") or ""
+        if url in urls or (len(title_terms) >= MIN_TITLE_TERMS and title_terms in titles):
+            drop("duplicate", result)
+            continue
+        if domain_matches(result["url"], skip_domains):
+            drop("domain", result)
+            continue
+        if any(marker in snippet.lower() for marker in PAYWALL_MARKERS):
+            drop("paywall", result)
+            continue
+        relevance = snippet_relevance(claim, result.get("title") or "", snippet)
+        # hits carrying their content cost nothing to check, they are never dropped as irrelevant
+        if relevance is not None and relevance < min_relevance and not result.get("content"):
+            drop("irrelevant", result)
+            continue
+        urls.add(url)
+        if len(title_terms) >= MIN_TITLE_TERMS:
+            titles.add(title_terms)
+        kept.append({**result, "relevance": relevance})
+
+    for reason, count in dropped.items():
+        metrics.inc(
+            "factuality_search_hits_dropped_total",
+            count,
+            help="Search hits dropped before download by reason.",
+            reason=reason,
+        )
+    if len(dropped) > 0:
+        logger.info(f"Search hits triaged", kept=len(kept), **dropped)
+    return kept
+
+
+def relevance_ranking(results: list[dict]) -> list[dict]:
+    """
+    Hits by snippet relevance, hits without a snippet keep their place behind the judged ones.
+    """
+    return sorted(
+        results,
+        key=lambda result: -result["relevance"] if result.get("relevance") is not None else 0,
+    )
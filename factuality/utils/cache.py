@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+def cache_key(*parts) -> str:
+    """
+    Content address for the given parts, anything json serializable.
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class SqliteCache:
+    """
+    Persistent key value store with a time to live and least recently used eviction.
+
+    The same file can be shared by several caches (one table each) and several processes.
+    """
+
+    def __init__(self, path: str, table: str, ttl: float, max_entries: int):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)"
+            )
+            self._connection.commit()
+
+    def get(self, key: str) -> bytes | None:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> tuple[bytes, float] | None:
+        """
+        The value with the time it was stored, so copies of it expire at the same time.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl > 0 and now - row[1] > self.ttl):
+                if row is not None:
+                    self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._connection.commit()
+                self.misses += 1
+                return None
+            self._connection.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.max_entries > 0:
+                self._connection.execute(
+                    f"""DELETE FROM {self.table} WHERE key IN (
+                        SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                )
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests > 0 else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class MemoryCache:
+    """
+    In process least recently used cache with a time to live.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl > 0 and time.time() - entry[0] > self.ttl):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: bytes, created_at: float | None = None) -> None:
+        with self._lock:
+            self._entries[key] = (created_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests > 0 else 0.0,
+        }
+
+
+class TieredCache:
+    """
+    Memory cache in front of an optional persistent cache, persistent hits are promoted to memory.
+    """
+
+    def __init__(self, memory: MemoryCache, persistent: SqliteCache | None = None):
+        self.memory = memory
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> bytes | None:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            entry = self.persistent.get_entry(key)
+            if entry is not None:
+                # the copy in memory expires with the stored one
+                value, created_at = entry
+                self.memory.set(key, value, created_at)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests > 0 else 0.0,
+            "memory": self.memory.stats(),
+        }
+        if self.persistent is not None:
+            stats["persistent"] = self.persistent.stats()
+        return stats
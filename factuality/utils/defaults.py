@@ -15,4 +15,53 @@ class Defaults(Enum):
     BLOCKLIST = '[]'
     VALIDATION_CHECKS_PER_CLAIM = 1
     SAME_SITE_ALLOWED = True
-    LOG_LEVEL = 'INFO'
\ No newline at end of file
+    LOG_LEVEL = 'INFO'
+    CLAIMS_CONCURRENCY = 4
+    SEARCH_DOWNLOAD_WORKERS = 4
+    SEARCH_DOWNLOAD_TIMEOUT = 7
+    SEARCH_DOWNLOAD_DEADLINE = 20
+    SEARCH_PREFETCH = 1
+    OPENAI_MAX_IN_FLIGHT = 8
+    CACHE_DIR = '.factuality_cache'
+    LLM_CACHE_TTL = 604800
+    LLM_CACHE_MAX_ENTRIES = 10000
+    SEARCH_CACHE_TTL = 86400
+    SEARCH_CACHE_MAX_ENTRIES = 10000
+    SEARCH_CACHE_MEMORY_ENTRIES = 256
+    ARTICLE_STORE_TTL = 86400
+    ARTICLE_STORE_MAX_BYTES = 209715200
+    MAX_CHUNKS_PER_SOURCE = 3
+    SEARCH_EXTRACT_CHUNK_TOKENS = 1200
+    SEARCH_EXTRACT_CHUNK_OVERLAP_TOKENS = 120
+    FACTCHECK_BATCH_TOKENS = 0
+    BATCH_DIR = '.factuality_batch'
+    BATCH_POLL_INTERVAL = 60
+    JOBS_CONCURRENCY = 4
+    WORKER_BATCH_SIZE = 10
+    WORKER_CONCURRENCY = 4
+    WORKER_POLL_INTERVAL = 10
+    WORKER_LEASE_TIMEOUT = 600
+    CLAIM_INDEX_TTL = 604800
+    CLAIM_INDEX_SIMILARITY = 1.0
+    LOG_FORMAT = 'console'
+    METRICS_PATH = ''
+    OPENAI_REQUESTS_PER_MINUTE = 0
+    OPENAI_TOKENS_PER_MINUTE = 0
+    SEARCH_REQUESTS_PER_MINUTE = 0
+    RETRY_MAX_ATTEMPTS = 4
+    CIRCUIT_BREAKER_THRESHOLD = 5
+    CIRCUIT_BREAKER_RESET = 30
+    SEARCH_STRATEGY = 'fanout'
+    SEARCH_ENGINE_DEADLINE = 5
+    BATCH_WORKERS = 4
+    SEARCH_MIN_SNIPPET_RELEVANCE = 0.2
+    SEARCH_SKIP_DOMAINS = '["wsj.com", "ft.com", "economist.com", "bloomberg.com", "barrons.com", "thetimes.co.uk", "pinterest.com", "facebook.com", "instagram.com", "tiktok.com", "linkedin.com"]'
+    SEARCH_USE_ENGINE_CONTENT = 'true'
+    SEARCH_EXTRACTION_ENGINE = 'lxml'
+    # read by the CLI, the worker and the service only, library use parses pages in the downloading threads
+    SEARCH_EXTRACTION_WORKERS = 2
+    HTTP_MAX_CONNECTIONS = 100
+    HTTP_MAX_CONNECTIONS_PER_HOST = 6
+    HTTP_TIMEOUT = 10
+    HTTP_CONNECT_TIMEOUT = 5
+    HTTP_DNS_CACHE_TTL = 300
\ No newline at end of file
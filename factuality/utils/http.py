@@ -0,0 +1,239 @@
+import importlib.util
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
+from urllib.parse import urlsplit
+from urllib.request import getproxies
+from factuality.utils.defaults import Defaults
+
+if TYPE_CHECKING:
+    import httpx
+
+_settings = {
+    "max_connections": Defaults.HTTP_MAX_CONNECTIONS.value,
+    "max_connections_per_host": Defaults.HTTP_MAX_CONNECTIONS_PER_HOST.value,
+    "timeout": Defaults.HTTP_TIMEOUT.value,
+    "connect_timeout": Defaults.HTTP_CONNECT_TIMEOUT.value,
+    "dns_cache_ttl": Defaults.HTTP_DNS_CACHE_TTL.value,
+}
+_client: "httpx.Client | None" = None
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+
+
+class DnsCache:
+    """
+    Resolved addresses by host and port for `ttl` seconds, new connections to a host
+    don't wait for the resolver again.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._addresses: dict[tuple[str, int], tuple[float, list[str]]] = {}
+
+    def resolve(self, host: str, port: int) -> list[str]:
+        key = (host, port)
+        with self._lock:
+            cached = self._addresses.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        addresses = []
+        for _, _, _, _, address in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+            if address[0] not in addresses:
+                addresses.append(address[0])
+        with self._lock:
+            self._addresses[key] = (time.monotonic(), addresses)
+        return addresses
+
+
+def _caching_backend(dns_cache: DnsCache):
+    import httpcore
+
+    class CachingBackend(httpcore.SyncBackend):
+        """
+        Connects to the cached addresses of the host, TLS still verifies the host name
+        as it is given the origin and not the address.
+        """
+
+        def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+            try:
+                addresses = dns_cache.resolve(host, port)
+            except OSError as e:
+                raise httpcore.ConnectError(str(e)) from e
+            error = httpcore.ConnectError(f"No address found for {host}")
+            for address in addresses:
+                try:
+                    return super().connect_tcp(address, port, timeout, local_address, socket_options)
+                except httpcore.ConnectError as e:
+                    error = e
+            raise error
+
+    return CachingBackend()
+
+
+@contextmanager
+def _httpx_errors() -> Iterator[None]:
+    """
+    Raise httpcore's errors as their httpx counterparts, which the callers (and the
+    scheduler's retries) expect from the client.
+    """
+    import httpcore
+    import httpx
+
+    try:
+        yield
+    except httpcore.TimeoutException as e:
+        raise getattr(httpx, type(e).__name__, httpx.TimeoutException)(str(e)) from e
+    except (httpcore.NetworkError, httpcore.ProtocolError, httpcore.ProxyError, httpcore.UnsupportedProtocol) as e:
+        raise getattr(httpx, type(e).__name__, httpx.TransportError)(str(e)) from e
+
+
+def _caching_transport(dns_cache: DnsCache, http2: bool, max_connections: int):
+    """
+    httpx transport over an httpcore pool that connects through the DNS cache, httpx's own
+    transport takes no network backend.
+    """
+    import httpcore
+    import httpx
+
+    class ResponseStream(httpx.SyncByteStream):
+        def __init__(self, stream):
+            self._stream = stream
+
+        def __iter__(self) -> Iterator[bytes]:
+            with _httpx_errors():
+                yield from self._stream
+
+        def close(self) -> None:
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+
+    class CachingTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._pool = httpcore.ConnectionPool(
+                ssl_context=httpx.create_ssl_context(),
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                http2=http2,
+                network_backend=_caching_backend(dns_cache),
+            )
+
+        def handle_request(self, request: httpx.Request) -> httpx.Response:
+            core_request = httpcore.Request(
+                method=request.method,
+                url=httpcore.URL(
+                    scheme=request.url.raw_scheme,
+                    host=request.url.raw_host,
+                    port=request.url.port,
+                    target=request.url.raw_path,
+                ),
+                headers=request.headers.raw,
+                content=request.stream,
+                extensions=request.extensions,
+            )
+            with _httpx_errors():
+                response = self._pool.handle_request(core_request)
+            return httpx.Response(
+                status_code=response.status,
+                headers=response.headers,
+                stream=ResponseStream(response.stream),
+                extensions=response.extensions,
+            )
+
+        def close(self) -> None:
+            self._pool.close()
+
+    return CachingTransport()
+
+
+def configure(
+    max_connections: int,
+    max_connections_per_host: int,
+    timeout: float,
+    connect_timeout: float,
+    dns_cache_ttl: float,
+) -> None:
+    """
+    Set the limits of the shared client, replacing it (and its pooled connections) when
+    they changed.
+    """
+    global _client
+    settings = {
+        "max_connections": max_connections,
+        "max_connections_per_host": max_connections_per_host,
+        "timeout": timeout,
+        "connect_timeout": connect_timeout,
+        "dns_cache_ttl": dns_cache_ttl,
+    }
+    with _lock:
+        if settings == _settings:
+            return
+        _settings.update(settings)
+        if _client is not None:
+            _client.close()
+            _client = None
+        _host_slots.clear()
+
+
+def get_client() -> "httpx.Client":
+    """
+    The process wide HTTP client of the search engines and page downloads, keeping the
+    connections alive between requests. HTTP/2 is used when `h2` is installed and brotli
+    responses are accepted when `brotli` is, gzip and deflate always are.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            import httpx
+
+            http2 = importlib.util.find_spec("h2") is not None
+            transport = None
+            # proxied requests resolve on the proxy, those keep httpx's own transports
+            if _settings["dns_cache_ttl"] > 0 and not getproxies():
+                transport = _caching_transport(DnsCache(_settings["dns_cache_ttl"]), http2, _settings["max_connections"])
+            _client = httpx.Client(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=_settings["max_connections"],
+                    max_keepalive_connections=_settings["max_connections"],
+                ),
+                timeout=httpx.Timeout(_settings["timeout"], connect=_settings["connect_timeout"]),
+                follow_redirects=True,
+                transport=transport,
+            )
+        return _client
+
+
+@contextmanager
+def host_slot(url: str) -> Iterator[None]:
+    """
+    Hold one of the `max_connections_per_host` slots of the host of the url, so a burst
+    of downloads from one site doesn't take the whole pool (or trip the site's limits).
+    """
+    host = urlsplit(url).hostname or ""
+    with _lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(max(1, _settings["max_connections_per_host"]))
+    with slot:
+        yield
+
+
+def request(method: str, url: str, **kwargs) -> "httpx.Response":
+    """
+    Request through the shared client within the per host limit, `timeout` overrides the
+    configured timeouts for this request.
+    """
+    with host_slot(url):
+        return get_client().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> "httpx.Response":
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> "httpx.Response":
+    return request("POST", url, **kwargs)
@@ -2,13 +2,26 @@ import logging
 from logging import INFO, DEBUG, WARNING, ERROR, CRITICAL
 import structlog
 
-def setup_structlog():
-    logging.basicConfig(level=logging.INFO)
+def setup_structlog(log_format: str = "console"):
+    """
+    Configure structlog, `log_format` is console for humans or json for one JSON object per line.
+    """
+    logging.basicConfig(level=logging.INFO, format="%(message)s" if log_format == "json" else None)
+    if log_format == "json":
+        renderer = [
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.format_exc_info,
+            structlog.processors.JSONRenderer(default=str),
+        ]
+    elif log_format == "console":
+        renderer = [structlog.dev.ConsoleRenderer()]
+    else:
+        raise ValueError("Invalid log format: {}".format(log_format))
     structlog.configure(
         processors=[
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
-            structlog.dev.ConsoleRenderer(),
+            *renderer,
         ],
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
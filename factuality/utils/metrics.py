@@ -0,0 +1,167 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# upper bounds in seconds, from cache hits to slow downloads and LLM calls
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_stage: contextvars.ContextVar[str] = contextvars.ContextVar("factuality_stage", default="other")
+
+
+def current_stage() -> str:
+    """
+    Stage of the innermost running span, LLM calls are accounted to it.
+    """
+    return _stage.get()
+
+
+def _labels(labels: dict[str, str]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Counters and duration histograms of the process, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: dict[str, tuple[str, str]] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], list] = {}
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels) -> None:
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            key = (name, _labels(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, help: str = "", **labels) -> None:
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            key = (name, _labels(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # bucket counts, sum, count
+                histogram = self._histograms[key] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (counter, labels), value in sorted(self._counters.items()):
+                        if counter == name:
+                            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                    continue
+                for (histogram, labels), (buckets, total, count) in sorted(self._histograms.items()):
+                    if histogram != name:
+                        continue
+                    for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {bucket}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Write the metrics for the node exporter textfile collector, atomically so a scrape
+        never sees a partial file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.render())
+        os.replace(temporary, path)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(stage: str, **fields) -> Iterator[dict]:
+    """
+    Time a stage of the pipeline. The duration goes to the `factuality_stage_duration_seconds`
+    histogram and a `Span finished` log line with the fields, the yielded dict takes more fields
+    while the span runs. Works around sync code and awaits alike.
+    """
+    token = _stage.set(stage)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _stage.reset(token)
+        metrics.observe(
+            "factuality_stage_duration_seconds",
+            duration,
+            "Duration of the pipeline stages.",
+            stage=stage,
+            status=status,
+        )
+        logger.info(f"Span finished", stage=stage, status=status, duration_ms=round(duration * 1000, 1), **fields)
+
+
+def record_llm_usage(
+    model: str, prompt_tokens: int, completion_tokens: int, cached: bool = False, stage: str | None = None
+) -> None:
+    """
+    Count an LLM response and its tokens for the stage (the current one by default), cached
+    responses cost no tokens.
+    """
+    stage = stage or current_stage()
+    metrics.inc(
+        "factuality_llm_requests_total",
+        help="LLM responses by stage, model and whether they came from the cache.",
+        stage=stage,
+        model=model,
+        cached=str(cached).lower(),
+    )
+    for kind, tokens in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+        metrics.inc(
+            "factuality_llm_tokens_total",
+            tokens,
+            help="Tokens of the LLM requests by stage, model and kind.",
+            stage=stage,
+            model=model,
+            kind=kind,
+        )
@@ -1,5 +1,7 @@
 from factuality.utils.defaults import Defaults
+import inspect
 import json
+import os
 
 class Options:
     def __init__(
@@ -24,6 +26,45 @@ class Options:
         google_search_api_key = None,
         google_search_cx = None,
         tavily_api_key = None,
+        claims_concurrency = Defaults.CLAIMS_CONCURRENCY.value,
+        search_download_workers = Defaults.SEARCH_DOWNLOAD_WORKERS.value,
+        search_download_timeout = Defaults.SEARCH_DOWNLOAD_TIMEOUT.value,
+        search_download_deadline = Defaults.SEARCH_DOWNLOAD_DEADLINE.value,
+        search_prefetch = Defaults.SEARCH_PREFETCH.value,
+        openai_max_in_flight = Defaults.OPENAI_MAX_IN_FLIGHT.value,
+        cache_dir = Defaults.CACHE_DIR.value,
+        llm_cache_ttl = Defaults.LLM_CACHE_TTL.value,
+        llm_cache_max_entries = Defaults.LLM_CACHE_MAX_ENTRIES.value,
+        search_cache_ttl = Defaults.SEARCH_CACHE_TTL.value,
+        search_cache_max_entries = Defaults.SEARCH_CACHE_MAX_ENTRIES.value,
+        search_cache_memory_entries = Defaults.SEARCH_CACHE_MEMORY_ENTRIES.value,
+        article_store_ttl = Defaults.ARTICLE_STORE_TTL.value,
+        article_store_max_bytes = Defaults.ARTICLE_STORE_MAX_BYTES.value,
+        max_chunks_per_source = Defaults.MAX_CHUNKS_PER_SOURCE.value,
+        search_extract_chunk_tokens = Defaults.SEARCH_EXTRACT_CHUNK_TOKENS.value,
+        search_extract_chunk_overlap_tokens = Defaults.SEARCH_EXTRACT_CHUNK_OVERLAP_TOKENS.value,
+        factcheck_batch_tokens = Defaults.FACTCHECK_BATCH_TOKENS.value,
+        batch_dir = Defaults.BATCH_DIR.value,
+        batch_poll_interval = Defaults.BATCH_POLL_INTERVAL.value,
+        claim_index_ttl = Defaults.CLAIM_INDEX_TTL.value,
+        claim_index_similarity = Defaults.CLAIM_INDEX_SIMILARITY.value,
+        openai_requests_per_minute = Defaults.OPENAI_REQUESTS_PER_MINUTE.value,
+        openai_tokens_per_minute = Defaults.OPENAI_TOKENS_PER_MINUTE.value,
+        search_requests_per_minute = Defaults.SEARCH_REQUESTS_PER_MINUTE.value,
+        retry_max_attempts = Defaults.RETRY_MAX_ATTEMPTS.value,
+        circuit_breaker_threshold = Defaults.CIRCUIT_BREAKER_THRESHOLD.value,
+        circuit_breaker_reset = Defaults.CIRCUIT_BREAKER_RESET.value,
+        search_strategy = Defaults.SEARCH_STRATEGY.value,
+        search_engine_deadline = Defaults.SEARCH_ENGINE_DEADLINE.value,
+        search_min_snippet_relevance = Defaults.SEARCH_MIN_SNIPPET_RELEVANCE.value,
+        search_skip_domains = Defaults.SEARCH_SKIP_DOMAINS.value,
+        search_use_engine_content = Defaults.SEARCH_USE_ENGINE_CONTENT.value,
+        search_extraction_engine = Defaults.SEARCH_EXTRACTION_ENGINE.value,
+        http_max_connections = Defaults.HTTP_MAX_CONNECTIONS.value,
+        http_max_connections_per_host = Defaults.HTTP_MAX_CONNECTIONS_PER_HOST.value,
+        http_timeout = Defaults.HTTP_TIMEOUT.value,
+        http_connect_timeout = Defaults.HTTP_CONNECT_TIMEOUT.value,
+        http_dns_cache_ttl = Defaults.HTTP_DNS_CACHE_TTL.value,
     ):
         self.tweet_id = tweet_id
         self.oai_api_key = oai_api_key
@@ -45,3 +86,62 @@ class Options:
         self.google_search_api_key = google_search_api_key
         self.google_search_cx = google_search_cx
         self.tavily_api_key = tavily_api_key
+        self.claims_concurrency = int(claims_concurrency)
+        self.search_download_workers = int(search_download_workers)
+        self.search_download_timeout = float(search_download_timeout)
+        self.search_download_deadline = float(search_download_deadline)
+        self.search_prefetch = int(search_prefetch)
+        self.openai_max_in_flight = int(openai_max_in_flight)
+        self.cache_dir = cache_dir
+        self.llm_cache_ttl = float(llm_cache_ttl)
+        self.llm_cache_max_entries = int(llm_cache_max_entries)
+        self.search_cache_ttl = float(search_cache_ttl)
+        self.search_cache_max_entries = int(search_cache_max_entries)
+        self.search_cache_memory_entries = int(search_cache_memory_entries)
+        self.article_store_ttl = float(article_store_ttl)
+        self.article_store_max_bytes = int(article_store_max_bytes)
+        self.max_chunks_per_source = int(max_chunks_per_source)
+        self.search_extract_chunk_tokens = int(search_extract_chunk_tokens)
+        self.search_extract_chunk_overlap_tokens = int(search_extract_chunk_overlap_tokens)
+        self.factcheck_batch_tokens = int(factcheck_batch_tokens)
+        self.batch_dir = batch_dir
+        self.batch_poll_interval = float(batch_poll_interval)
+        self.claim_index_ttl = float(claim_index_ttl)
+        self.claim_index_similarity = float(claim_index_similarity)
+        self.openai_requests_per_minute = float(openai_requests_per_minute)
+        self.openai_tokens_per_minute = float(openai_tokens_per_minute)
+        self.search_requests_per_minute = float(search_requests_per_minute)
+        self.retry_max_attempts = int(retry_max_attempts)
+        self.circuit_breaker_threshold = int(circuit_breaker_threshold)
+        self.circuit_breaker_reset = float(circuit_breaker_reset)
+        self.search_strategy = str(search_strategy)
+        self.search_engine_deadline = float(search_engine_deadline)
+        self.search_min_snippet_relevance = float(search_min_snippet_relevance)
+        self.search_skip_domains = json.loads(search_skip_domains)
+        self.search_use_engine_content = str(search_use_engine_content).lower() == 'true'
+        self.search_extraction_engine = search_extraction_engine
+        self.http_max_connections = int(http_max_connections)
+        self.http_max_connections_per_host = int(http_max_connections_per_host)
+        self.http_timeout = float(http_timeout)
+        self.http_connect_timeout = float(http_connect_timeout)
+        self.http_dns_cache_ttl = float(http_dns_cache_ttl)
+
+
+def options_from_env(tweet_id=None) -> Options:
+    """
+    Options from the same environment variables the CLI reads, for long running services.
+    """
+    parameters = inspect.signature(Options.__init__).parameters
+    environment = {
+        "oai_api_key": os.getenv("OPENAI_API_KEY"),
+        "bing_search_v7_subscription_key": os.getenv("BING_SEARCH_V7_SUBSCRIPTION_KEY"),
+        "google_search_api_key": os.getenv("GOOGLE_SEARCH_API_KEY"),
+        "google_search_cx": os.getenv("GOOGLE_SEARCH_CX"),
+        "tavily_api_key": os.getenv("TAVILY_API_KEY"),
+    }
+    # __members__ includes the aliases, Enum folds defaults with equal values into one member
+    for default_name in Defaults.__members__:
+        name = default_name.lower()
+        if name in parameters and os.getenv(default_name) is not None:
+            environment[name] = os.getenv(default_name)
+    return Options(tweet_id=tweet_id, **environment)
@@ -0,0 +1,377 @@
+import asyncio
+import email.utils
+import random
+import sys
+import threading
+import time
+from typing import Awaitable, Callable, TypeVar
+from factuality.utils.metrics import metrics
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+# statuses worth another try, 429 and 5xx are by far the most common ones
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+# Tavily's plan and pay-as-you-go limits
+EXHAUSTED_STATUSES = frozenset({432, 433})
+TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+# the client libraries are only imported by the providers that use them,
+# (name of the module, its transient errors)
+CLIENT_TRANSIENT_ERRORS = (
+    ("requests", ("ConnectionError", "Timeout")),
+    ("httpx", ("TransportError",)),
+    ("openai", ("APIConnectionError",)),
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    The provider failed too often recently, calls are refused until the circuit half-opens.
+    """
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to one minute worth of units. Reservations
+    may overdraw the bucket, the caller then waits until the debt is refilled, so callers
+    are served in order instead of racing for every refill. 0 disables the limit.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self._lock = threading.Lock()
+        self._level = per_minute
+        self._updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take `amount` units, returns the seconds to wait before using them.
+        """
+        if self.per_minute <= 0 or amount <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.per_minute, self._level + (now - self._updated) * self.per_minute / 60)
+            self._updated = now
+            # a single request larger than the whole bucket still gets through, once it's full
+            self._level -= min(amount, self.per_minute)
+            return max(0.0, -self._level * 60 / self.per_minute)
+
+    def refund(self, amount: float) -> None:
+        """
+        Give back (or with a negative amount take) units once the real usage is known.
+        """
+        if self.per_minute <= 0:
+            return
+        with self._lock:
+            self._level = min(self.per_minute, self._level + amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and refuses calls for `reset_timeout`
+    seconds, then lets one trial call through (half-open) which closes it again on success.
+    0 disables it.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial = False
+
+    def enter(self) -> bool | None:
+        """
+        None when the call is refused, otherwise whether it is the trial call of the half-open
+        circuit. The trial must end with `release` whatever its outcome, or no call would
+        ever be let through again.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial:
+                return None
+            self._trial = True
+            return True
+
+    def release(self) -> None:
+        """
+        End the trial call, when neither `success` nor `failure` settled it (rate limited or
+        cancelled) the next call is the trial again.
+        """
+        with self._lock:
+            self._trial = False
+
+    def success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self, trip: bool = False) -> bool:
+        """
+        Record a failure, `trip` opens the circuit right away. Returns True when the circuit opened.
+        """
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial or trip
+            self._trial = False
+            if self.threshold > 0 and (reopen or self._failures >= self.threshold):
+                opened = self._opened_at is None or reopen
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether a call would be let through now, closed or ready for its trial call.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            return time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial
+
+
+def retry_after(error: BaseException) -> float | None:
+    """
+    Seconds the provider asked us to wait, from the Retry-After (or OpenAI's retry-after-ms)
+    header of the error response.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    milliseconds = headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def status_code(error: BaseException) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_exhausted(error: BaseException) -> bool:
+    """
+    The quota of the account is used up, retrying won't help for a long time.
+    """
+    if status_code(error) in EXHAUSTED_STATUSES:
+        return True
+    return status_code(error) == 429 and getattr(error, "code", None) == "insufficient_quota"
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(error, TRANSIENT_ERRORS + transient_client_errors())
+
+
+def is_transient(error: BaseException | None) -> bool:
+    """
+    Failures another try later may not have: an open circuit, a provider outage or quota,
+    also when they are the cause of the error.
+    """
+    while error is not None:
+        if isinstance(error, CircuitOpenError) or is_retryable(error) or is_exhausted(error):
+            return True
+        error = error.__cause__
+    return False
+
+
+def transient_client_errors() -> tuple[type[BaseException], ...]:
+    """
+    Transient errors of the client libraries that are loaded, an error can only come from
+    a library that has been imported.
+    """
+    errors = []
+    for module_name, names in CLIENT_TRANSIENT_ERRORS:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            errors.extend(getattr(module, name) for name in names)
+    return tuple(errors)
+
+
+class Scheduler:
+    """
+    Admission, retries and circuit breaking for the calls of one provider.
+
+    Every attempt waits for the request (and token) budget of the provider. Rate limits and
+    transient errors are retried with full jitter exponential backoff, at least as long as
+    the Retry-After header asks for, and a 429 pauses the whole provider for that long so
+    concurrent calls don't keep hitting the limit. Failures other than rate limits count
+    towards the circuit breaker. Errors that another try won't fix are raised right away.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+    ):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def _admit(self, tokens: int) -> tuple[float, bool]:
+        """
+        Seconds to wait before the call and whether it is the trial call of the breaker.
+        """
+        trial = self.breaker.enter()
+        if trial is None:
+            raise CircuitOpenError(f"Circuit for {self.provider} is open after repeated failures")
+        with self._lock:
+            paused = max(0.0, self._paused_until - time.monotonic())
+        delay = max(paused, self.requests.reserve(1), self.tokens.reserve(tokens))
+        if delay > 0:
+            metrics.inc(
+                "factuality_rate_limit_wait_seconds_total",
+                delay,
+                help="Seconds calls waited for the rate limits of the provider.",
+                provider=self.provider,
+            )
+        return delay, trial
+
+    def _backoff(self, error: BaseException, attempt: int) -> float | None:
+        """
+        Seconds to wait before the next attempt, None when the error should be raised.
+        """
+        exhausted = is_exhausted(error)
+        retryable = is_retryable(error) and not exhausted
+        rate_limited = status_code(error) == 429
+        if exhausted or (retryable and not rate_limited):
+            if self.breaker.failure(trip=exhausted):
+                logger.warning(f"Circuit opened", provider=self.provider, error=str(error))
+                metrics.inc(
+                    "factuality_circuit_opened_total",
+                    help="Times the circuit breaker of the provider opened.",
+                    provider=self.provider,
+                )
+        elif not retryable:
+            # the provider answered, the request itself was refused
+            self.breaker.success()
+        if not retryable or attempt + 1 >= self.max_attempts:
+            return None
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        if rate_limited:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        metrics.inc(
+            "factuality_retries_total",
+            help="Retried calls by provider and status.",
+            provider=self.provider,
+            status=str(status_code(error) or type(error).__name__),
+        )
+        logger.info(
+            f"Retrying call",
+            provider=self.provider,
+            attempt=attempt + 1,
+            delay=round(delay, 2),
+            error=str(error),
+        )
+        return delay
+
+    def settle(self, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Correct the token budget once the real usage of a call is known.
+        """
+        self.tokens.refund(estimated_tokens - used_tokens)
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """
+        Await `call()` under the limits of the provider, `tokens` is the estimated token cost.
+        """
+        for attempt in range(self.max_attempts):
+            delay, trial = self._admit(tokens)
+            try:
+                await asyncio.sleep(delay)
+                result = await call()
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                if trial:
+                    self.breaker.release()
+            await asyncio.sleep(delay)
+
+    def run_sync(self, call: Callable[[], T], tokens: int = 0) -> T:
+        """
+        Blocking version of `run` for the search clients running in worker threads.
+        """
+        for attempt in range(self.max_attempts):
+            delay, trial = self._admit(tokens)
+            try:
+                time.sleep(delay)
+                result = call()
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                if trial:
+                    self.breaker.release()
+            time.sleep(delay)
+
+
+_settings: dict[str, dict] = {}
+_schedulers: dict[str, Scheduler] = {}
+_lock = threading.Lock()
+
+
+def configure(provider: str, **settings) -> None:
+    """
+    Set the limits of a provider (see `Scheduler`), replacing its scheduler.
+    """
+    with _lock:
+        _settings[provider] = settings
+        _schedulers.pop(provider, None)
+
+
+def get_scheduler(provider: str) -> Scheduler:
+    with _lock:
+        if provider not in _schedulers:
+            _schedulers[provider] = Scheduler(provider, **_settings.get(provider, {}))
+        return _schedulers[provider]
@@ -1,9 +1,67 @@
 # swagger http://localhost:8000/docs
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
 import uvicorn
-from fastapi import FastAPI
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from factuality.api.jobs import JobStore
+from factuality.result_output.json_output import output_json
+from factuality.runner.events import ConclusionReady
 from factuality.runner.factuality import Factuality
-from factuality.utils.options import Options
-app = FastAPI()
+from factuality.search import extraction
+from factuality.utils import logging
+from factuality.utils.defaults import Defaults
+from factuality.utils.metrics import metrics
+from factuality.utils.options import options_from_env
+import structlog
+
+load_dotenv()
+logger = structlog.get_logger(__name__)
+
+FINISHED = ("done", "failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.setup_structlog(os.getenv("LOG_FORMAT", Defaults.LOG_FORMAT.value))
+    logging.change_log_level(os.getenv("LOG_LEVEL", Defaults.LOG_LEVEL.value))
+    options = options_from_env()
+    extraction.configure(
+        options.search_extraction_engine,
+        int(os.getenv("SEARCH_EXTRACTION_WORKERS", Defaults.SEARCH_EXTRACTION_WORKERS.value)),
+    )
+    # one runner per worker, so the LLM gateway, search cache and article store are shared by all jobs
+    app.state.factuality = Factuality(options)
+    app.state.jobs = JobStore(
+        os.path.join(options.cache_dir, "jobs.sqlite") if options.cache_dir else ":memory:"
+    )
+    app.state.job_semaphore = asyncio.Semaphore(
+        int(os.getenv("JOBS_CONCURRENCY", Defaults.JOBS_CONCURRENCY.value))
+    )
+    app.state.tasks = set()
+    failed = await asyncio.to_thread(app.state.jobs.fail_orphaned)
+    if failed > 0:
+        logger.warning(f"Failed jobs left behind by stopped workers", jobs=failed)
+    yield
+    tasks = list(app.state.tasks)
+    for task in tasks:
+        task.cancel()
+    # let the cancelled jobs record their status before the worker exits
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class CheckRequest(BaseModel):
+    statement: str
+    id: str | None = None
+
+
 @app.get("/")
 def test():
     """
@@ -13,9 +71,85 @@ def test():
     return {"GFG Example": "FastAPI"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Stage durations, LLM calls and tokens of this worker in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/check", status_code=202)
+async def check(request: CheckRequest):
+    """
+    Submit a statement for fact-checking, poll `/jobs/{id}` or follow `/jobs/{id}/stream` for the result.
+    """
+    job_id = await asyncio.to_thread(app.state.jobs.create, request.statement, request.id)
+    task = asyncio.create_task(run_job(job_id, request))
+    app.state.tasks.add(task)
+    task.add_done_callback(app.state.tasks.discard)
+    return {"id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(app.state.jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """
+    Server-sent events of the run (claims extracted, search done, source checked, claim
+    finished, conclusion) as they happen, ends with the final job.
+    """
+    jobs: JobStore = app.state.jobs
+    if await asyncio.to_thread(jobs.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        seq = 0
+        while True:
+            # the job may run in another worker, so follow it through the job store
+            job = await asyncio.to_thread(jobs.get, job_id)
+            for seq, event in await asyncio.to_thread(jobs.events, job_id, seq):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if job["status"] in FINISHED:
+                yield f"event: job\ndata: {json.dumps(job)}\n\n"
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def run_job(job_id: str, request: CheckRequest) -> None:
+    jobs: JobStore = app.state.jobs
+    finished = False
+    try:
+        async with app.state.job_semaphore:
+            await asyncio.to_thread(jobs.set_status, job_id, "running")
+            async for event in app.state.factuality.check_stream(request.statement):
+                await asyncio.to_thread(jobs.add_event, job_id, event.model_dump(mode="json", by_alias=True))
+                if isinstance(event, ConclusionReady):
+                    result = output_json(request.id, event.statement, event.claim_checks, event.conclusion)
+                    await asyncio.to_thread(jobs.set_status, job_id, "done", result=result)
+                    finished = True
+    except asyncio.CancelledError:
+        # not an Exception, a job cancelled at shutdown would otherwise stay running forever;
+        # written in place as another await could be cancelled as well
+        if not finished:
+            jobs.set_status(job_id, "failed", error="The worker stopped before the job finished")
+        raise
+    except Exception as e:
+        logger.warning(f"Error running job {job_id}: {e}")
+        await asyncio.to_thread(jobs.set_status, job_id, "failed", error=str(e))
+
+
 def factuality():
 
-    factuality = Factuality()
+    factuality = Factuality(options_from_env())
 
     conclusion, _, _ = factuality.check("Neil armstrong land on the moon.")
 
@@ -23,4 +157,9 @@ def factuality():
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
@@ -0,0 +1,68 @@
+import time
+import pytest
+from factuality.utils.cache import MemoryCache, SqliteCache, TieredCache, cache_key
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite"), "entries", ttl=60, max_entries=2)
+    yield cache
+    cache.close()
+
+
+def test_cache_key_is_stable_and_order_independent_for_dicts():
+    assert cache_key("model", {"a": 1, "b": 2}) == cache_key("model", {"b": 2, "a": 1})
+    assert cache_key("model", "prompt") != cache_key("model", "other prompt")
+
+
+def test_sqlite_cache_round_trip_and_stats(sqlite_cache):
+    assert sqlite_cache.get("key") is None
+    sqlite_cache.set("key", b"value")
+
+    assert sqlite_cache.get("key") == b"value"
+    assert sqlite_cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_sqlite_cache_expires_entries(sqlite_cache):
+    sqlite_cache.set("key", b"value")
+    sqlite_cache._connection.execute("UPDATE entries SET created_at = ?", (time.time() - 120,))
+
+    assert sqlite_cache.get("key") is None
+
+
+def test_sqlite_cache_evicts_least_recently_used(sqlite_cache):
+    sqlite_cache.set("first", b"1")
+    sqlite_cache._connection.execute("UPDATE entries SET accessed_at = accessed_at - 10")
+    sqlite_cache.set("second", b"2")
+    # reading first makes second the least recently used one
+    assert sqlite_cache.get("first") == b"1"
+    sqlite_cache.set("third", b"3")
+
+    assert sqlite_cache.get("second") is None
+    assert sqlite_cache.get("first") == b"1"
+    assert sqlite_cache.get("third") == b"3"
+
+
+def test_memory_cache_evicts_and_expires(monkeypatch):
+    cache = MemoryCache(ttl=60, max_entries=2)
+    cache.set("first", b"1")
+    cache.set("second", b"2")
+    cache.get("first")
+    cache.set("third", b"3")
+
+    assert cache.get("second") is None
+    assert cache.get("first") == b"1"
+
+    cache.set("old", b"4", created_at=time.time() - 120)
+    assert cache.get("old") is None
+
+
+def test_tiered_cache_promotes_with_the_stored_timestamp(sqlite_cache):
+    sqlite_cache.set("key", b"value")
+    stored_at = time.time() - 30
+    sqlite_cache._connection.execute("UPDATE entries SET created_at = ?", (stored_at,))
+    cache = TieredCache(MemoryCache(ttl=60, max_entries=10), sqlite_cache)
+
+    assert cache.get("key") == b"value"
+    assert cache.memory._entries["key"][0] == pytest.approx(stored_at)
+    assert cache.stats()["hits"] == 1
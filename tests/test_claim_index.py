@@ -0,0 +1,81 @@
+import time
+import pytest
+from factuality.claim_index.claim_index import ClaimIndex, claim_qualifiers, jaccard, normalize_claim
+from factuality.claim_splitter.claim_splitter import Claim
+from factuality.fact_check.fact_check import ClaimChecked, ResultType
+
+CLAIM = "Neil Armstrong was the first person to walk on the Moon in 1969"
+
+
+def claim(text: str) -> Claim:
+    return Claim(claim=text, reference=None, verification_query=text)
+
+
+def checks(text: str, source: str | None = "https://example.com/moon") -> list[ClaimChecked]:
+    return [
+        ClaimChecked(
+            claim=text,
+            reference=None,
+            verification_query=text,
+            result=ResultType.VERIFIED,
+            source_reference=source,
+            source_quote="He stepped onto the Moon on July 20, 1969." if source else None,
+        )
+    ]
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "claims.sqlite")
+
+
+def test_normalize_claim():
+    assert normalize_claim("  Neil  Armstrong walked on the MOON. ") == "neil armstrong walked on the moon"
+
+
+def test_jaccard():
+    assert jaccard({"a", "b"}, {"b", "c"}) == pytest.approx(1 / 3)
+    assert jaccard(set(), set()) == 1.0
+
+
+def test_qualifiers_tell_apart_what_terms_cannot():
+    assert claim_qualifiers("He won in 1969") != claim_qualifiers("She won in 1969")
+    assert claim_qualifiers("It was built before the war") != claim_qualifiers("It was built after the war")
+    assert claim_qualifiers("The largest city") != claim_qualifiers("The smallest city")
+    assert claim_qualifiers("Paris is the capital") != claim_qualifiers("Rome is the capital")
+    assert claim_qualifiers("He didn't win") != claim_qualifiers("He did win")
+    assert claim_qualifiers("He won in 1969") == claim_qualifiers("In 1969 he won")
+
+
+def test_exact_claims_are_reused_by_default(index_path):
+    index = ClaimIndex(index_path, ttl=60, similarity=1.0)
+    index.add(claim(CLAIM), checks(CLAIM))
+
+    reused = index.lookup(claim(CLAIM.lower() + "."))
+
+    assert reused is not None
+    assert reused[0].claim == CLAIM.lower() + "."
+    assert reused[0].result == ResultType.VERIFIED.value
+    assert index.lookup(claim("Neil Armstrong was the first man to walk on the Moon in 1969")) is None
+
+
+def test_near_duplicates_need_the_same_qualifiers(index_path):
+    index = ClaimIndex(index_path, ttl=60, similarity=0.7)
+    index.add(claim(CLAIM), checks(CLAIM))
+
+    assert index.lookup(claim("Neil Armstrong was the first man to walk on the Moon in 1969")) is not None
+    assert index.lookup(claim("Buzz Aldrin was the first person to walk on the Moon in 1969")) is None
+    assert index.lookup(claim("Neil Armstrong was the last person to walk on the Moon in 1969")) is None
+    assert index.lookup(claim("Neil Armstrong was the first person to walk on the Moon in 1996")) is None
+
+
+def test_stale_and_unchecked_claims_are_not_reused(index_path):
+    index = ClaimIndex(index_path, ttl=60, similarity=1.0)
+    index.add(claim(CLAIM), checks(CLAIM))
+    index._connection.execute("UPDATE claims SET checked_at = ?", (time.time() - 120,))
+    assert index.lookup(claim(CLAIM)) is None
+
+    other = "The Eiffel Tower is 330 metres tall"
+    index.add(claim(other), checks(other, source=None))
+    assert index.lookup(claim(other)) is None
+    assert index.stats()["missed"] == 2
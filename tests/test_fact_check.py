@@ -0,0 +1,106 @@
+import re
+import pytest
+from factuality.fact_check import fact_check
+from factuality.fact_check.fact_check import (
+    BatchResult,
+    IndexedResult,
+    Result,
+    ResultType,
+    batch_chunks,
+    batch_verdict,
+    split_by_tokens,
+)
+
+
+class WordEncoding:
+    """
+    Stand-in for a tiktoken encoding, every word with its trailing whitespace is a token.
+    """
+
+    def encode(self, text: str) -> list[str]:
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def decode_with_offsets(self, tokens: list[str]) -> tuple[str, list[int]]:
+        offsets = []
+        position = 0
+        for token in tokens:
+            offsets.append(position)
+            position += len(token)
+        return "".join(tokens), offsets
+
+
+@pytest.fixture
+def word_encoding(monkeypatch):
+    monkeypatch.setattr(fact_check, "get_encoding", lambda model: WordEncoding())
+
+
+def token_count(text: str) -> int:
+    return len(WordEncoding().encode(text))
+
+
+TEXT = "One two three. Four five six. Seven eight nine. Ten eleven twelve."
+
+
+def test_split_by_tokens_cuts_between_sentences(word_encoding):
+    chunks = list(split_by_tokens(TEXT, 6, 0, "gpt-4o"))
+
+    assert chunks == ["One two three. Four five six. ", "Seven eight nine. Ten eleven twelve."]
+    assert "".join(chunks) == TEXT
+
+
+def test_split_by_tokens_overlaps_whole_sentences(word_encoding):
+    chunks = list(split_by_tokens(TEXT, 6, 3, "gpt-4o"))
+
+    assert chunks == [
+        "One two three. Four five six. ",
+        "Four five six. Seven eight nine. ",
+        "Seven eight nine. Ten eleven twelve.",
+    ]
+    assert all(token_count(chunk) <= 6 for chunk in chunks)
+
+
+def test_split_by_tokens_cuts_long_sentences_at_tokens(word_encoding):
+    text = "a b c d e f g h i j"
+
+    chunks = list(split_by_tokens(text, 4, 0, "gpt-4o"))
+
+    assert chunks == ["a b c d ", "e f g h ", "i j"]
+
+
+def test_split_by_tokens_without_encoding_counts_characters(monkeypatch):
+    monkeypatch.setattr(fact_check, "get_encoding", lambda model: None)
+
+    chunks = list(split_by_tokens("x" * 20, 2, 0, "gpt-4o"))
+
+    assert chunks == ["x" * 8, "x" * 8, "x" * 4]
+
+
+def test_batch_chunks_respects_the_budget(word_encoding):
+    chunks = ["a b", "c d", "e f g h i", "j"]
+
+    assert list(batch_chunks(chunks, 4, "gpt-4o")) == [["a b", "c d"], ["e f g h i"], ["j"]]
+    assert list(batch_chunks(chunks, 0, "gpt-4o")) == [[chunk] for chunk in chunks]
+
+
+def indexed(index: int, result: str, quote: str | None = None) -> IndexedResult:
+    return IndexedResult(index=index, result=result, source_quote=quote)
+
+
+def test_batch_verdict_takes_the_first_agreeing_quote():
+    payload = BatchResult(
+        results=[indexed(2, "verified", "later"), indexed(0, "inconclusive"), indexed(1, "verified", "first")]
+    )
+
+    assert batch_verdict(payload) == Result(result=ResultType.VERIFIED, source_quote="first")
+
+
+def test_batch_verdict_conflict_is_inconclusive():
+    payload = BatchResult(results=[indexed(0, "verified", "yes"), indexed(1, "rejected", "no")])
+
+    assert batch_verdict(payload) == Result(result=ResultType.INCONCLUSIVE)
+
+
+def test_batch_verdict_of_a_single_chunk_is_its_result():
+    result = Result(result=ResultType.REJECTED, source_quote="no")
+
+    assert batch_verdict(result) is result
@@ -0,0 +1,27 @@
+from factuality.fact_check.ranking import bm25_scores, rank_chunks, tokenize
+
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("The Moon was landed on in 1969") == ["moon", "landed", "1969"]
+
+
+def test_bm25_scores_relevant_documents_higher():
+    scores = bm25_scores(
+        "moon landing 1969",
+        ["The moon landing happened in 1969.", "Cookies and privacy settings.", "The moon is bright."],
+    )
+
+    assert scores[0] > scores[2] > scores[1] == 0
+
+
+def test_rank_chunks_orders_by_relevance_and_drops_unrelated():
+    chunks = ["Subscribe to our newsletter.", "Armstrong walked on the moon.", "The moon landing was in 1969."]
+
+    assert rank_chunks("moon landing 1969", chunks, 0) == [chunks[2], chunks[1]]
+    assert rank_chunks("moon landing 1969", chunks, 1) == [chunks[2]]
+
+
+def test_rank_chunks_keeps_the_first_chunk_without_matches():
+    chunks = ["Nothing related.", "Still nothing."]
+
+    assert rank_chunks("moon landing", chunks, 0) == ["Nothing related."]
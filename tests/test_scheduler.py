@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from factuality.utils.scheduler import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Scheduler,
+    TokenBucket,
+    is_exhausted,
+    is_retryable,
+    is_transient,
+    retry_after,
+)
+
+
+class Response:
+    def __init__(self, status_code: int, headers: dict | None = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class APIError(Exception):
+    def __init__(self, status_code: int, headers: dict | None = None, code: str | None = None):
+        super().__init__(f"status {status_code}")
+        self.response = Response(status_code, headers)
+        self.code = code
+
+
+def test_retryable_statuses_and_errors():
+    assert is_retryable(APIError(503))
+    assert is_retryable(APIError(429))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(APIError(401))
+    assert not is_retryable(ValueError())
+
+
+def test_exhausted_quota():
+    assert is_exhausted(APIError(432))
+    assert is_exhausted(APIError(429, code="insufficient_quota"))
+    assert not is_exhausted(APIError(429))
+
+
+def test_transient_follows_the_cause():
+    try:
+        try:
+            raise APIError(502)
+        except APIError as e:
+            raise RuntimeError("No search engine answered") from e
+    except RuntimeError as e:
+        error = e
+
+    assert is_transient(error)
+    assert is_transient(CircuitOpenError())
+    assert not is_transient(RuntimeError("No search engine answered"))
+    assert not is_transient(APIError(401))
+
+
+def test_retry_after_headers():
+    assert retry_after(APIError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(APIError(429, {"retry-after": "2"})) == 2.0
+    assert retry_after(APIError(429)) is None
+
+
+def test_token_bucket_makes_overdrafts_wait():
+    bucket = TokenBucket(60)
+
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(30) == pytest.approx(30, abs=0.1)
+    assert TokenBucket(0).reserve(1000) == 0.0
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0)
+
+    assert not breaker.failure()
+    assert breaker.failure()
+    # reset_timeout has passed, the first call is the trial and the others wait for it
+    assert breaker.enter() is True
+    assert breaker.enter() is None
+    breaker.success()
+    assert breaker.enter() is False
+
+
+def test_scheduler_retries_transient_errors():
+    scheduler = Scheduler("test", max_attempts=3, base_delay=0)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise APIError(503)
+        return "answer"
+
+    assert asyncio.run(scheduler.run(call)) == "answer"
+    assert len(attempts) == 3
+
+
+def test_scheduler_raises_other_errors_right_away():
+    scheduler = Scheduler("test", max_attempts=3, base_delay=0)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise APIError(401)
+
+    with pytest.raises(APIError):
+        asyncio.run(scheduler.run(call))
+    assert len(attempts) == 1
+
+
+def test_scheduler_refuses_calls_while_the_circuit_is_open():
+    scheduler = Scheduler("test", max_attempts=1, base_delay=0, breaker_threshold=1, breaker_reset=60)
+
+    async def call():
+        raise APIError(500)
+
+    with pytest.raises(APIError):
+        asyncio.run(scheduler.run(call))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.run(call))
@@ -0,0 +1,93 @@
+import asyncio
+import io
+import json
+from factuality.fact_check.fact_check import ClaimChecked, ResultType
+from factuality.final_conclusion.final_conclusion import Conclusion
+from factuality.runner.statements import (
+    MalformedRow,
+    check_statements,
+    completed_ids,
+    jsonl_writer,
+    read_statements,
+)
+
+
+def test_read_statements_jsonl(tmp_path):
+    path = tmp_path / "statements.jsonl"
+    path.write_text(
+        '{"id": "a", "statement": "The earth is round."}\n'
+        "\n"
+        '{"statement": "Without id."}\n'
+        '{"id": "c", "statement": " "}\n'
+        "[1, 2]\n"
+        "{broken\n"
+    )
+
+    rows = list(read_statements(str(path)))
+
+    assert rows[:2] == [("a", "The earth is round."), ("3", "Without id.")]
+    assert [row[0] for row in rows[2:]] == ["5", "6"]
+    assert all(isinstance(row[1], MalformedRow) for row in rows[2:])
+
+
+def test_read_statements_csv(tmp_path):
+    path = tmp_path / "statements.csv"
+    path.write_text('id,statement\n1,"Water boils at 100 degrees, at sea level."\n,No id\n')
+
+    assert list(read_statements(str(path))) == [
+        ("1", "Water boils at 100 degrees, at sea level."),
+        ("2", "No id"),
+    ]
+
+
+def test_completed_ids_skips_failures_and_partial_lines(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text(
+        '{"id": "1", "factuality": {}}\n'
+        '{"id": "2", "error": "failed"}\n'
+        '{"id": 3, "factuality": {}}\n'
+        '{"id": "4", "factu'
+    )
+
+    assert completed_ids(str(path)) == {"1", "3"}
+    assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+class FakeFactuality:
+    def __init__(self):
+        self.checked = []
+
+    async def check_statement(self, statement: str):
+        self.checked.append(statement)
+        if statement == "fails":
+            raise RuntimeError("boom")
+        checked_claim = ClaimChecked(
+            claim=statement,
+            reference=None,
+            verification_query=statement,
+            result=ResultType.VERIFIED,
+            source_reference="https://example.com",
+            source_quote="quote",
+        )
+        return Conclusion(score=100, description="verified"), [checked_claim], statement
+
+
+def test_check_statements_writes_results_and_errors():
+    factuality = FakeFactuality()
+    output = io.StringIO()
+    statements = [
+        ("1", "The earth is round."),
+        ("2", "fails"),
+        ("3", MalformedRow("Line 3 is not a JSON object")),
+        ("4", "Already done."),
+    ]
+
+    done, failed = asyncio.run(check_statements(factuality, statements, 2, jsonl_writer(output), {"4"}))
+
+    results = {row["id"]: row for row in map(json.loads, output.getvalue().splitlines())}
+    assert (done, failed) == (1, 2)
+    assert sorted(factuality.checked) == ["The earth is round.", "fails"]
+    assert results["1"]["factuality"]["conclusion"]["score"] == 100
+    assert results["2"] == {"id": "2", "error": "boom"}
+    assert results["3"] == {"id": "3", "error": "Line 3 is not a JSON object"}
+    assert "4" not in results